@@ -0,0 +1,145 @@
+import tracemalloc
+
+from fastapi import APIRouter
+
+from availability.services import availability_events
+from base.admission import admission_limits
+from base.memory import memory_stats, top_allocations
+from base.retry import db_retry
+from base.startup import startup_report
+from base.single_flight import single_flights
+from recommendations.engine import co_rentals
+from search.index import movie_search
+
+router = APIRouter()
+
+
+@router.get("/admin/memory", tags=["admin"])
+async def get_memory_stats(top: int = 0):
+    """
+    Retrieve the allocation statistics recorded for every route.
+    Statistics are only recorded when the API runs with
+    MEMORY_TRACKING_ENABLED=1.
+    Args:
+        top (int): When positive, also return the source lines currently holding
+                   the most memory, from a tracemalloc snapshot.
+    Returns:
+        dict: Whether tracking is enabled, the peak and retained allocations of
+              every route in KiB, and the top allocation sites if requested.
+              Example: {"enabled": true, "routes": {"GET /movies": {...}}}
+    """
+
+    enabled = tracemalloc.is_tracing()
+    response = {"enabled": enabled, "routes": memory_stats.as_dict()}
+    if enabled and top > 0:
+        response["top_allocations"] = top_allocations(top)
+    return response
+
+
+@router.delete("/admin/memory", tags=["admin"])
+async def reset_memory_stats():
+    """
+    Discard the allocation statistics recorded so far.
+    Returns:
+        dict: A dictionary confirming the reset.
+              Example: {"ok": true}
+    """
+
+    memory_stats.reset()
+    return {"ok": True}
+
+
+@router.get("/admin/single_flight", tags=["admin"])
+async def get_single_flight_metrics():
+    """
+    Retrieve the metrics of every single-flight group.
+    `shared` counts the calls that joined an execution already in flight
+    instead of querying the database.
+    Returns:
+        dict: The metrics of every group, keyed by group name.
+              Example: {"movies": {"calls": 10, "executions": 2, "shared": 8, ...}}
+    """
+
+    return {name: group.metrics.as_dict() for name, group in single_flights.items()}
+
+
+@router.get("/admin/recommendations", tags=["admin"])
+async def get_recommendations_stats():
+    """
+    Retrieve the size of the "clients who rented this also rented" index.
+    Returns:
+        dict: Whether the index was built, the number of builds, the indexed
+              movies, clients and co-rented pairs, the pairs recorded since the
+              last build and the memory held by the arrays.
+    """
+
+    return co_rentals.stats()
+
+
+@router.get("/admin/search", tags=["admin"])
+async def get_search_stats():
+    """
+    Retrieve the size of the trigram index behind GET /movies/suggest.
+    Returns:
+        dict: Whether the index was built, the number of builds, the indexed
+              movies, trigrams and live documents, the documents appended since
+              the last pack and the memory held by the arrays.
+    """
+
+    return movie_search.stats()
+
+
+@router.get("/admin/admission", tags=["admin"])
+async def get_admission_stats():
+    """
+    Retrieve the load and the queueing metrics of the admission limits.
+    Limits are only enforced when the API runs with ADMISSION_CONTROL_ENABLED=1
+    (the default).
+    Returns:
+        dict: For every `<router>.<read|write>` limit, its configuration, the
+              running and waiting requests, the admitted, queued, rejected and
+              timed out requests and the average and longest queue times.
+    """
+
+    return {name: limit.as_dict() for name, limit in sorted(admission_limits.items())}
+
+
+@router.get("/admin/retries", tags=["admin"])
+async def get_retry_stats():
+    """
+    Retrieve how often writes hit a locked database and the request deadlines.
+    Returns:
+        dict: The writes run again after a lock error, those that succeeded after
+              retrying, those that failed after the last attempt and those
+              stopped by the deadline of their request.
+    """
+
+    return db_retry.metrics.as_dict()
+
+
+@router.get("/admin/startup", tags=["admin"])
+async def get_startup_report():
+    """
+    Retrieve the timing breakdown of the boot of this worker.
+    Returns:
+        dict: Whether the warm-up is done (and its error if it failed), the
+              milliseconds spent in every phase (imports, schema, warm-up steps)
+              and the total from the first import to ready.
+    """
+
+    return startup_report.as_dict()
+
+
+@router.get("/admin/availability", tags=["admin"])
+async def get_availability_stats():
+    """
+    Retrieve the subscribers and the delivery metrics of the availability stream.
+    Returns:
+        dict: The connected subscribers and the published, delivered and dropped
+              events.
+    """
+
+    return {
+        "subscribers": availability_events.subscribers,
+        **availability_events.metrics.as_dict(),
+    }
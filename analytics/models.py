@@ -0,0 +1,70 @@
+from datetime import date
+from typing import Optional
+
+from sqlmodel import Field, SQLModel
+
+
+class DailyMovieRentals(SQLModel, table=True):
+    """
+    Rented copies of a movie per day. Rentals are counted on the day the rent
+    was created; returns and the rent duration of the returned copies on the
+    day the rent was closed.
+    """
+
+    day: date = Field(primary_key=True)
+    movie_id: int = Field(primary_key=True)
+    rentals: int = Field(default=0)
+    returns: int = Field(default=0)
+    rent_seconds: int = Field(default=0)
+
+
+class DailyGenreRentals(SQLModel, table=True):
+    """
+    Rented copies of the movies of a genre per day, counted like
+    DailyMovieRentals.
+    """
+
+    day: date = Field(primary_key=True)
+    genre_id: int = Field(primary_key=True)
+    rentals: int = Field(default=0)
+    returns: int = Field(default=0)
+
+
+class MovieRentalTotals(SQLModel, table=True):
+    """
+    All-time rented copies of a movie, the sum of its DailyMovieRentals.
+    """
+
+    movie_id: int = Field(primary_key=True)
+    rentals: int = Field(default=0, index=True)
+    returns: int = Field(default=0)
+    rent_seconds: int = Field(default=0)
+
+
+class TopMovie(SQLModel):
+    movie_id: int
+    title: Optional[str]
+    rentals: int
+
+
+class GenreDayRentals(SQLModel):
+    day: date
+    genre_id: int
+    rentals: int
+    returns: int
+
+
+class RentDuration(SQLModel):
+    movie_id: Optional[int]
+    returns: int
+    average_seconds: Optional[float]
+    average_days: Optional[float]
+
+
+class MovieUtilization(SQLModel):
+    movie_id: int
+    title: str
+    total_copies: int
+    rented_copies: int
+    utilization: float
+    rentals_per_copy: float
@@ -0,0 +1,143 @@
+from datetime import date
+from typing import Optional
+
+from sqlalchemy import Float, cast, func
+from sqlmodel import Session, col, select
+
+from analytics.models import (
+    DailyGenreRentals,
+    DailyMovieRentals,
+    GenreDayRentals,
+    MovieRentalTotals,
+    MovieUtilization,
+    RentDuration,
+    TopMovie,
+)
+from movies.models import Movie
+
+
+class AnalyticsRepository:
+    """
+    Read-only queries over the rental summary tables, which are kept up to date
+    by analytics.services, so no query scans the rents.
+    Methods:
+        top_movies(limit, start, end) -> list[TopMovie]:
+            The most rented movies, all-time or between two days.
+        genre_daily_rentals(start, end, genre_id) -> list[GenreDayRentals]:
+            The rented copies per genre and day.
+        rent_duration(movie_id) -> RentDuration:
+            The average duration of the returned copies.
+        utilization(limit) -> list[MovieUtilization]:
+            The movies with the largest share of their copies rented right now.
+    """
+
+    def __init__(self, session: Session):
+        self.session = session
+
+    def top_movies(
+        self, limit: int, start: Optional[date] = None, end: Optional[date] = None
+    ) -> list[TopMovie]:
+        if start is None and end is None:
+            rentals = col(MovieRentalTotals.rentals)
+            statement = (
+                select(MovieRentalTotals.movie_id, Movie.title, rentals)
+                .outerjoin(Movie, col(Movie.id) == MovieRentalTotals.movie_id)
+                .where(rentals > 0)
+                .order_by(rentals.desc())
+                .limit(limit)
+            )
+        else:
+            day_rentals = func.sum(DailyMovieRentals.rentals)
+            statement = (
+                select(DailyMovieRentals.movie_id, Movie.title, day_rentals)
+                .outerjoin(Movie, col(Movie.id) == DailyMovieRentals.movie_id)
+                .where(*_day_range(DailyMovieRentals, start, end))
+                .group_by(col(DailyMovieRentals.movie_id))
+                .having(day_rentals > 0)
+                .order_by(day_rentals.desc())
+                .limit(limit)
+            )
+        return [
+            TopMovie(movie_id=movie_id, title=title, rentals=total)
+            for movie_id, title, total in self.session.exec(statement)
+        ]
+
+    def genre_daily_rentals(
+        self,
+        start: Optional[date] = None,
+        end: Optional[date] = None,
+        genre_id: Optional[int] = None,
+    ) -> list[GenreDayRentals]:
+        statement = select(DailyGenreRentals).where(
+            *_day_range(DailyGenreRentals, start, end)
+        )
+        if genre_id is not None:
+            statement = statement.where(DailyGenreRentals.genre_id == genre_id)
+        statement = statement.order_by(
+            col(DailyGenreRentals.day), col(DailyGenreRentals.genre_id)
+        )
+        return [
+            GenreDayRentals.model_validate(row) for row in self.session.exec(statement)
+        ]
+
+    def rent_duration(self, movie_id: Optional[int] = None) -> RentDuration:
+        statement = select(
+            func.coalesce(func.sum(MovieRentalTotals.returns), 0),
+            func.coalesce(func.sum(MovieRentalTotals.rent_seconds), 0),
+        )
+        if movie_id is not None:
+            statement = statement.where(MovieRentalTotals.movie_id == movie_id)
+        returns, rent_seconds = self.session.exec(statement).one()
+        average = rent_seconds / returns if returns else None
+        return RentDuration(
+            movie_id=movie_id,
+            returns=returns,
+            average_seconds=round(average, 2) if average is not None else None,
+            average_days=round(average / 86400, 4) if average is not None else None,
+        )
+
+    def utilization(self, limit: int) -> list[MovieUtilization]:
+        rented = col(Movie.total_copies) - col(Movie.available_copies)
+        utilization = cast(rented, Float) / col(Movie.total_copies)
+        rentals = func.coalesce(MovieRentalTotals.rentals, 0)
+        statement = (
+            select(  # type: ignore[call-overload]
+                Movie.id,
+                Movie.title,
+                Movie.total_copies,
+                rented,
+                utilization,
+                cast(rentals, Float) / col(Movie.total_copies),
+            )
+            .outerjoin(MovieRentalTotals, col(MovieRentalTotals.movie_id) == Movie.id)
+            .where(col(Movie.total_copies) > 0)
+            .order_by(utilization.desc(), rentals.desc())
+            .limit(limit)
+        )
+        return [
+            MovieUtilization(
+                movie_id=movie_id,
+                title=title,
+                total_copies=total_copies,
+                rented_copies=rented_copies,
+                utilization=round(share, 4),
+                rentals_per_copy=round(rentals_per_copy, 4),
+            )
+            for (
+                movie_id,
+                title,
+                total_copies,
+                rented_copies,
+                share,
+                rentals_per_copy,
+            ) in self.session.exec(statement)
+        ]
+
+
+def _day_range(model, start: Optional[date], end: Optional[date]) -> list:
+    conditions = []
+    if start is not None:
+        conditions.append(col(model.day) >= start)
+    if end is not None:
+        conditions.append(col(model.day) <= end)
+    return conditions
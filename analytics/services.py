@@ -0,0 +1,268 @@
+from collections import Counter
+
+from sqlalchemy import Integer, cast, delete, func, insert, union_all
+from sqlalchemy.dialects.sqlite import insert as sqlite_insert
+from sqlmodel import Session, col, select
+
+from analytics.models import DailyGenreRentals, DailyMovieRentals, MovieRentalTotals
+from movie_rents.models import (
+    MovieRent,
+    MovieRentArchive,
+    MovieRentDetail,
+    MovieRentDetailArchive,
+)
+from movies.models import Movie, MovieCopy
+
+SUMMARY_TABLES = (DailyMovieRentals, DailyGenreRentals, MovieRentalTotals)
+
+
+def _upsert(session: Session, model, keys: tuple[str, ...], rows: list[dict]):
+    """
+    Add the counters of every row to the summary row with the same keys,
+    creating it if needed.
+    """
+
+    if not rows:
+        return
+    table = model.__table__
+    statement = sqlite_insert(table)
+    counters = [column for column in rows[0] if column not in keys]
+    statement = statement.on_conflict_do_update(
+        index_elements=list(keys),
+        set_={
+            column: table.c[column] + statement.excluded[column] for column in counters
+        },
+    )
+    session.exec(statement, params=rows)  # type: ignore
+
+
+def record_rent(session: Session, movie_rent_id: int, sign: int = 1) -> None:
+    """
+    Add (sign=1) or remove (sign=-1) the contribution of a rent, as currently
+    stored, to the summary tables, within the current transaction.
+    Repositories remove the contribution of a rent before changing it and add it
+    back afterwards, so the summaries follow creations, updates, closings and
+    deletions without scanning the rents.
+    Args:
+        session (Session): The session whose transaction is updated.
+        movie_rent_id (int): The rent to count.
+        sign (int): 1 to add the rent, -1 to remove it.
+    """
+
+    statement = (
+        select(  # type: ignore[call-overload]
+            MovieRent.creation_datetime,
+            MovieRent.closed_datetime,
+            MovieRent.is_closed,
+            MovieCopy.movie_id,
+            Movie.genre_id,
+        )
+        .select_from(MovieRentDetail)
+        .join(MovieRent, col(MovieRentDetail.movie_rent_id) == MovieRent.id)
+        .join(MovieCopy, col(MovieRentDetail.movie_copy_id) == MovieCopy.id)
+        .join(Movie, col(MovieCopy.movie_id) == Movie.id)
+        .where(MovieRentDetail.movie_rent_id == movie_rent_id)
+    )
+
+    movie_days: Counter = Counter()
+    genre_days: Counter = Counter()
+    movies: Counter = Counter()
+    for created, closed, is_closed, movie_id, genre_id in session.exec(statement):
+        movie_days[(created.date(), movie_id, "rentals")] += sign
+        genre_days[(created.date(), genre_id, "rentals")] += sign
+        movies[(movie_id, "rentals")] += sign
+        if is_closed and closed is not None:
+            seconds = round((closed - created).total_seconds())
+            movie_days[(closed.date(), movie_id, "returns")] += sign
+            movie_days[(closed.date(), movie_id, "rent_seconds")] += sign * seconds
+            genre_days[(closed.date(), genre_id, "returns")] += sign
+            movies[(movie_id, "returns")] += sign
+            movies[(movie_id, "rent_seconds")] += sign * seconds
+
+    def rows(counter: Counter, key_size: int, columns: tuple[str, ...]):
+        grouped: dict[tuple, dict] = {}
+        for key, value in counter.items():
+            row = grouped.setdefault(key[:key_size], dict.fromkeys(columns, 0))
+            row[key[key_size]] += value
+        return [(*keys, row) for keys, row in grouped.items()]
+
+    movie_columns = ("rentals", "returns", "rent_seconds")
+    _upsert(
+        session,
+        DailyMovieRentals,
+        ("day", "movie_id"),
+        [
+            {"day": day, "movie_id": movie_id, **row}
+            for day, movie_id, row in rows(movie_days, 2, movie_columns)
+        ],
+    )
+    _upsert(
+        session,
+        DailyGenreRentals,
+        ("day", "genre_id"),
+        [
+            {"day": day, "genre_id": genre_id, **row}
+            for day, genre_id, row in rows(genre_days, 2, ("rentals", "returns"))
+        ],
+    )
+    _upsert(
+        session,
+        MovieRentalTotals,
+        ("movie_id",),
+        [
+            {"movie_id": movie_id, **row}
+            for movie_id, row in rows(movies, 1, movie_columns)
+        ],
+    )
+
+
+def move_genre_rentals(
+    session: Session, movie_id: int, old_genre_id: int, new_genre_id: int
+) -> None:
+    """
+    Move the rentals and returns of a movie from its old genre to its new one
+    in DailyGenreRentals, within the current transaction, when the genre of
+    the movie changes. Rents are counted in the current genre of their movie,
+    like `rebuild_summaries` does, so closing or deleting an older rent later
+    removes it from the right genre.
+    Args:
+        session (Session): The session whose transaction is updated.
+        movie_id (int): The movie whose genre changed.
+        old_genre_id (int): The genre the rentals are counted in.
+        new_genre_id (int): The genre they move to.
+    """
+
+    days = session.exec(
+        select(
+            col(DailyMovieRentals.day),
+            col(DailyMovieRentals.rentals),
+            col(DailyMovieRentals.returns),
+        ).where(col(DailyMovieRentals.movie_id) == movie_id)
+    ).all()
+    rows = []
+    for day, rentals, returns in days:
+        for genre_id, sign in ((old_genre_id, -1), (new_genre_id, 1)):
+            rows.append(
+                {
+                    "day": day,
+                    "genre_id": genre_id,
+                    "rentals": sign * rentals,
+                    "returns": sign * returns,
+                }
+            )
+    _upsert(session, DailyGenreRentals, ("day", "genre_id"), rows)
+    # a rebuild has no rows for the days the genre no longer rented anything
+    session.exec(
+        delete(DailyGenreRentals).where(
+            col(DailyGenreRentals.genre_id) == old_genre_id,
+            col(DailyGenreRentals.rentals) == 0,
+            col(DailyGenreRentals.returns) == 0,
+        )
+    )  # type: ignore
+
+
+def rebuild_summaries(session: Session) -> None:
+    """
+    Recompute every summary table from the rents, archived ones included, with
+    a few aggregate queries, within the current transaction of the session.
+    Args:
+        session (Session): The session whose transaction is updated.
+    """
+
+    for model in SUMMARY_TABLES:
+        session.exec(delete(model))  # type: ignore
+
+    # archived rents are part of the history too
+    copies = union_all(
+        *(
+            select(  # type: ignore[call-overload]
+                MovieCopy.movie_id,
+                Movie.genre_id,
+                rent_model.creation_datetime,
+                rent_model.closed_datetime,
+                rent_model.is_closed,
+            )
+            .select_from(detail_model)
+            .join(rent_model, col(detail_model.movie_rent_id) == rent_model.id)
+            .join(MovieCopy, col(detail_model.movie_copy_id) == MovieCopy.id)
+            .join(Movie, col(MovieCopy.movie_id) == Movie.id)
+            for rent_model, detail_model in (
+                (MovieRent, MovieRentDetail),
+                (MovieRentArchive, MovieRentDetailArchive),
+            )
+        )
+    ).subquery()
+    rented = copies
+    returned = (
+        copies.select()
+        .where(copies.c.is_closed.is_(True), copies.c.closed_datetime.is_not(None))
+        .subquery()
+    )
+    created_day = func.date(rented.c.creation_datetime)
+    closed_day = func.date(returned.c.closed_datetime)
+    rent_seconds = func.sum(
+        cast(
+            func.round(
+                (
+                    func.julianday(returned.c.closed_datetime)
+                    - func.julianday(returned.c.creation_datetime)
+                )
+                * 86400
+            ),
+            Integer,
+        )
+    )
+
+    # rentals are counted on the creation day and returns on the closing day,
+    # so returns are merged into the rows of the rentals
+    for model, key, rentals, returns in (
+        (
+            DailyMovieRentals,
+            "movie_id",
+            select(created_day, rented.c.movie_id, func.count()).group_by(
+                created_day, rented.c.movie_id
+            ),
+            select(
+                closed_day, returned.c.movie_id, func.count(), rent_seconds
+            ).group_by(closed_day, returned.c.movie_id),
+        ),
+        (
+            DailyGenreRentals,
+            "genre_id",
+            select(created_day, rented.c.genre_id, func.count()).group_by(
+                created_day, rented.c.genre_id
+            ),
+            select(closed_day, returned.c.genre_id, func.count()).group_by(
+                closed_day, returned.c.genre_id
+            ),
+        ),
+    ):
+        table = model.__table__  # type: ignore
+        session.exec(
+            insert(table).from_select(["day", key, "rentals"], rentals)  # type: ignore
+        )
+        return_columns = ["returns", "rent_seconds"][
+            : len(returns.selected_columns) - 2
+        ]
+        statement = sqlite_insert(table).from_select(
+            ["day", key, *return_columns], returns
+        )
+        session.exec(
+            statement.on_conflict_do_update(  # type: ignore
+                index_elements=["day", key],
+                set_={column: statement.excluded[column] for column in return_columns},
+            )
+        )
+
+    daily = DailyMovieRentals
+    session.exec(
+        insert(MovieRentalTotals).from_select(  # type: ignore
+            ["movie_id", "rentals", "returns", "rent_seconds"],
+            select(
+                daily.movie_id,
+                func.sum(daily.rentals),
+                func.sum(daily.returns),
+                func.sum(daily.rent_seconds),
+            ).group_by(col(daily.movie_id)),
+        )
+    )
@@ -0,0 +1,128 @@
+from fastapi.testclient import TestClient
+from sqlmodel import Session, select
+
+from analytics.models import DailyGenreRentals, DailyMovieRentals, MovieRentalTotals
+from analytics.services import rebuild_summaries
+
+
+def _summaries(session: Session) -> dict:
+    return {
+        model.__name__: sorted(
+            tuple(row.model_dump().items()) for row in session.exec(select(model))
+        )
+        for model in (DailyMovieRentals, DailyGenreRentals, MovieRentalTotals)
+    }
+
+
+def test_analytics_summaries_match_rebuild(client: TestClient, session: Session):
+    """
+    Test that the summaries kept up to date by the rent operations match the
+    summaries rebuilt from the rents.
+    Steps:
+    1. Create a rent, update its copies and close it; create and delete another.
+    2. Compare the summary tables with the ones rebuilt from scratch.
+    3. Check the top movies and rent duration endpoints reflect the new rent.
+    Args:
+        client (TestClient): The test client used to simulate API requests.
+        session (Session): The database session shared with the client.
+    """
+
+    top_before = client.get("/analytics/top_movies", params={"limit": 1000}).json()
+
+    response = client.post(
+        "/movie_rents",
+        json={"client_id": 1, "details": [{"movie_copy_id": 2}, {"movie_copy_id": 11}]},
+    )
+    rent_id = response.json()["id"]
+    response = client.put(
+        f"/movie_rents/{rent_id}",
+        json={
+            "client_id": 1,
+            "details": [{"movie_copy_id": 2}, {"movie_copy_id": 12}],
+        },
+    )
+    assert response.status_code == 200
+    assert client.put(f"/movie_rents/{rent_id}/close").status_code == 200
+
+    response = client.post(
+        "/movie_rents", json={"client_id": 2, "details": [{"movie_copy_id": 3}]}
+    )
+    assert client.delete(f"/movie_rents/{response.json()['id']}").status_code == 200
+
+    incremental = _summaries(session)
+    rebuild_summaries(session)
+    session.commit()
+    assert _summaries(session) == incremental
+
+    top_after = client.get("/analytics/top_movies", params={"limit": 1000}).json()
+    assert sum(movie["rentals"] for movie in top_after) == (
+        sum(movie["rentals"] for movie in top_before) + 2
+    )
+
+    response = client.get("/analytics/rent_duration")
+    assert response.status_code == 200
+    assert response.json()["returns"] >= 2
+
+
+def test_analytics_summaries_follow_genre_changes(client: TestClient, session: Session):
+    """
+    Test that the genre summaries follow a movie moved to another genre: its
+    past rentals move with it, and closing or deleting its rents afterwards
+    keeps every genre count non-negative and equal to a rebuild.
+    Args:
+        client (TestClient): The test client used to simulate API requests.
+        session (Session): The database session shared with the client.
+    """
+
+    rent_ids = [
+        client.post(
+            "/movie_rents",
+            json={"client_id": 1, "details": [{"movie_copy_id": copy_id}]},
+        ).json()["id"]
+        for copy_id in (2, 3)
+    ]
+    movie = client.get("/movies/8").json()
+    new_genre_id = 1 if movie["genre_id"] != 1 else 2
+    response = client.put(
+        "/movies/8",
+        json={
+            "title": movie["title"],
+            "description": movie["description"],
+            "year": movie["year"],
+            "director": movie["director"],
+            "genre_id": new_genre_id,
+        },
+    )
+    assert response.status_code == 200
+
+    assert client.put(f"/movie_rents/{rent_ids[0]}/close").status_code == 200
+    assert client.delete(f"/movie_rents/{rent_ids[1]}").status_code == 200
+
+    incremental = _summaries(session)
+    assert all(
+        row.rentals >= 0 and row.returns >= 0
+        for row in session.exec(select(DailyGenreRentals))
+    )
+    rebuild_summaries(session)
+    session.commit()
+    assert _summaries(session) == incremental
+
+
+def test_analytics_utilization(client: TestClient):
+    """
+    Test that the utilization endpoint counts the copies of an open rent.
+    Args:
+        client (TestClient): The test client used to simulate API requests.
+    """
+
+    response = client.post(
+        "/movie_rents",
+        json={"client_id": 1, "details": [{"movie_copy_id": 2}, {"movie_copy_id": 11}]},
+    )
+    assert response.status_code == 200
+
+    response = client.get("/analytics/utilization", params={"limit": 1000})
+    data = response.json()
+    assert response.status_code == 200
+    assert sum(movie["rented_copies"] for movie in data) >= 2
+    assert all(0 <= movie["utilization"] <= 1 for movie in data)
@@ -0,0 +1,92 @@
+from datetime import date
+from typing import Annotated, Optional
+
+from fastapi import APIRouter, Query
+
+from analytics.models import GenreDayRentals, MovieUtilization, RentDuration, TopMovie
+from analytics.repositories import AnalyticsRepository
+from base.db_connection import ReadSessionDep
+
+router = APIRouter()
+
+LimitQuery = Annotated[int, Query(ge=1, le=1000)]
+
+
+@router.get("/analytics/top_movies", tags=["analytics"], response_model=list[TopMovie])
+def top_movies(
+    session: ReadSessionDep,
+    limit: LimitQuery = 10,
+    start: Optional[date] = None,
+    end: Optional[date] = None,
+):
+    """
+    Retrieve the most rented movies.
+    Args:
+        session (ReadSessionDep): The read-only database session dependency.
+        limit (int): The number of movies to return.
+        start (Optional[date]): Only count the copies rented from this day on.
+        end (Optional[date]): Only count the copies rented up to this day.
+    Returns:
+        list[TopMovie]: The movies with the most rented copies, most rented first.
+    """
+
+    return AnalyticsRepository(session).top_movies(limit, start, end)
+
+
+@router.get(
+    "/analytics/genres/daily",
+    tags=["analytics"],
+    response_model=list[GenreDayRentals],
+)
+def genre_daily_rentals(
+    session: ReadSessionDep,
+    start: Optional[date] = None,
+    end: Optional[date] = None,
+    genre_id: Optional[int] = None,
+):
+    """
+    Retrieve the copies rented and returned per genre and day.
+    Args:
+        session (ReadSessionDep): The read-only database session dependency.
+        start (Optional[date]): The first day to return.
+        end (Optional[date]): The last day to return.
+        genre_id (Optional[int]): Only return the days of this genre.
+    Returns:
+        list[GenreDayRentals]: One row per genre and day with rentals, by day.
+    """
+
+    return AnalyticsRepository(session).genre_daily_rentals(start, end, genre_id)
+
+
+@router.get("/analytics/rent_duration", tags=["analytics"], response_model=RentDuration)
+def rent_duration(session: ReadSessionDep, movie_id: Optional[int] = None):
+    """
+    Retrieve the average rent duration of the returned copies.
+    Args:
+        session (ReadSessionDep): The read-only database session dependency.
+        movie_id (Optional[int]): Only consider the copies of this movie.
+    Returns:
+        RentDuration: The number of returned copies and their average rent
+                      duration, in seconds and in days.
+    """
+
+    return AnalyticsRepository(session).rent_duration(movie_id)
+
+
+@router.get(
+    "/analytics/utilization",
+    tags=["analytics"],
+    response_model=list[MovieUtilization],
+)
+def utilization(session: ReadSessionDep, limit: LimitQuery = 10):
+    """
+    Retrieve the movies with the largest share of their copies rented right now.
+    Args:
+        session (ReadSessionDep): The read-only database session dependency.
+        limit (int): The number of movies to return.
+    Returns:
+        list[MovieUtilization]: The copies and rented copies of every movie, the
+                                rented share and the all-time rentals per copy.
+    """
+
+    return AnalyticsRepository(session).utilization(limit)
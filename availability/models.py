@@ -0,0 +1,19 @@
+from typing import Literal
+
+from sqlmodel import SQLModel
+
+
+class CopyAvailability(SQLModel):
+    type: Literal["copy"] = "copy"
+    copy_id: int
+    movie_id: int
+    genre_id: int
+    available: bool
+
+
+class MovieAvailability(SQLModel):
+    type: Literal["movie"] = "movie"
+    movie_id: int
+    genre_id: int
+    total_copies: int
+    available_copies: int
@@ -0,0 +1,119 @@
+from typing import Iterable, Union
+
+from sqlalchemy import event, exists
+from sqlmodel import Session, col, select
+
+from availability.models import CopyAvailability, MovieAvailability
+from base import settings
+from base.pending import add_pending, discard_pending, is_savepoint, pop_pending
+from base.pubsub import PubSub
+from movie_rents.models import MovieRent, MovieRentDetail
+from movies.models import Movie, MovieCopy
+
+# session.info keys of the copies whose availability changed in the transaction
+# and of the events computed for them, published once it is committed
+PENDING_COPIES = "pending_availability_copies"
+PENDING_EVENTS = "pending_availability_events"
+
+AvailabilityEvent = Union[CopyAvailability, MovieAvailability]
+
+availability_events = PubSub(
+    settings.AVAILABILITY_QUEUE_SIZE, settings.AVAILABILITY_MAX_SUBSCRIBERS
+)
+
+
+def topics(movie_id: int, genre_id: int) -> tuple[str, str]:
+    return f"movie:{movie_id}", f"genre:{genre_id}"
+
+
+def rent_copy_ids(session: Session, movie_rent_id: int) -> set[int]:
+    """
+    Return the ids of the copies of a rent.
+    """
+
+    statement = select(MovieRentDetail.movie_copy_id).where(
+        MovieRentDetail.movie_rent_id == movie_rent_id
+    )
+    return set(session.exec(statement).all())
+
+
+def queue_availability(session: Session, copy_ids: Iterable[int]):
+    """
+    Publish the availability of copies, and of their movies, once the
+    transaction of the session is committed.
+    """
+
+    add_pending(session, PENDING_COPIES, copy_ids)
+
+
+def movie_availability(session: Session, movie_ids: Iterable[int]):
+    statement = select(
+        Movie.id, Movie.genre_id, Movie.total_copies, Movie.available_copies
+    ).where(col(Movie.id).in_(set(movie_ids)))
+    return [
+        MovieAvailability(
+            movie_id=movie_id,
+            genre_id=genre_id,
+            total_copies=total_copies,
+            available_copies=available_copies,
+        )
+        for movie_id, genre_id, total_copies, available_copies in session.exec(
+            statement
+        )
+    ]
+
+
+def _availability_events(session: Session, copy_ids: set[int]) -> list:
+    rented = (
+        exists()
+        .where(
+            col(MovieRentDetail.movie_copy_id) == MovieCopy.id,
+            col(MovieRentDetail.movie_rent_id) == MovieRent.id,
+            col(MovieRent.is_closed).is_not(True),
+        )
+        .label("rented")
+    )
+    statement = (
+        select(MovieCopy.id, MovieCopy.movie_id, Movie.genre_id, rented)
+        .join(Movie, col(Movie.id) == MovieCopy.movie_id)
+        .where(col(MovieCopy.id).in_(copy_ids))
+    )
+    events: list[AvailabilityEvent] = [
+        CopyAvailability(
+            copy_id=copy_id,
+            movie_id=movie_id,
+            genre_id=genre_id,
+            available=not is_rented,
+        )
+        for copy_id, movie_id, genre_id, is_rented in session.exec(statement)
+    ]
+    events += movie_availability(session, {event.movie_id for event in events})
+    return events
+
+
+@event.listens_for(Session, "before_commit")
+def _collect_availability(session):
+    # read the final state once per transaction, however many writes queued;
+    # savepoint releases are skipped, see base/pending.py
+    if is_savepoint(session):
+        return
+    copy_ids = set(pop_pending(session, PENDING_COPIES))
+    if copy_ids:
+        session.info[PENDING_EVENTS] = _availability_events(session, copy_ids)
+
+
+@event.listens_for(Session, "after_commit")
+def _publish_availability(session):
+    if is_savepoint(session):
+        return
+    for availability in session.info.pop(PENDING_EVENTS, ()):
+        availability_events.publish(
+            topics(availability.movie_id, availability.genre_id), availability
+        )
+
+
+@event.listens_for(Session, "after_rollback")
+def _discard_availability(session):
+    discard_pending(session, PENDING_COPIES)
+    if not is_savepoint(session):
+        session.info.pop(PENDING_EVENTS, None)
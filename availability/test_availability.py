@@ -0,0 +1,168 @@
+import asyncio
+import sqlite3
+
+from fastapi.testclient import TestClient
+from sqlalchemy.exc import OperationalError
+from sqlmodel import SQLModel
+
+from availability import services
+from availability.services import availability_events
+from base.write_pipeline import GroupCommitWriter, create_writer_engine
+from movies.models import Genre, MovieCreate
+from movies.repositories import MovieRepository
+
+
+def test_availability_events_published_on_commit(client: TestClient):
+    """
+    Test that renting and returning a copy publishes its availability and the
+    counters of its movie to the subscribers of the movie.
+    Args:
+        client (TestClient): The test client used to simulate API requests.
+    """
+
+    movie_id = client.get("/movie_rents/1").json()["details"][0]["movie_copy"][
+        "movie_id"
+    ]
+    copy_id = client.get(f"/movies/{movie_id}").json()["copies"][-1]["id"]
+
+    loop = asyncio.new_event_loop()
+    subscription = availability_events.subscribe([f"movie:{movie_id}"], loop=loop)
+    assert subscription is not None
+    try:
+        response = client.post(
+            "/movie_rents",
+            json={"client_id": 1, "details": [{"movie_copy_id": copy_id}]},
+        )
+        client.put(f"/movie_rents/{response.json()['id']}/close")
+
+        async def received():
+            return [await asyncio.wait_for(subscription.get(), 1) for _ in range(4)]
+
+        events = loop.run_until_complete(received())
+    finally:
+        availability_events.unsubscribe(subscription)
+        loop.close()
+
+    copies = [event for event in events if event.type == "copy"]
+    assert [(event.copy_id, event.available) for event in copies] == [
+        (copy_id, False),
+        (copy_id, True),
+    ]
+    movies = [event for event in events if event.type == "movie"]
+    assert movies[1].available_copies == movies[0].available_copies + 1
+
+
+def test_availability_stream_snapshot(client: TestClient):
+    """
+    Test that the stream starts with the current availability of the followed
+    movies, and that disconnecting ends it. The stream never ends on its own, so
+    the application is called directly and disconnects after the snapshot.
+    Args:
+        client (TestClient): The test client, which installs the session
+            dependency overrides on the application.
+    """
+
+    scope = {
+        "type": "http",
+        "asgi": {"version": "3.0"},
+        "http_version": "1.1",
+        "method": "GET",
+        "scheme": "http",
+        "path": "/availability/stream",
+        "raw_path": b"/availability/stream",
+        "root_path": "",
+        "query_string": b"movie_id=1",
+        "headers": [],
+        "client": ("test", 1),
+        "server": ("test", 80),
+    }
+    messages = []
+    requested = False
+    received_snapshot = asyncio.Event()
+
+    async def receive():
+        nonlocal requested
+        if not requested:
+            requested = True
+            return {"type": "http.request", "body": b"", "more_body": False}
+        await received_snapshot.wait()
+        return {"type": "http.disconnect"}
+
+    async def send(message):
+        messages.append(message)
+        body = b"".join(m.get("body", b"") for m in messages)
+        if b"event: movie" in body:
+            received_snapshot.set()
+
+    async def scenario():
+        await asyncio.wait_for(client.app(scope, receive, send), 5)
+
+    asyncio.run(scenario())
+    assert messages[0]["status"] == 200
+    body = b"".join(message.get("body", b"") for message in messages).decode()
+    assert body.startswith("retry: 3000")
+    assert "event: movie" in body and '"movie_id":1' in body
+    assert availability_events.subscribers == 0
+
+
+def test_availability_events_wait_for_the_group_commit(tmp_path, monkeypatch):
+    """
+    Test that, through the group commit writer, availability events are only
+    published once the whole group is committed, that a failing operation only
+    discards its own events, and that a group run again after a lock error
+    publishes its events once.
+    """
+
+    published = []
+    monkeypatch.setattr(
+        services.availability_events,
+        "publish",
+        lambda topics, event: published.append(event),
+    )
+    engine = create_writer_engine(f"sqlite:///{tmp_path}/database.db")
+    SQLModel.metadata.create_all(engine)
+    writer = GroupCommitWriter(engine, window=0.2)
+    writer.start()
+
+    def add_movie(session):
+        session.add(Genre(id=1, name="Drama", description=""))
+        movie = MovieCreate(
+            title="Title", description="", year=2000, director="", genre_id=1, stock=3
+        )
+        return [
+            copy.id for copy in MovieRepository(session).add_with_stock(movie).copies
+        ]
+
+    copy_ids = writer.submit(add_movie).result(timeout=5)
+    published.clear()
+    attempts = []
+
+    def queue(copy_id: int):
+        return lambda session: services.queue_availability(session, [copy_id])
+
+    def fail(session):
+        services.queue_availability(session, [copy_ids[1]])
+        raise ValueError("failed")
+
+    def lock_once(session):
+        services.queue_availability(session, [copy_ids[2]])
+        attempts.append(list(published))
+        if len(attempts) == 1:
+            raise OperationalError(
+                "INSERT", {}, sqlite3.OperationalError("database is locked")
+            )
+
+    futures = [
+        writer.submit(queue(copy_ids[0])),
+        writer.submit(fail),
+        writer.submit(lock_once),
+    ]
+    for future in futures:
+        future.exception(timeout=5)
+    writer.stop()
+    engine.dispose()
+
+    # nothing was published while the group was running
+    assert attempts == [[], []]
+    copies = [event.copy_id for event in published if event.type == "copy"]
+    assert sorted(copies) == [copy_ids[0], copy_ids[2]]
@@ -0,0 +1,84 @@
+import asyncio
+from typing import Annotated, Optional
+
+from fastapi import APIRouter, HTTPException, Query, Request
+from fastapi.responses import StreamingResponse
+
+from availability.services import availability_events, movie_availability
+from base import settings
+from base.db_connection import ReadSessionDep
+
+router = APIRouter()
+
+
+def _message(event) -> str:
+    return f"event: {event.type}\ndata: {event.model_dump_json()}\n\n"
+
+
+@router.get("/availability/stream", tags=["availability"])
+async def stream_availability(
+    request: Request,
+    session: ReadSessionDep,
+    movie_id: Annotated[Optional[list[int]], Query()] = None,
+    genre_id: Annotated[Optional[list[int]], Query()] = None,
+):
+    """
+    Stream the availability changes of copies and movies as Server-Sent Events.
+    An event is sent for every copy, and every movie, whose availability was
+    changed by a committed rent creation, update, closing or deletion:
+    `event: copy` with `{"copy_id", "movie_id", "genre_id", "available"}` and
+    `event: movie` with `{"movie_id", "genre_id", "total_copies",
+    "available_copies"}`. When movies are followed, their current availability
+    is sent first. A comment is sent every AVAILABILITY_HEARTBEAT_SECONDS to keep
+    idle connections open, and `event: lagged` tells a client that could not keep
+    up how many events it missed.
+    Args:
+        request (Request): The incoming request, to detect disconnections.
+        session (ReadSessionDep): The read-only database session dependency.
+        movie_id (Optional[list[int]]): Only follow these movies.
+        genre_id (Optional[list[int]]): Only follow the movies of these genres.
+    Returns:
+        StreamingResponse: The `text/event-stream` of the events.
+    Raises:
+        HTTPException: 503 if the maximum number of subscribers is reached.
+    """
+
+    followed = None
+    if movie_id or genre_id:
+        followed = [f"movie:{id}" for id in movie_id or ()]
+        followed += [f"genre:{id}" for id in genre_id or ()]
+    subscription = availability_events.subscribe(followed)
+    if subscription is None:
+        raise HTTPException(
+            status_code=503,
+            detail="Too many availability subscribers",
+            headers={"Retry-After": "30"},
+        )
+    snapshot = movie_availability(session, movie_id) if movie_id else []
+
+    async def events():
+        try:
+            yield "retry: 3000\n\n"
+            for availability in snapshot:
+                yield _message(availability)
+            lagged = 0
+            while not await request.is_disconnected():
+                try:
+                    availability = await asyncio.wait_for(
+                        subscription.get(), settings.AVAILABILITY_HEARTBEAT_SECONDS
+                    )
+                except asyncio.TimeoutError:
+                    yield ": keepalive\n\n"
+                    continue
+                if subscription.lagged != lagged:
+                    yield f"event: lagged\ndata: {subscription.lagged - lagged}\n\n"
+                    lagged = subscription.lagged
+                yield _message(availability)
+        finally:
+            availability_events.unsubscribe(subscription)
+
+    return StreamingResponse(
+        events(),
+        media_type="text/event-stream",
+        headers={"Cache-Control": "no-cache", "X-Accel-Buffering": "no"},
+    )
@@ -0,0 +1,226 @@
+import asyncio
+import collections
+import time
+from dataclasses import dataclass
+from typing import Optional
+
+from starlette.responses import JSONResponse
+
+# the router every path prefix belongs to; other paths are not limited
+ROUTE_GROUPS = {
+    "genres": "movies",
+    "movies": "movies",
+    "copies": "movies",
+    "clients": "clients",
+    "movie_rents": "movie_rents",
+}
+READ_METHODS = frozenset({"GET", "HEAD", "OPTIONS"})
+OVERLOADED_DETAIL = "Service overloaded, retry later"
+
+
+@dataclass
+class AdmissionMetrics:
+    """
+    Attributes:
+        admitted (int): The requests let through, at once or after queueing.
+        queued (int): The admitted requests that had to wait for a slot.
+        rejected (int): The requests rejected because the queue was full.
+        timed_out (int): The requests rejected after waiting `queue_timeout`.
+        queue_time_total (float): The seconds waited by the admitted requests.
+        queue_time_max (float): The longest wait of an admitted request.
+    """
+
+    admitted: int = 0
+    queued: int = 0
+    rejected: int = 0
+    timed_out: int = 0
+    queue_time_total: float = 0.0
+    queue_time_max: float = 0.0
+
+    def as_dict(self) -> dict:
+        return {
+            "admitted": self.admitted,
+            "queued": self.queued,
+            "rejected": self.rejected,
+            "timed_out": self.timed_out,
+            "queue_time_avg_ms": round(
+                self.queue_time_total / self.queued * 1000 if self.queued else 0, 3
+            ),
+            "queue_time_max_ms": round(self.queue_time_max * 1000, 3),
+        }
+
+
+class AdmissionLimit:
+    """
+    Concurrency limit with a bounded FIFO queue.
+    At most `concurrency` requests run at once. The next `queue_size` wait for a
+    slot, at most `queue_timeout` seconds; beyond that, requests are rejected
+    right away instead of piling up. It is only used from the event loop, so
+    the counters need no lock.
+    """
+
+    def __init__(self, concurrency: int, queue_size: int, queue_timeout: float):
+        self.concurrency = concurrency
+        self.queue_size = queue_size
+        self.queue_timeout = queue_timeout
+        self.active = 0
+        self.metrics = AdmissionMetrics()
+        self._waiters: collections.deque[asyncio.Future] = collections.deque()
+
+    async def acquire(self) -> bool:
+        """
+        Wait for a slot.
+        Returns:
+            bool: Whether the request was admitted; if so `release` must be
+                  called once it is done.
+        """
+
+        if self.active < self.concurrency and not self._waiters:
+            self.active += 1
+            self.metrics.admitted += 1
+            return True
+        if len(self._waiters) >= self.queue_size:
+            self.metrics.rejected += 1
+            return False
+
+        waiter = asyncio.get_running_loop().create_future()
+        self._waiters.append(waiter)
+        start = time.perf_counter()
+        try:
+            await asyncio.wait_for(asyncio.shield(waiter), self.queue_timeout)
+        except asyncio.TimeoutError:
+            self._abandon(waiter)
+            self.metrics.timed_out += 1
+            return False
+        except asyncio.CancelledError:
+            self._abandon(waiter)
+            raise
+
+        waited = time.perf_counter() - start
+        self.metrics.admitted += 1
+        self.metrics.queued += 1
+        self.metrics.queue_time_total += waited
+        self.metrics.queue_time_max = max(self.metrics.queue_time_max, waited)
+        return True
+
+    def _abandon(self, waiter: asyncio.Future):
+        if waiter.done():
+            # the slot was handed over while giving up, pass it on
+            self.release()
+        else:
+            self._waiters.remove(waiter)
+            waiter.cancel()
+
+    def release(self):
+        # hand the slot over to the oldest waiter, the active count is unchanged
+        if self._waiters:
+            self._waiters.popleft().set_result(True)
+        else:
+            self.active -= 1
+
+    def as_dict(self) -> dict:
+        return {
+            "concurrency": self.concurrency,
+            "queue_size": self.queue_size,
+            "active": self.active,
+            "waiting": len(self._waiters),
+            **self.metrics.as_dict(),
+        }
+
+
+def parse_limits(value: str) -> dict[str, tuple[int, int]]:
+    """
+    Parse limit overrides like `movies.read=64/256,movie_rents.write=4/16`, each
+    being `<router>.<read|write>=<concurrency>/<queue size>`.
+    Raises:
+        ValueError: If an entry is malformed.
+    """
+
+    limits = {}
+    for entry in filter(None, (item.strip() for item in value.split(","))):
+        name, _, sizes = entry.partition("=")
+        concurrency, _, queue_size = sizes.partition("/")
+        group, _, kind = name.strip().partition(".")
+        if group not in ROUTE_GROUPS.values() or kind not in ("read", "write"):
+            raise ValueError(f"Unknown admission limit {name!r}")
+        limits[f"{group}.{kind}"] = (int(concurrency), int(queue_size))
+    return limits
+
+
+def admission_limit(method: str, path: str) -> Optional[AdmissionLimit]:
+    """
+    Find the limit of a request.
+    Args:
+        method (str): The HTTP method of the request.
+        path (str): The path of the request.
+    Returns:
+        Optional[AdmissionLimit]: The limit of the router of the path, None when
+                                  the path is not limited or the admission
+                                  control is disabled.
+    """
+
+    group = ROUTE_GROUPS.get(path.strip("/").split("/", 1)[0])
+    if group is None:
+        return None
+    kind = "read" if method.upper() in READ_METHODS else "write"
+    return admission_limits.get(f"{group}.{kind}")
+
+
+class AdmissionControlMiddleware:
+    """
+    ASGI middleware bounding the work in flight for every router, separately for
+    reads and writes (e.g. `movie_rents.write`).
+    When SQLite is saturated, requests beyond the concurrency limit wait in a
+    bounded queue instead of piling up in the server, and the excess is
+    answered 503 with a `Retry-After` header at once, so the admitted requests
+    keep their latency and clients back off. The time spent queueing is
+    recorded in the metrics of every limit (see GET /admin/admission).
+    Paths outside the routers, like /health, /admin and the availability
+    stream, are never limited; the calls of a /batch request are admitted one
+    by one by `run_batch`.
+    """
+
+    def __init__(
+        self,
+        app,
+        read: tuple[int, int],
+        write: tuple[int, int],
+        queue_timeout: float,
+        retry_after: int = 1,
+        overrides: Optional[dict[str, tuple[int, int]]] = None,
+    ):
+        self.app = app
+        self.retry_after = retry_after
+        overrides = overrides or {}
+        for group in set(ROUTE_GROUPS.values()):
+            for kind, default in (("read", read), ("write", write)):
+                name = f"{group}.{kind}"
+                concurrency, queue_size = overrides.get(name, default)
+                admission_limits[name] = AdmissionLimit(
+                    concurrency, queue_size, queue_timeout
+                )
+
+    async def __call__(self, scope, receive, send):
+        limit = None
+        if scope["type"] == "http":
+            limit = admission_limit(scope["method"], scope["path"])
+        if limit is None:
+            await self.app(scope, receive, send)
+            return
+
+        if not await limit.acquire():
+            response = JSONResponse(
+                {"detail": OVERLOADED_DETAIL},
+                status_code=503,
+                headers={"Retry-After": str(self.retry_after)},
+            )
+            await response(scope, receive, send)
+            return
+        try:
+            await self.app(scope, receive, send)
+        finally:
+            limit.release()
+
+
+# the limits of the installed middleware, by `<router>.<read|write>`
+admission_limits: dict[str, AdmissionLimit] = {}
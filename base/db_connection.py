@@ -1,22 +1,200 @@
-from typing import Annotated
+import hashlib
+from contextvars import ContextVar
+from typing import Annotated, Optional
 
 from fastapi import Depends
+from sqlalchemy import Engine, event, inspect
+from sqlalchemy.schema import CreateIndex, CreateTable
 from sqlmodel import Session, SQLModel, create_engine
 
+from base import settings
+from base.retry import interrupt_after_deadline
+
 sqlite_file_name = "./database.db"
 sqlite_url = f"sqlite:///{sqlite_file_name}"
+sqlite_read_only_url = f"sqlite:///file:{sqlite_file_name}?mode=ro&uri=true"
 
-connect_args = {"check_same_thread": False}
-engine = create_engine(sqlite_url, connect_args=connect_args)
+connect_args = {"check_same_thread": False, "timeout": settings.DB_BUSY_TIMEOUT_SECONDS}
 
+# SQLite instructions between two calls of the deadline progress handler
+PROGRESS_HANDLER_INSTRUCTIONS = 10_000
 
-def create_db_and_tables():
+# Read-write engine, used by the mutating routes, the loader and schema creation.
+engine = create_engine(
+    sqlite_url,
+    connect_args=connect_args,
+    pool_size=settings.DB_WRITE_POOL_SIZE,
+    max_overflow=settings.DB_WRITE_POOL_OVERFLOW,
+)
+
+# Read-only engine with its own pool, used by the GET routes. Connections open
+# the file in `mode=ro` and with `query_only`, so they can never take the write
+# lock, and with WAL enabled they read without waiting for writers. The GET
+# views are plain functions or run their queries in the threadpool, so the reads
+# of concurrent requests use these connections side by side instead of queueing
+# on the event loop.
+read_engine = create_engine(
+    sqlite_read_only_url,
+    connect_args=connect_args,
+    pool_size=settings.DB_READ_POOL_SIZE,
+    max_overflow=settings.DB_READ_POOL_SIZE,
+)
+
+
+@event.listens_for(engine, "connect")
+def _enable_wal(dbapi_connection, connection_record):
+    cursor = dbapi_connection.cursor()
+    cursor.execute("PRAGMA journal_mode = WAL")
+    cursor.close()
+
+
+@event.listens_for(read_engine, "connect")
+def _enable_query_only(dbapi_connection, connection_record):
+    cursor = dbapi_connection.cursor()
+    cursor.execute("PRAGMA query_only = ON")
+    cursor.close()
+
+
+@event.listens_for(engine, "connect")
+@event.listens_for(read_engine, "connect")
+def _interrupt_after_deadline(dbapi_connection, connection_record):
+    # queries still running past the deadline of their request are aborted
+    dbapi_connection.set_progress_handler(
+        interrupt_after_deadline, PROGRESS_HANDLER_INSTRUCTIONS
+    )
+
+
+def schema_fingerprint(engine: Engine) -> int:
+    """
+    Hash the DDL of every table and index of the models into a positive 31-bit
+    integer, which fits SQLite's `user_version`.
+    """
+
+    statements = []
+    for table in sorted(SQLModel.metadata.tables.values(), key=lambda t: t.name):
+        statements.append(str(CreateTable(table).compile(dialect=engine.dialect)))
+        for index in sorted(table.indexes, key=lambda index: index.name or ""):
+            statements.append(str(CreateIndex(index).compile(dialect=engine.dialect)))
+    digest = hashlib.sha256("\n".join(statements).encode()).digest()
+    return int.from_bytes(digest[:4], "big") & 0x7FFFFFFF
+
+
+class SchemaOutdated(RuntimeError):
+    """
+    Raised when tables of the database lack columns of the models, or have
+    indexes whose uniqueness differs from them, which `create_all` cannot fix.
+    """
+
+    def __init__(self, differences: list[str]):
+        self.differences = differences
+        super().__init__(
+            "The database schema is older than the models: "
+            + "; ".join(differences)
+            + ". Add the missing columns (or recreate the database), run "
+            "`python manage.py copy-codes` for the unique copy codes, or set "
+            "SCHEMA_SYNC=never to start anyway."
+        )
+
+
+def schema_differences(engine: Engine) -> list[str]:
+    """
+    Compare the live tables with the models.
+    Returns:
+        list[str]: The missing tables, columns and indexes, and the indexes
+                   whose uniqueness differs, empty when the schema is current.
+    """
+
+    inspector = inspect(engine)
+    live_tables = set(inspector.get_table_names())
+    differences = []
+    for table in SQLModel.metadata.sorted_tables:
+        if table.name not in live_tables:
+            differences.append(f"table {table.name} is missing")
+            continue
+        live_columns = {column["name"] for column in inspector.get_columns(table.name)}
+        differences += [
+            f"column {table.name}.{column.name} is missing"
+            for column in table.columns
+            if column.name not in live_columns
+        ]
+        live_indexes = {
+            index["name"]: index for index in inspector.get_indexes(table.name)
+        }
+        for index in table.indexes:
+            live = live_indexes.get(index.name)
+            if live is None:
+                differences.append(f"index {index.name} is missing")
+            elif bool(live["unique"]) != bool(index.unique):
+                expected = "unique" if index.unique else "not unique"
+                differences.append(f"index {index.name} should be {expected}")
+    return differences
+
+
+def sync_schema(engine: Engine, mode: str = "auto") -> bool:
+    """
+    Create the missing tables and indexes, unless the database was already
+    created from the same models.
+    The fingerprint of the schema is kept in `PRAGMA user_version`, so checking
+    it costs one pragma instead of inspecting every table. It is only stored
+    once the live tables match the models: `create_all` does not add columns
+    to existing tables, so those are reported instead of marked current.
+    Args:
+        engine (Engine): The read-write engine of the database.
+        mode (str): "auto" to skip up to date databases, "always" to always run
+                    the creation, "never" to never touch the schema.
+    Returns:
+        bool: Whether the schema creation ran.
+    Raises:
+        SchemaOutdated: If existing tables differ from the models in a way the
+                        creation cannot fix.
+    """
+
+    if mode == "never":
+        return False
+    fingerprint = schema_fingerprint(engine)
+    if mode == "auto":
+        with engine.connect() as connection:
+            version = connection.exec_driver_sql("PRAGMA user_version").scalar()
+        if version == fingerprint:
+            return False
     SQLModel.metadata.create_all(engine)
+    with engine.begin() as connection:
+        # indexes added to the models after their table was created
+        for table in SQLModel.metadata.sorted_tables:
+            for index in table.indexes:
+                index.create(connection, checkfirst=True)
+    differences = schema_differences(engine)
+    if differences:
+        raise SchemaOutdated(differences)
+    with engine.begin() as connection:
+        connection.exec_driver_sql(f"PRAGMA user_version = {fingerprint}")
+    return True
+
+
+def create_db_and_tables():
+    return sync_schema(engine, settings.SCHEMA_SYNC)
+
+
+# Session shared by the sub-requests of a /batch request (see batch/views.py);
+# while it is set, both session dependencies yield it.
+batch_session: ContextVar[Optional[Session]] = ContextVar("batch_session", default=None)
 
 
 def get_session():
+    if (shared := batch_session.get()) is not None:
+        yield shared
+        return
     with Session(engine) as session:
         yield session
 
 
+def get_read_session():
+    if (shared := batch_session.get()) is not None:
+        yield shared
+        return
+    with Session(read_engine) as session:
+        yield session
+
+
 SessionDep = Annotated[Session, Depends(get_session)]
+ReadSessionDep = Annotated[Session, Depends(get_read_session)]
@@ -0,0 +1,294 @@
+import asyncio
+import hashlib
+import json
+import time
+from datetime import datetime, timedelta
+from typing import Any, Optional
+
+from fastapi import HTTPException
+from fastapi.encoders import jsonable_encoder
+from fastapi.responses import JSONResponse
+from pydantic import BaseModel
+from sqlalchemy.exc import IntegrityError
+from sqlmodel import Field, Session, SQLModel, col, delete, update
+
+from base import settings
+from base.repository import DEFERRED_COMMIT
+from base.write_pipeline import WriteOperation, run_write
+
+IDEMPOTENCY_KEY_MAX_LENGTH = 255
+POLL_INTERVAL_SECONDS = 0.05
+EVICTION_INTERVAL_SECONDS = 60
+
+
+class IdempotencyRecord(SQLModel, table=True):
+    """
+    The outcome of a request sent with an Idempotency-Key header. `response`
+    is empty while the first request is still running; `created_at` is then the
+    time of its claim, renewed when another request takes the claim over.
+    """
+
+    key: str = Field(primary_key=True, max_length=IDEMPOTENCY_KEY_MAX_LENGTH)
+    request_hash: str
+    response: Optional[str] = Field(default=None)
+    created_at: datetime = Field(default_factory=datetime.now, index=True)
+
+
+def request_hash(route: str, payload: BaseModel) -> str:
+    # only the fields sent by the client, defaults such as timestamps vary
+    body = json.dumps(
+        jsonable_encoder(payload, exclude_unset=True),
+        sort_keys=True,
+        separators=(",", ":"),
+    )
+    return hashlib.sha256(f"{route}\n{body}".encode()).hexdigest()
+
+
+class IdempotencyStore:
+    """
+    Runs requests at most once per Idempotency-Key.
+    Records live in the database, so every worker sees them, and expire after
+    `ttl` seconds. Within a worker, concurrent requests with the same key queue
+    on a lock; across workers, a request finding a record still in progress
+    polls it until the first request finishes or `wait` seconds pass.
+    A claim is a lease of `wait` seconds: a request finding a claim older than
+    that, left by a worker that crashed or is stuck, takes it over. The write
+    only commits while its request still holds the claim, so the key is never
+    run twice.
+    """
+
+    def __init__(self, ttl: int, wait: float):
+        self.ttl = timedelta(seconds=ttl)
+        self.wait = wait
+        self._locks: dict[str, tuple[asyncio.Lock, int]] = {}
+        self._last_eviction = 0.0
+
+    async def run(
+        self,
+        session: Session,
+        key: Optional[str],
+        route: str,
+        payload: BaseModel,
+        operation: WriteOperation,
+        response_model: type[BaseModel],
+    ) -> Any:
+        """
+        Run the write operation of a request with `run_write`, or replay the
+        stored response of a previous request with the same Idempotency-Key.
+        The response is stored in the transaction of the write, so a request
+        either has both committed or neither.
+        Args:
+            session (Session): The read-write session of the request.
+            key (Optional[str]): The Idempotency-Key header, if the client sent one.
+            route (str): The method and path of the route, part of the request hash.
+            payload (BaseModel): The request body, part of the request hash.
+            operation (Callable[[Session], Any]): Runs the repository method
+                with the session it is given.
+            response_model (type[BaseModel]): The response model of the route,
+                used to store the response.
+        Returns:
+            Any: The result of the operation, or a JSONResponse replaying the
+                 stored response with an `Idempotent-Replayed: true` header.
+        Raises:
+            HTTPException: 400 if the key is too long, 422 if it was used for a
+                           different request and 409 if the first request with
+                           the key is still running after the wait.
+        """
+
+        if key is None:
+            return await run_write(session, operation, response_model)
+        if len(key) > IDEMPOTENCY_KEY_MAX_LENGTH:
+            raise HTTPException(status_code=400, detail="Idempotency-Key is too long")
+
+        digest = request_hash(route, payload)
+        async with self._lock(key):
+            self._evict_expired(session)
+            record = await self._claim(session, key, digest)
+            if record.response is not None:
+                return JSONResponse(
+                    json.loads(record.response),
+                    headers={"Idempotent-Replayed": "true"},
+                )
+
+            claimed_at = record.created_at
+            try:
+                return await run_write(
+                    session,
+                    lambda s: self._write(
+                        s, key, claimed_at, operation, response_model
+                    ),
+                    response_model,
+                )
+            except BaseException:
+                session.rollback()
+                # the claim may have been taken over in the meantime
+                session.exec(
+                    delete(IdempotencyRecord).where(
+                        col(IdempotencyRecord.key) == key,
+                        col(IdempotencyRecord.created_at) == claimed_at,
+                    )
+                )  # type: ignore
+                session.commit()
+                raise
+
+    def _write(
+        self,
+        session: Session,
+        key: str,
+        claimed_at: datetime,
+        operation: WriteOperation,
+        response_model: type[BaseModel],
+    ) -> Any:
+        """
+        Run the operation with its commits deferred, then store its response
+        in the claim and commit both at once. Sessions whose commit was already
+        deferred, like the one of the group commit writer, are left to their
+        owner. Raises a 409 HTTPException, rolling the write back, when the
+        claim was taken over by another request.
+        """
+
+        deferred = session.info.get(DEFERRED_COMMIT)
+        session.info[DEFERRED_COMMIT] = True
+        try:
+            result = operation(session)
+            response = jsonable_encoder(response_model.model_validate(result))
+        finally:
+            if not deferred:
+                session.info.pop(DEFERRED_COMMIT, None)
+
+        stored = session.exec(
+            update(IdempotencyRecord)
+            .where(
+                col(IdempotencyRecord.key) == key,
+                col(IdempotencyRecord.created_at) == claimed_at,
+                col(IdempotencyRecord.response).is_(None),
+            )
+            .values(response=json.dumps(response, separators=(",", ":")))
+        )  # type: ignore
+        if stored.rowcount != 1:
+            raise HTTPException(
+                status_code=409,
+                detail="The claim of this Idempotency-Key was taken over",
+            )
+        if not deferred:
+            session.commit()
+        return result
+
+    async def _claim(
+        self, session: Session, key: str, digest: str
+    ) -> IdempotencyRecord:
+        """
+        Insert an in-progress record for the key, or take over a claim older
+        than `wait` seconds. Returns the claimed record, or the completed
+        record when the key was already used for the same request.
+        """
+
+        deadline = time.monotonic() + self.wait
+        while True:
+            record = session.get(IdempotencyRecord, key, populate_existing=True)
+            if record is not None and record.created_at < datetime.now() - self.ttl:
+                session.delete(record)
+                session.commit()
+                record = None
+
+            if record is None:
+                record = IdempotencyRecord(key=key, request_hash=digest)
+                session.add(record)
+                try:
+                    session.commit()
+                    return record
+                except IntegrityError:
+                    # another worker claimed the key in the meantime
+                    session.rollback()
+                    continue
+
+            if record.request_hash != digest:
+                raise HTTPException(
+                    status_code=422,
+                    detail="Idempotency-Key was already used for a different request",
+                )
+            if record.response is not None:
+                return record
+            if record.created_at < datetime.now() - timedelta(seconds=self.wait):
+                claimed = self._take_over(session, record)
+                if claimed is not None:
+                    return claimed
+                continue
+            if time.monotonic() > deadline:
+                raise HTTPException(
+                    status_code=409,
+                    detail="A request with this Idempotency-Key is still in progress",
+                )
+            session.rollback()
+            await asyncio.sleep(POLL_INTERVAL_SECONDS)
+
+    def _take_over(
+        self, session: Session, record: IdempotencyRecord
+    ) -> Optional[IdempotencyRecord]:
+        # renew the claim unless another request renewed or completed it first
+        claimed_at = datetime.now()
+        taken = session.exec(
+            update(IdempotencyRecord)
+            .where(
+                col(IdempotencyRecord.key) == record.key,
+                col(IdempotencyRecord.created_at) == record.created_at,
+                col(IdempotencyRecord.response).is_(None),
+            )
+            .values(created_at=claimed_at)
+        )  # type: ignore
+        session.commit()
+        if taken.rowcount != 1:
+            return None
+        return session.get(IdempotencyRecord, record.key, populate_existing=True)
+
+    def _evict_expired(self, session: Session):
+        now = time.monotonic()
+        if now - self._last_eviction < EVICTION_INTERVAL_SECONDS:
+            return
+        self._last_eviction = now
+        session.exec(
+            delete(IdempotencyRecord).where(
+                col(IdempotencyRecord.created_at) < datetime.now() - self.ttl
+            )
+        )  # type: ignore
+        session.commit()
+
+    def _lock(self, key: str) -> "_KeyLock":
+        return _KeyLock(self, key)
+
+
+class _KeyLock:
+    """
+    Per-key asyncio lock, dropped from the store once nobody holds or waits
+    for it.
+    """
+
+    def __init__(self, store: IdempotencyStore, key: str):
+        self.store = store
+        self.key = key
+
+    async def __aenter__(self):
+        lock, users = self.store._locks.get(self.key, (asyncio.Lock(), 0))
+        self.store._locks[self.key] = (lock, users + 1)
+        self.lock = lock
+        try:
+            await lock.acquire()
+        except BaseException:
+            self._leave()
+            raise
+
+    async def __aexit__(self, *exc_info):
+        self.lock.release()
+        self._leave()
+
+    def _leave(self):
+        lock, users = self.store._locks[self.key]
+        if users == 1:
+            del self.store._locks[self.key]
+        else:
+            self.store._locks[self.key] = (lock, users - 1)
+
+
+idempotency_store = IdempotencyStore(
+    settings.IDEMPOTENCY_TTL_SECONDS, settings.IDEMPOTENCY_WAIT_SECONDS
+)
@@ -0,0 +1,81 @@
+import collections
+import threading
+import time
+from typing import Optional
+
+from base import settings
+
+# paths left out of the latency window: probes, diagnostics and streams
+UNTIMED_PATHS = ("/health", "/admin", "/availability/stream")
+
+
+class LatencyWindow:
+    """
+    Thread safe window of the latencies of the recent requests.
+    Samples older than `window` seconds are dropped, and at most `max_samples`
+    are kept, so percentiles always describe the last minute or so of traffic
+    at a bounded cost.
+    """
+
+    def __init__(self, window: float = 60, max_samples: int = 10_000):
+        self.window = window
+        self._samples: collections.deque[tuple[float, float]] = collections.deque(
+            maxlen=max_samples
+        )
+        self._lock = threading.Lock()
+
+    def record(self, seconds: float, now: Optional[float] = None):
+        with self._lock:
+            self._samples.append((time.monotonic() if now is None else now, seconds))
+
+    def _recent(self) -> list[float]:
+        horizon = time.monotonic() - self.window
+        with self._lock:
+            while self._samples and self._samples[0][0] < horizon:
+                self._samples.popleft()
+            return sorted(seconds for _, seconds in self._samples)
+
+    def as_dict(self) -> dict:
+        """
+        Returns:
+            dict: The number of recent requests and their p50 and p99 latencies
+                  in milliseconds (None without requests).
+        """
+
+        samples = self._recent()
+
+        def percentile(p: float) -> Optional[float]:
+            if not samples:
+                return None
+            position = min(len(samples) - 1, int(p * len(samples)))
+            return round(samples[position] * 1000, 3)
+
+        return {
+            "requests": len(samples),
+            "p50_ms": percentile(0.50),
+            "p99_ms": percentile(0.99),
+        }
+
+
+class LatencyMiddleware:
+    """
+    ASGI middleware recording the latency of every request, from its arrival to
+    the end of its response, in a LatencyWindow read by the readiness check.
+    """
+
+    def __init__(self, app, window: LatencyWindow):
+        self.app = app
+        self.window = window
+
+    async def __call__(self, scope, receive, send):
+        if scope["type"] != "http" or scope["path"].startswith(UNTIMED_PATHS):
+            await self.app(scope, receive, send)
+            return
+        start = time.perf_counter()
+        try:
+            await self.app(scope, receive, send)
+        finally:
+            self.window.record(time.perf_counter() - start)
+
+
+request_latency = LatencyWindow(settings.HEALTH_LATENCY_WINDOW_SECONDS)
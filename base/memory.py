@@ -0,0 +1,153 @@
+import os
+import threading
+import tracemalloc
+from contextlib import contextmanager
+from dataclasses import dataclass
+
+# long-lived streams, which would hold the measurement lock until the client
+# disconnects, leaving every other request unmeasured
+UNTRACKED_PATHS = ("/availability/stream",)
+
+
+@dataclass
+class AllocationSample:
+    """
+    Memory allocated while a block of code ran, in bytes.
+    Attributes:
+        peak (int): The highest amount of memory allocated at any point.
+        retained (int): The memory still allocated when the block finished.
+    """
+
+    peak: int = 0
+    retained: int = 0
+
+
+@contextmanager
+def track_allocations():
+    """
+    Measure the peak and retained allocations of the wrapped block.
+    tracemalloc must be tracing, and the peak is process wide, so blocks
+    running concurrently are counted too.
+    Yields:
+        AllocationSample: Filled in when the block exits.
+    """
+
+    sample = AllocationSample()
+    before = tracemalloc.get_traced_memory()[0]
+    tracemalloc.reset_peak()
+    try:
+        yield sample
+    finally:
+        current, peak = tracemalloc.get_traced_memory()
+        sample.peak = max(peak - before, 0)
+        sample.retained = current - before
+
+
+@dataclass
+class RouteMemoryStats:
+    requests: int = 0
+    peak_max: int = 0
+    peak_total: int = 0
+    retained_max: int = 0
+    retained_total: int = 0
+
+    def add(self, sample: AllocationSample):
+        self.requests += 1
+        self.peak_max = max(self.peak_max, sample.peak)
+        self.peak_total += sample.peak
+        self.retained_max = max(self.retained_max, sample.retained)
+        self.retained_total += sample.retained
+
+    def as_dict(self) -> dict:
+        return {
+            "requests": self.requests,
+            "peak_max_kib": round(self.peak_max / 1024, 2),
+            "peak_avg_kib": round(self.peak_total / self.requests / 1024, 2),
+            "retained_max_kib": round(self.retained_max / 1024, 2),
+            "retained_avg_kib": round(self.retained_total / self.requests / 1024, 2),
+        }
+
+
+class MemoryStats:
+    """
+    Thread safe registry of the allocation statistics of every route.
+    """
+
+    def __init__(self):
+        self._routes: dict[str, RouteMemoryStats] = {}
+        self._lock = threading.Lock()
+
+    def record(self, route: str, sample: AllocationSample):
+        with self._lock:
+            self._routes.setdefault(route, RouteMemoryStats()).add(sample)
+
+    def as_dict(self) -> dict[str, dict]:
+        with self._lock:
+            return {route: stats.as_dict() for route, stats in self._routes.items()}
+
+    def reset(self):
+        with self._lock:
+            self._routes.clear()
+
+
+memory_stats = MemoryStats()
+
+
+def top_allocations(limit: int = 20) -> list[dict]:
+    """
+    Take a tracemalloc snapshot and return the source lines holding the most
+    memory, which points at what the retained memory of the routes is made of.
+    Args:
+        limit (int): The number of source lines to return.
+    Returns:
+        list[dict]: The location, size and number of blocks of every line.
+    """
+
+    snapshot = tracemalloc.take_snapshot().filter_traces(
+        [tracemalloc.Filter(False, tracemalloc.__file__)]
+    )
+    return [
+        {
+            "location": f"{os.path.relpath(stat.traceback[0].filename)}:"
+            f"{stat.traceback[0].lineno}",
+            "size_kib": round(stat.size / 1024, 2),
+            "count": stat.count,
+        }
+        for stat in snapshot.statistics("lineno")[:limit]
+    ]
+
+
+class MemoryTrackingMiddleware:
+    """
+    ASGI middleware recording the peak and retained allocations of every
+    request, keyed by method and route path (e.g. `GET /movies/{id}`).
+    The tracemalloc peak is process wide, so only one request is measured at a
+    time; requests arriving meanwhile are served without being measured.
+    Streaming routes (`UNTRACKED_PATHS`) are never measured.
+    """
+
+    def __init__(self, app, stats: MemoryStats = memory_stats, frames: int = 1):
+        self.app = app
+        self.stats = stats
+        self._lock = threading.Lock()
+        if not tracemalloc.is_tracing():
+            tracemalloc.start(frames)
+
+    async def __call__(self, scope, receive, send):
+        if (
+            scope["type"] != "http"
+            or scope["path"].startswith(UNTRACKED_PATHS)
+            or not self._lock.acquire(blocking=False)
+        ):
+            await self.app(scope, receive, send)
+            return
+
+        try:
+            with track_allocations() as sample:
+                await self.app(scope, receive, send)
+        finally:
+            self._lock.release()
+
+        route = scope.get("route")
+        path = getattr(route, "path", "<unmatched>")
+        self.stats.record(f"{scope['method']} {path}", sample)
@@ -0,0 +1,41 @@
+import base64
+import json
+from typing import Any
+
+
+class InvalidCursor(ValueError):
+    """
+    Raised when a pagination cursor was not produced by `encode_cursor`.
+    """
+
+
+def encode_cursor(*values: Any) -> str:
+    """
+    Encode the sort key of the last item of a page into an opaque cursor.
+    Values must be JSON serializable; datetimes are passed as ISO strings.
+    """
+
+    payload = json.dumps(values, separators=(",", ":")).encode()
+    return base64.urlsafe_b64encode(payload).decode().rstrip("=")
+
+
+def decode_cursor(cursor: str, size: int) -> list:
+    """
+    Decode a cursor produced by `encode_cursor`.
+    Args:
+        cursor (str): The cursor received from the client.
+        size (int): The number of values the cursor must hold.
+    Returns:
+        list: The values of the sort key.
+    Raises:
+        InvalidCursor: If the cursor is malformed.
+    """
+
+    try:
+        padding = "=" * (-len(cursor) % 4)
+        values = json.loads(base64.urlsafe_b64decode(cursor + padding))
+    except ValueError as exc:
+        raise InvalidCursor(cursor) from exc
+    if not isinstance(values, list) or len(values) != size:
+        raise InvalidCursor(cursor)
+    return values
@@ -0,0 +1,67 @@
+from typing import Any, Iterable, Optional
+
+from sqlalchemy.orm import SessionTransaction
+from sqlmodel import Session
+
+# Work queued by the writes of a transaction, such as events to publish or
+# in-memory indexes to update, is applied once the transaction is committed.
+# SQLAlchemy also fires `before_commit` / `after_commit` when a SAVEPOINT is
+# released and `after_rollback` when one is rolled back, as done for every
+# operation of the group commit writer (base/write_pipeline.py). Queued items
+# are therefore tagged with the savepoint they were queued in: the hooks skip
+# savepoint releases, and a savepoint rollback only discards its own items.
+
+
+def add_pending(session: Session, key: str, items: Iterable[Any]):
+    """
+    Queue items under a `session.info` key until the transaction is committed.
+    """
+
+    savepoint = session.get_nested_transaction()
+    session.info.setdefault(key, []).extend((savepoint, item) for item in items)
+
+
+def is_savepoint(session: Session) -> bool:
+    """
+    Return whether a `before_commit`, `after_commit` or `after_rollback` hook
+    runs for a SAVEPOINT rather than the transaction itself.
+    """
+
+    return session.in_nested_transaction()
+
+
+def pop_pending(session: Session, key: str) -> list:
+    """
+    Remove and return the items queued under a key, to be applied in an
+    `after_commit` hook, or an empty list on savepoint releases.
+    """
+
+    if is_savepoint(session):
+        return []
+    return [item for _, item in session.info.pop(key, ())]
+
+
+def discard_pending(session: Session, key: str):
+    """
+    Discard, in an `after_rollback` hook, the items queued in the savepoint
+    rolled back, or every item when the transaction itself is rolled back.
+    """
+
+    savepoint = session.get_nested_transaction()
+    if savepoint is None:
+        session.info.pop(key, None)
+        return
+    if key in session.info:
+        session.info[key] = [
+            (tag, item)
+            for tag, item in session.info[key]
+            if not _within(tag, savepoint)
+        ]
+
+
+def _within(tag: Optional[SessionTransaction], savepoint: SessionTransaction) -> bool:
+    while tag is not None:
+        if tag is savepoint:
+            return True
+        tag = tag.parent
+    return False
@@ -0,0 +1,122 @@
+import cProfile
+import io
+import os
+import pstats
+import random
+import re
+import threading
+import time
+import uuid
+
+PROFILE_HEADER = b"x-profile"
+
+# long-lived streams, whose response would be held in the buffer until the
+# client disconnects, blocking every other profile meanwhile
+UNPROFILED_PATHS = ("/availability/stream",)
+
+
+class ProfilingMiddleware:
+    """
+    ASGI middleware that profiles single requests with cProfile.
+    A request is profiled when it carries an `X-Profile` header with the
+    configured token, or when it is picked by the sample rate. The profile is
+    dumped to `directory` (open it with `python -m pstats` or snakeviz) and the
+    response gets three headers:
+        X-Profile-Id: the name of the dumped profile file.
+        X-Profile-Summary: the functions with the most internal time.
+        Server-Timing: the wall time of the request.
+    The views run their repository calls on the event loop thread, which is the
+    thread being profiled, so validation, ORM loads and response encoding all
+    show up. Only one request is profiled at a time: other coroutines share the
+    thread and would otherwise pollute the profile. The middleware is only
+    installed when profiling is configured, so it costs nothing when disabled.
+    Streaming routes (`UNPROFILED_PATHS`) are never profiled.
+    """
+
+    def __init__(
+        self,
+        app,
+        directory: str,
+        token: str | None = None,
+        sample_rate: float = 0.0,
+        summary_size: int = 5,
+    ):
+        self.app = app
+        self.directory = directory
+        self.token = token.encode() if token else None
+        self.sample_rate = sample_rate
+        self.summary_size = summary_size
+        self._lock = threading.Lock()
+
+    def _wants_profile(self, scope) -> bool:
+        if self.token is not None:
+            for name, value in scope["headers"]:
+                if name == PROFILE_HEADER and value == self.token:
+                    return True
+        return self.sample_rate > 0 and random.random() < self.sample_rate
+
+    async def __call__(self, scope, receive, send):
+        if (
+            scope["type"] != "http"
+            or scope["path"].startswith(UNPROFILED_PATHS)
+            or not self._wants_profile(scope)
+        ):
+            await self.app(scope, receive, send)
+            return
+        if not self._lock.acquire(blocking=False):
+            await self.app(scope, receive, send)
+            return
+
+        messages = []
+
+        async def buffer_send(message):
+            messages.append(message)
+
+        profiler = cProfile.Profile()
+        start = time.perf_counter()
+        try:
+            profiler.enable()
+            try:
+                await self.app(scope, receive, buffer_send)
+            finally:
+                profiler.disable()
+            elapsed = (time.perf_counter() - start) * 1000
+            headers = self._profile_headers(scope, profiler, elapsed)
+        finally:
+            self._lock.release()
+
+        for message in messages:
+            if message["type"] == "http.response.start":
+                message = {**message, "headers": [*message["headers"], *headers]}
+            await send(message)
+
+    def _profile_headers(self, scope, profiler: cProfile.Profile, elapsed: float):
+        os.makedirs(self.directory, exist_ok=True)
+        path = re.sub(r"[^A-Za-z0-9]+", "_", scope["path"]).strip("_") or "root"
+        profile_id = (
+            f"{int(time.time())}-{scope['method']}-{path}-{uuid.uuid4().hex[:8]}"
+        )
+        profiler.dump_stats(os.path.join(self.directory, f"{profile_id}.prof"))
+
+        return [
+            (b"x-profile-id", f"{profile_id}.prof".encode()),
+            (b"x-profile-summary", self.summary(profiler).encode()),
+            (b"server-timing", f"app;dur={elapsed:.2f}".encode()),
+        ]
+
+    def summary(self, profiler: cProfile.Profile) -> str:
+        """
+        Summarize the functions of a profile with the most internal time (time
+        spent in the function itself, excluding its callees), as
+        `file:line(function)=milliseconds` entries separated by `; `.
+        """
+
+        stats = pstats.Stats(profiler, stream=io.StringIO())
+        stats.sort_stats(pstats.SortKey.TIME)
+        entries = []
+        for function in stats.fcn_list[: self.summary_size]:  # type: ignore
+            file, line, name = function
+            internal_time = stats.stats[function][2]  # type: ignore
+            file = os.path.basename(file)
+            entries.append(f"{file}:{line}({name})={internal_time * 1000:.2f}")
+        return "; ".join(entries)
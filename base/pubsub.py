@@ -0,0 +1,116 @@
+import asyncio
+import threading
+from dataclasses import asdict, dataclass
+from typing import Any, Iterable, Optional
+
+
+@dataclass
+class PubSubMetrics:
+    """
+    Attributes:
+        published (int): The events published.
+        delivered (int): The events queued for a subscriber.
+        dropped (int): The events dropped because a subscriber queue was full.
+    """
+
+    published: int = 0
+    delivered: int = 0
+    dropped: int = 0
+
+    def as_dict(self) -> dict:
+        return asdict(self)
+
+
+class Subscription:
+    """
+    Bounded queue of the events of the topics a subscriber follows.
+    When the subscriber does not keep up, the oldest events are dropped and
+    counted in `lagged`, so a slow client never holds memory or slows down the
+    publishers; it can resync when it sees that it lagged.
+    """
+
+    def __init__(
+        self,
+        topics: Optional[set[str]],
+        maxsize: int,
+        loop: asyncio.AbstractEventLoop,
+    ):
+        self.topics = topics
+        self.loop = loop
+        self.lagged = 0
+        self._queue: asyncio.Queue = asyncio.Queue(maxsize)
+
+    def matches(self, topics: Iterable[str]) -> bool:
+        return self.topics is None or not self.topics.isdisjoint(topics)
+
+    def _put(self, event: Any, metrics: PubSubMetrics):
+        # runs in the loop of the subscriber
+        if self._queue.full():
+            self._queue.get_nowait()
+            self.lagged += 1
+            metrics.dropped += 1
+        self._queue.put_nowait(event)
+        metrics.delivered += 1
+
+    async def get(self) -> Any:
+        return await self._queue.get()
+
+
+class PubSub:
+    """
+    In-process publish/subscribe of events by topic.
+    `publish` can be called from any thread: events are handed to the loop of
+    every matching subscriber, which queues them without blocking the publisher.
+    """
+
+    def __init__(self, queue_size: int = 100, max_subscribers: int = 1000):
+        self.queue_size = queue_size
+        self.max_subscribers = max_subscribers
+        self.metrics = PubSubMetrics()
+        self._subscriptions: set[Subscription] = set()
+        self._lock = threading.Lock()
+
+    @property
+    def subscribers(self) -> int:
+        return len(self._subscriptions)
+
+    def subscribe(
+        self,
+        topics: Optional[Iterable[str]] = None,
+        loop: Optional[asyncio.AbstractEventLoop] = None,
+    ) -> Optional[Subscription]:
+        """
+        Follow the events of some topics, all of them by default.
+        Returns:
+            Optional[Subscription]: The subscription, None when the maximum
+                                    number of subscribers is reached.
+        """
+
+        subscription = Subscription(
+            set(topics) if topics is not None else None,
+            self.queue_size,
+            loop or asyncio.get_running_loop(),
+        )
+        with self._lock:
+            if len(self._subscriptions) >= self.max_subscribers:
+                return None
+            self._subscriptions.add(subscription)
+        return subscription
+
+    def unsubscribe(self, subscription: Subscription):
+        with self._lock:
+            self._subscriptions.discard(subscription)
+
+    def publish(self, topics: Iterable[str], event: Any):
+        topics = set(topics)
+        with self._lock:
+            subscriptions = [s for s in self._subscriptions if s.matches(topics)]
+        self.metrics.published += 1
+        for subscription in subscriptions:
+            try:
+                subscription.loop.call_soon_threadsafe(
+                    subscription._put, event, self.metrics
+                )
+            except RuntimeError:
+                # the loop of the subscriber is closed
+                self.unsubscribe(subscription)
@@ -1,12 +1,269 @@
+import inspect
 from abc import ABC, abstractmethod
-from typing import TypeVar, Generic
+from dataclasses import dataclass, field
+from datetime import date, datetime
+from typing import (
+    Any,
+    Callable,
+    ClassVar,
+    Generic,
+    Mapping,
+    Optional,
+    Sequence,
+    TypeVar,
+    cast,
+)
+
+from fastapi import HTTPException, Request, Response
+from fastapi.encoders import jsonable_encoder
+from fastapi.responses import JSONResponse
+from sqlalchemy import Column, Select, Table, select
+from sqlalchemy import inspect as sa_inspect
+from sqlalchemy.sql.base import ExecutableOption
+from sqlmodel import SQLModel
 
 from base.db_connection import SessionDep
+from base.tracing import traced
+
+# Session.info flag set on sessions whose transaction is committed by someone
+# else, such as the group commit writer of base/write_pipeline.py.
+DEFERRED_COMMIT = "deferred_commit"
 
 # Declare type variable
 T = TypeVar("T")
 U = TypeVar("U")
 
+# Maximum number of ids of a batch lookup, and of ids per IN query, well
+# below the SQLite limit of bound parameters.
+MAX_BATCH_IDS = 1000
+IN_CHUNK_SIZE = 500
+
+# Query string suffixes of the filter operators, e.g. `year__gte=2000`.
+FILTER_OPERATORS: dict[str, Callable[[Column, Any], Any]] = {
+    "eq": lambda column, value: column == value,
+    "gt": lambda column, value: column > value,
+    "gte": lambda column, value: column >= value,
+    "lt": lambda column, value: column < value,
+    "lte": lambda column, value: column <= value,
+    "in": lambda column, value: column.in_(value),
+}
+
+
+def model_table(model: type[SQLModel]) -> Table:
+    """
+    Return the table of a model class, typed for the type checker.
+    """
+
+    return cast(Table, sa_inspect(model, raiseerr=True).local_table)
+
+
+class InvalidQuery(ValueError):
+    """
+    Raised when a query spec uses an unknown or non-indexed column, an unknown
+    operator or a value of the wrong type.
+    """
+
+
+@dataclass
+class FieldFilter:
+    field: str
+    operator: str
+    value: Any
+
+
+@dataclass
+class QuerySpec:
+    """
+    Filters, sort keys, projection and page of a list query.
+    Filters and sort keys may only use indexed columns (the primary key and the
+    leading column of an index), so a client can never trigger a full scan or
+    a full sort; any column can be projected.
+    Attributes:
+        filters (list[FieldFilter]): Combined with AND.
+        sort (list[tuple[str, bool]]): (field, descending) pairs.
+        fields (Optional[list[str]]): The columns to select, all by default.
+        limit (Optional[int]): The maximum number of rows.
+        offset (int): The number of rows skipped.
+    """
+
+    filters: list[FieldFilter] = field(default_factory=list)
+    sort: list[tuple[str, bool]] = field(default_factory=list)
+    fields: Optional[list[str]] = None
+    limit: Optional[int] = None
+    offset: int = 0
+
+    def __bool__(self) -> bool:
+        return bool(
+            self.filters
+            or self.sort
+            or self.fields
+            or self.limit is not None
+            or self.offset
+        )
+
+    @classmethod
+    def from_params(cls, params: Mapping[str, str], reserved=()) -> "QuerySpec":
+        """
+        Parse a query string such as
+        `genre_id=3&year__gte=2000&id__in=1,2,3&sort=-year,title&fields=id,title`.
+        Args:
+            params (Mapping[str, str]): The query parameters.
+            reserved (Iterable[str]): Parameters handled by the view itself.
+        Returns:
+            QuerySpec: The spec, with the values still as strings.
+        Raises:
+            InvalidQuery: If an operator or the page is invalid.
+        """
+
+        spec = cls()
+        for name, value in params.items():
+            if name in reserved:
+                continue
+            if name == "sort":
+                spec.sort = [
+                    (key.lstrip("-"), key.startswith("-"))
+                    for key in value.split(",")
+                    if key
+                ]
+            elif name == "fields":
+                spec.fields = [key for key in value.split(",") if key]
+            elif name in ("limit", "offset"):
+                try:
+                    number = int(value)
+                except ValueError:
+                    raise InvalidQuery(f"{name} must be an integer")
+                if number < 0:
+                    raise InvalidQuery(f"{name} must not be negative")
+                setattr(spec, name, number)
+            else:
+                field_name, _, operator = name.partition("__")
+                operator = operator or "eq"
+                if operator not in FILTER_OPERATORS:
+                    raise InvalidQuery(f"Unknown operator: {operator}")
+                parsed: Any = value.split(",") if operator == "in" else value
+                spec.filters.append(FieldFilter(field_name, operator, parsed))
+        return spec
+
+    def compile(self, model: type[SQLModel], *conditions) -> Select:
+        """
+        Compile the spec into one SELECT of the requested columns of the table
+        of a model, converting the filter values to the column types.
+        `conditions` are extra WHERE clauses added by the repository.
+        Raises:
+            InvalidQuery: If a column is unknown or not indexed, or a value does
+                          not match the type of its column.
+        """
+
+        table = model_table(model)
+        indexed = _indexed_columns(table)
+
+        def column(name: str, purpose: str) -> Column:
+            if name not in table.columns:
+                raise InvalidQuery(f"Unknown field: {name}")
+            if purpose != "projection" and name not in indexed:
+                raise InvalidQuery(
+                    f"Field {name} is not indexed and cannot be used for {purpose}"
+                    f", indexed fields: {', '.join(sorted(indexed))}"
+                )
+            return table.columns[name]
+
+        columns = [column(name, "projection") for name in self.fields or ()]
+        statement = select(*(columns or table.columns)).where(*conditions)
+        for spec_filter in self.filters:
+            filter_column = column(spec_filter.field, "filtering")
+            value = spec_filter.value
+            if isinstance(value, list):
+                value = [_convert(filter_column, item) for item in value]
+            else:
+                value = _convert(filter_column, value)
+            statement = statement.where(
+                FILTER_OPERATORS[spec_filter.operator](filter_column, value)
+            )
+        for name, descending in self.sort:
+            sort_column = column(name, "sorting")
+            statement = statement.order_by(
+                sort_column.desc() if descending else sort_column
+            )
+        if self.limit is not None:
+            statement = statement.limit(self.limit)
+        if self.offset:
+            statement = statement.offset(self.offset)
+        return statement
+
+
+def _indexed_columns(table) -> set[str]:
+    # only the leading column of an index can be used on its own
+    indexed = {column.name for column in table.primary_key.columns}
+    for index in table.indexes:
+        indexed.add(index.columns.values()[0].name)
+    return indexed
+
+
+def _convert(column: Column, value: Any) -> Any:
+    if not isinstance(value, str):
+        return value
+    try:
+        python_type = column.type.python_type
+    except NotImplementedError:
+        return value
+    try:
+        if python_type is bool:
+            if value.lower() not in ("true", "false", "1", "0"):
+                raise ValueError(value)
+            return value.lower() in ("true", "1")
+        if python_type in (datetime, date):
+            return python_type.fromisoformat(value)
+        return python_type(value)
+    except ValueError:
+        raise InvalidQuery(f"Invalid value for {column.name}: {value}")
+
+
+def query_spec(*reserved: str):
+    """
+    Create a dependency that parses the query string of a list route into a
+    QuerySpec, ignoring the parameters the route declares itself.
+    Raises:
+        HTTPException: 400 if the query string is invalid.
+    """
+
+    def dependency(request: Request) -> QuerySpec:
+        try:
+            return QuerySpec.from_params(request.query_params, reserved)
+        except InvalidQuery as exc:
+            raise HTTPException(status_code=400, detail=str(exc))
+
+    return dependency
+
+
+def parse_ids(ids: str) -> list[int]:
+    """
+    Parse the comma separated `ids` parameter of a batch lookup.
+    Raises:
+        HTTPException: 400 if an id is not an integer or there are too many.
+    """
+
+    try:
+        parsed = [int(id) for id in ids.split(",") if id.strip()]
+    except ValueError:
+        raise HTTPException(status_code=400, detail="ids must be integers")
+    if len(parsed) > MAX_BATCH_IDS:
+        raise HTTPException(
+            status_code=400, detail=f"At most {MAX_BATCH_IDS} ids can be requested"
+        )
+    return parsed
+
+
+def query_response(rows: Callable[[], list[dict]]) -> Response:
+    """
+    Serialize the rows of a repository query, or answer 400 if the query spec
+    is invalid.
+    """
+
+    try:
+        return JSONResponse(jsonable_encoder(rows()))
+    except InvalidQuery as exc:
+        raise HTTPException(status_code=400, detail=str(exc))
+
 
 class Repository(Generic[T], ABC):
     """
@@ -15,12 +272,81 @@ class Repository(Generic[T], ABC):
     that any repository implementation should provide. It is designed to work
     with a specific type `T` and requires a session dependency for database
     operations.
+    Subclasses set `model` to get `query`, which runs a QuerySpec on its table.
+    The public methods of every subclass are traced, see base/tracing.py.
     """
 
+    model: ClassVar[type[SQLModel]]
+
+    def __init_subclass__(cls, **kwargs):
+        super().__init_subclass__(**kwargs)
+        for name, attribute in list(vars(cls).items()):
+            if (
+                inspect.isfunction(attribute)
+                and not name.startswith("_")
+                and not getattr(attribute, "__isabstractmethod__", False)
+            ):
+                setattr(cls, name, traced(attribute, f"{cls.__name__}.{name}"))
+
     def __init__(self, session: SessionDep):
         self.session = session
         super().__init__()
 
+    @traced
+    def commit(self):
+        """
+        Commit the transaction of the session. When the session is flagged with
+        `DEFERRED_COMMIT`, changes are only flushed, so they get ids and can be
+        refreshed, and the owner of the session commits them later.
+        """
+
+        if self.session.info.get(DEFERRED_COMMIT):
+            self.session.flush()
+        else:
+            self.session.commit()
+
+    @traced
+    def get_many(self, ids: Sequence[int], *options: ExecutableOption) -> list[T]:
+        """
+        Retrieve the objects of several ids with one IN query (per 500 ids).
+        Args:
+            ids (Sequence[int]): The ids to retrieve.
+            *options: Loader options, e.g. `selectinload` of relationships.
+        Returns:
+            list[T]: The objects in the order of `ids`, once each; ids without
+                     an object are skipped.
+        """
+
+        ids = list(dict.fromkeys(ids))
+        primary_key = model_table(self.model).primary_key.columns.values()[0]
+        found = {}
+        for start in range(0, len(ids), IN_CHUNK_SIZE):
+            statement: Select = (
+                select(self.model)
+                .where(primary_key.in_(ids[start : start + IN_CHUNK_SIZE]))
+                .options(*options)
+            )
+            for instance in self.session.exec(statement).scalars():  # type: ignore[call-overload]
+                found[getattr(instance, primary_key.name)] = instance
+        return [found[id] for id in ids if id in found]
+
+    @traced
+    def query(self, spec: QuerySpec, *conditions) -> list[dict]:
+        """
+        Run a query spec on the table of the repository.
+        Args:
+            spec (QuerySpec): The filters, sort keys, projection and page.
+            *conditions: Extra WHERE clauses added by subclasses.
+        Returns:
+            list[dict]: One dictionary per row with the requested columns.
+        Raises:
+            InvalidQuery: If the spec uses an unknown or non-indexed column.
+        """
+
+        statement = spec.compile(self.model, *conditions)
+        rows = self.session.exec(statement)  # type: ignore[call-overload]
+        return [dict(row._mapping) for row in rows]
+
     @abstractmethod
     def get(self, id: int) -> T:
         """
@@ -0,0 +1,244 @@
+import asyncio
+import random
+import threading
+import time
+from contextvars import ContextVar
+from dataclasses import dataclass
+from typing import Any, Callable, Optional
+
+from sqlalchemy.exc import OperationalError
+from sqlmodel import Session
+from starlette.requests import Request
+from starlette.responses import JSONResponse
+
+from base import settings
+
+# monotonic time by which the current request must be answered, see
+# DeadlineMiddleware; None outside requests
+request_deadline: ContextVar[Optional[float]] = ContextVar(
+    "request_deadline", default=None
+)
+
+DEADLINE_HEADER = b"x-request-timeout"
+
+# long-lived responses, which have no deadline
+NO_DEADLINE_PATHS = ("/availability/stream",)
+
+# SQLite messages of the transient errors worth retrying
+LOCK_ERRORS = ("database is locked", "database table is locked")
+
+
+class DeadlineExceeded(Exception):
+    """
+    Raised when the time budget of the request is spent, before or while
+    running a database operation.
+    """
+
+
+def remaining() -> Optional[float]:
+    """
+    Return the seconds left before the deadline of the current request, or None
+    without deadline.
+    """
+
+    deadline = request_deadline.get()
+    return None if deadline is None else deadline - time.monotonic()
+
+
+def check_deadline():
+    """
+    Raises:
+        DeadlineExceeded: If the deadline of the current request has passed.
+    """
+
+    left = remaining()
+    if left is not None and left <= 0:
+        raise DeadlineExceeded()
+
+
+def is_lock_error(exc: BaseException) -> bool:
+    return isinstance(exc, OperationalError) and any(
+        message in str(exc.orig) for message in LOCK_ERRORS
+    )
+
+
+def is_interrupted(exc: BaseException) -> bool:
+    # raised by SQLite when the progress handler aborts a query
+    return isinstance(exc, OperationalError) and "interrupted" in str(exc.orig)
+
+
+def interrupt_after_deadline() -> int:
+    """
+    SQLite progress handler aborting the running query once the deadline of the
+    request running it has passed. It runs on the thread executing the query,
+    which sees the context of the request.
+    """
+
+    deadline = request_deadline.get()
+    return int(deadline is not None and time.monotonic() > deadline)
+
+
+@dataclass
+class RetryMetrics:
+    """
+    Attributes:
+        retries (int): The operations run again after a lock error.
+        recovered (int): The operations that succeeded after retrying.
+        exhausted (int): The operations that failed after the last attempt.
+        deadline_exceeded (int): The operations stopped by the deadline.
+    """
+
+    retries: int = 0
+    recovered: int = 0
+    exhausted: int = 0
+    deadline_exceeded: int = 0
+
+    def as_dict(self) -> dict:
+        return {
+            "retries": self.retries,
+            "recovered": self.recovered,
+            "exhausted": self.exhausted,
+            "deadline_exceeded": self.deadline_exceeded,
+        }
+
+
+class RetryPolicy:
+    """
+    Retry of database operations failing with a transient lock error.
+    The delay before attempt n is drawn uniformly between 0 and
+    `min(max_delay, base_delay * 2 ** n)` ("full jitter"), so writers that
+    collided do not collide again, and is cut to the time left before the
+    deadline of the request: once it is spent, no more attempts are made.
+    """
+
+    def __init__(self, attempts: int, base_delay: float, max_delay: float):
+        self.attempts = attempts
+        self.base_delay = base_delay
+        self.max_delay = max_delay
+        self.metrics = RetryMetrics()
+        self._lock = threading.Lock()
+
+    def _count(self, name: str):
+        with self._lock:
+            setattr(self.metrics, name, getattr(self.metrics, name) + 1)
+
+    def next_delay(self, attempt: int, exc: BaseException) -> float:
+        """
+        Return the delay before the next attempt, or raise when no attempt is
+        left: `exc` once the attempts are used up, DeadlineExceeded once the
+        deadline is too close.
+        """
+
+        if isinstance(exc, DeadlineExceeded) or is_interrupted(exc):
+            self._count("deadline_exceeded")
+            raise DeadlineExceeded() from exc
+        if attempt + 1 >= self.attempts:
+            self._count("exhausted")
+            raise exc
+        delay = random.uniform(0, min(self.max_delay, self.base_delay * 2**attempt))
+        left = remaining()
+        if left is not None and left <= delay:
+            self._count("deadline_exceeded")
+            raise DeadlineExceeded() from exc
+        self._count("retries")
+        return delay
+
+    def run(self, session: Session, operation: Callable[[Session], Any]) -> Any:
+        """
+        Run a write operation on a session, rolling back and running it again
+        after a lock error. Blocks the thread between attempts.
+        """
+
+        for attempt in range(self.attempts):
+            check_deadline()
+            try:
+                result = operation(session)
+            except Exception as exc:
+                if not (is_lock_error(exc) or is_interrupted(exc)):
+                    raise
+                session.rollback()
+                time.sleep(self.next_delay(attempt, exc))
+                continue
+            if attempt:
+                self._count("recovered")
+            return result
+
+    async def run_async(
+        self, session: Session, operation: Callable[[Session], Any]
+    ) -> Any:
+        """
+        Same as `run`, but waits between attempts without blocking the event
+        loop.
+        """
+
+        for attempt in range(self.attempts):
+            check_deadline()
+            try:
+                result = operation(session)
+            except Exception as exc:
+                if not (is_lock_error(exc) or is_interrupted(exc)):
+                    raise
+                session.rollback()
+                await asyncio.sleep(self.next_delay(attempt, exc))
+                continue
+            if attempt:
+                self._count("recovered")
+            return result
+
+
+db_retry = RetryPolicy(
+    settings.DB_RETRY_ATTEMPTS,
+    settings.DB_RETRY_BASE_DELAY_MS / 1000,
+    settings.DB_RETRY_MAX_DELAY_MS / 1000,
+)
+
+
+class DeadlineMiddleware:
+    """
+    ASGI middleware giving every request a deadline: `default` seconds, or the
+    budget sent by the client in an `X-Request-Timeout` header (in seconds, at
+    most `maximum`). Retries wait no longer than the deadline and the SQLite
+    progress handler aborts the queries still running after it. Streams are
+    left without deadline.
+    """
+
+    def __init__(self, app, default: float, maximum: float):
+        self.app = app
+        self.default = default
+        self.maximum = maximum
+
+    def _budget(self, scope) -> float:
+        for name, value in scope["headers"]:
+            if name == DEADLINE_HEADER:
+                try:
+                    return min(max(float(value), 0), self.maximum)
+                except ValueError:
+                    break
+        return self.default
+
+    async def __call__(self, scope, receive, send):
+        if scope["type"] != "http" or scope["path"].startswith(NO_DEADLINE_PATHS):
+            await self.app(scope, receive, send)
+            return
+        token = request_deadline.set(time.monotonic() + self._budget(scope))
+        try:
+            await self.app(scope, receive, send)
+        finally:
+            request_deadline.reset(token)
+
+
+async def database_error_handler(request: Request, exc: Exception) -> JSONResponse:
+    """
+    Answer 504 when the deadline of the request stopped a database operation,
+    and 503 with Retry-After when a lock error outlived the retries.
+    """
+
+    if isinstance(exc, DeadlineExceeded) or is_interrupted(exc):
+        return JSONResponse({"detail": "Request deadline exceeded"}, status_code=504)
+    if is_lock_error(exc):
+        return JSONResponse(
+            {"detail": "Database busy, retry later"},
+            status_code=503,
+            headers={"Retry-After": "1"},
+        )
+    raise exc
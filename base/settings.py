@@ -0,0 +1,120 @@
+import os
+
+
+def _env_bool(name: str, default: bool = False) -> bool:
+    return os.environ.get(name, str(default)).lower() in ("1", "true", "yes")
+
+
+# Per-request profiling, see base/profiling.py. The middleware is only
+# installed when a token or a sample rate is configured.
+PROFILING_TOKEN = os.environ.get("PROFILING_TOKEN")
+PROFILING_SAMPLE_RATE = float(os.environ.get("PROFILING_SAMPLE_RATE", "0"))
+PROFILING_DIR = os.environ.get("PROFILING_DIR", "./profiles")
+
+# Request tracing, see base/tracing.py. Installed when an exporter is set:
+# "file" appends OTLP/JSON traces to TRACING_FILE, "console" prints span trees.
+# Requests are traced at the sample rate, or when their traceparent header
+# asks for it.
+TRACING_EXPORTER = os.environ.get("TRACING_EXPORTER", "")
+TRACING_FILE = os.environ.get("TRACING_FILE", "./traces.jsonl")
+TRACING_SAMPLE_RATE = float(os.environ.get("TRACING_SAMPLE_RATE", "0.01"))
+
+# Per-route allocation tracking with tracemalloc, see base/memory.py. Tracing
+# slows every allocation down, so it is meant for diagnostics sessions.
+MEMORY_TRACKING_ENABLED = _env_bool("MEMORY_TRACKING_ENABLED")
+MEMORY_TRACKING_FRAMES = int(os.environ.get("MEMORY_TRACKING_FRAMES", "1"))
+
+# Connection pools of base/db_connection.py. SQLite has a single writer, so the
+# read-write pool is kept small; read-only connections scale with the cores.
+DB_READ_POOL_SIZE = int(os.environ.get("DB_READ_POOL_SIZE", os.cpu_count() or 4))
+DB_WRITE_POOL_SIZE = int(os.environ.get("DB_WRITE_POOL_SIZE", "2"))
+DB_WRITE_POOL_OVERFLOW = int(os.environ.get("DB_WRITE_POOL_OVERFLOW", "2"))
+
+# Schema creation at startup, see base/db_connection.py sync_schema: "auto"
+# skips it when the database was created from the same models, "always" runs
+# it on every boot, "never" leaves the schema to the deployment.
+SCHEMA_SYNC = os.environ.get("SCHEMA_SYNC", "auto")
+
+# SQLite waits this long for a lock before raising "database is locked"; the
+# writes are then retried with jittered backoff, see base/retry.py.
+DB_BUSY_TIMEOUT_SECONDS = float(os.environ.get("DB_BUSY_TIMEOUT_SECONDS", "1"))
+DB_RETRY_ATTEMPTS = int(os.environ.get("DB_RETRY_ATTEMPTS", "5"))
+DB_RETRY_BASE_DELAY_MS = float(os.environ.get("DB_RETRY_BASE_DELAY_MS", "20"))
+DB_RETRY_MAX_DELAY_MS = float(os.environ.get("DB_RETRY_MAX_DELAY_MS", "500"))
+
+# Time budget of a request, see base/retry.py. Clients can ask for another one
+# with an X-Request-Timeout header, up to the maximum.
+REQUEST_TIMEOUT_SECONDS = float(os.environ.get("REQUEST_TIMEOUT_SECONDS", "10"))
+REQUEST_TIMEOUT_MAX_SECONDS = float(os.environ.get("REQUEST_TIMEOUT_MAX_SECONDS", "60"))
+
+# Group commit of the mutating routes, see base/write_pipeline.py. Writes
+# arriving within the window are committed in one transaction.
+WRITE_PIPELINE_ENABLED = _env_bool("WRITE_PIPELINE_ENABLED")
+WRITE_PIPELINE_WINDOW_MS = float(os.environ.get("WRITE_PIPELINE_WINDOW_MS", "2"))
+WRITE_PIPELINE_MAX_BATCH = int(os.environ.get("WRITE_PIPELINE_MAX_BATCH", "64"))
+
+# Idempotency-Key support of the transactional POST routes, see
+# base/idempotency.py.
+IDEMPOTENCY_TTL_SECONDS = int(os.environ.get("IDEMPOTENCY_TTL_SECONDS", "86400"))
+IDEMPOTENCY_WAIT_SECONDS = float(os.environ.get("IDEMPOTENCY_WAIT_SECONDS", "10"))
+
+# Single-flight coalescing of hot read routes, see base/single_flight.py.
+SINGLE_FLIGHT_TIMEOUT_SECONDS = float(
+    os.environ.get("SINGLE_FLIGHT_TIMEOUT_SECONDS", "5")
+)
+
+# "Clients who rented this also rented" index, see recommendations/engine.py.
+# It is built in the background at startup and rebuilt every interval to fold
+# in the deleted and edited rents.
+RECOMMENDATIONS_ENABLED = _env_bool("RECOMMENDATIONS_ENABLED", True)
+RECOMMENDATIONS_TOP_K = int(os.environ.get("RECOMMENDATIONS_TOP_K", "10"))
+RECOMMENDATIONS_REBUILD_SECONDS = float(
+    os.environ.get("RECOMMENDATIONS_REBUILD_SECONDS", "3600")
+)
+
+# Minimum share of the trigrams of a query a title or director must contain to
+# be suggested by GET /movies/suggest, see search/index.py.
+SEARCH_MIN_SCORE = float(os.environ.get("SEARCH_MIN_SCORE", "0.3"))
+# Every worker keeps its own index, refreshed from the change feed at this
+# interval with the movies written through the other workers.
+SEARCH_REFRESH_SECONDS = float(os.environ.get("SEARCH_REFRESH_SECONDS", "5"))
+
+# Admission control of the movies, clients and movie_rents routers, see
+# base/admission.py. Reads and writes of every router get their own limit of
+# concurrent requests and of queued requests; the excess is answered 503.
+# ADMISSION_LIMITS overrides single limits, e.g. "movie_rents.write=4/16".
+ADMISSION_CONTROL_ENABLED = _env_bool("ADMISSION_CONTROL_ENABLED", True)
+ADMISSION_READ_CONCURRENCY = int(os.environ.get("ADMISSION_READ_CONCURRENCY", "64"))
+ADMISSION_READ_QUEUE = int(os.environ.get("ADMISSION_READ_QUEUE", "256"))
+ADMISSION_WRITE_CONCURRENCY = int(os.environ.get("ADMISSION_WRITE_CONCURRENCY", "8"))
+ADMISSION_WRITE_QUEUE = int(os.environ.get("ADMISSION_WRITE_QUEUE", "64"))
+ADMISSION_QUEUE_TIMEOUT_SECONDS = float(
+    os.environ.get("ADMISSION_QUEUE_TIMEOUT_SECONDS", "2")
+)
+ADMISSION_RETRY_AFTER_SECONDS = int(
+    os.environ.get("ADMISSION_RETRY_AFTER_SECONDS", "1")
+)
+ADMISSION_LIMITS = os.environ.get("ADMISSION_LIMITS", "")
+
+# Readiness thresholds of GET /health/ready, see health/services.py. The p99
+# latency is only judged over windows with at least HEALTH_MIN_REQUESTS.
+HEALTH_DB_TIMEOUT_SECONDS = float(os.environ.get("HEALTH_DB_TIMEOUT_SECONDS", "1"))
+HEALTH_MAX_POOL_SATURATION = float(os.environ.get("HEALTH_MAX_POOL_SATURATION", "0.95"))
+HEALTH_MAX_P99_MS = float(os.environ.get("HEALTH_MAX_P99_MS", "2000"))
+HEALTH_MIN_REQUESTS = int(os.environ.get("HEALTH_MIN_REQUESTS", "20"))
+HEALTH_LATENCY_WINDOW_SECONDS = float(
+    os.environ.get("HEALTH_LATENCY_WINDOW_SECONDS", "60")
+)
+
+# Maximum number of calls of a /batch request, see batch/services.py.
+BATCH_MAX_REQUESTS = int(os.environ.get("BATCH_MAX_REQUESTS", "50"))
+
+# Live availability stream, see availability/. Every subscriber has a bounded
+# queue; a heartbeat comment keeps idle connections open through proxies.
+AVAILABILITY_QUEUE_SIZE = int(os.environ.get("AVAILABILITY_QUEUE_SIZE", "100"))
+AVAILABILITY_MAX_SUBSCRIBERS = int(
+    os.environ.get("AVAILABILITY_MAX_SUBSCRIBERS", "1000")
+)
+AVAILABILITY_HEARTBEAT_SECONDS = float(
+    os.environ.get("AVAILABILITY_HEARTBEAT_SECONDS", "15")
+)
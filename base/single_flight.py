@@ -0,0 +1,98 @@
+import asyncio
+from dataclasses import asdict, dataclass
+from typing import Any, Callable, Hashable
+
+from fastapi.concurrency import run_in_threadpool
+
+
+class SingleFlightTimeout(Exception):
+    """
+    Raised when the shared call of a key takes longer than the caller's timeout.
+    """
+
+
+@dataclass
+class SingleFlightMetrics:
+    """
+    Attributes:
+        calls (int): The calls received.
+        executions (int): The calls that ran the function, the others joined one.
+        timeouts (int): The calls that gave up waiting.
+        errors (int): The executions that raised.
+    """
+
+    calls: int = 0
+    executions: int = 0
+    timeouts: int = 0
+    errors: int = 0
+
+    def as_dict(self) -> dict:
+        shared = self.calls - self.executions
+        return {
+            **asdict(self),
+            "shared": shared,
+            "shared_ratio": round(shared / self.calls, 4) if self.calls else 0.0,
+        }
+
+
+class SingleFlight:
+    """
+    Coalesces identical concurrent calls into one execution.
+    The first call of a key runs the function in the threadpool; calls of the
+    same key arriving before it finishes wait for the same result instead of
+    running it again. Results are not cached: once the execution finishes, the
+    next call runs the function again.
+    The function runs in a thread and its result is handed to every caller, so
+    it should use its own session and return an immutable, serialized result.
+    """
+
+    def __init__(self, name: str):
+        self.name = name
+        self.metrics = SingleFlightMetrics()
+        self._calls: dict[Hashable, asyncio.Future] = {}
+
+    async def do(self, key: Hashable, function: Callable[[], Any], timeout: float):
+        """
+        Run the function for the key, or join the execution already in flight.
+        Args:
+            key (Hashable): Identifies identical calls.
+            function (Callable[[], Any]): The blocking function to run.
+            timeout (float): How long this caller waits, in seconds. The shared
+                execution keeps running for the other callers.
+        Returns:
+            Any: The result of the function.
+        Raises:
+            SingleFlightTimeout: If the result is not ready within the timeout.
+        """
+
+        self.metrics.calls += 1
+        future = self._calls.get(key)
+        if future is None:
+            self.metrics.executions += 1
+            future = asyncio.ensure_future(run_in_threadpool(function))
+            self._calls[key] = future
+            future.add_done_callback(lambda done: self._finish(key, done))
+
+        try:
+            return await asyncio.wait_for(asyncio.shield(future), timeout)
+        except asyncio.TimeoutError:
+            self.metrics.timeouts += 1
+            raise SingleFlightTimeout(f"{self.name} {key!r} timed out")
+
+    def _finish(self, key: Hashable, future: asyncio.Future):
+        if self._calls.get(key) is future:
+            del self._calls[key]
+        if not future.cancelled() and future.exception() is not None:
+            self.metrics.errors += 1
+
+
+single_flights: dict[str, SingleFlight] = {}
+
+
+def get_single_flight(name: str) -> SingleFlight:
+    """
+    Return the single-flight group of a name, creating it on first use, so the
+    admin endpoint can report the metrics of every group.
+    """
+
+    return single_flights.setdefault(name, SingleFlight(name))
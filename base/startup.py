@@ -0,0 +1,79 @@
+import threading
+import time
+from contextlib import contextmanager
+from typing import Callable, Optional
+
+# when the application started importing; main.py imports this module first
+IMPORT_STARTED = time.perf_counter()
+
+
+class StartupReport:
+    """
+    Timing breakdown of the boot of a worker, and whether it is warmed up.
+    Phases are recorded in the order they ran, in milliseconds: the imports,
+    every startup hook step and every warm-up step.
+    """
+
+    def __init__(self):
+        self.phases: dict[str, float] = {}
+        self.ready = False
+        self.error: Optional[str] = None
+        self._ready_at: Optional[float] = None
+        self._lock = threading.Lock()
+
+    def record(self, name: str, started: float):
+        with self._lock:
+            self.phases[name] = round((time.perf_counter() - started) * 1000, 3)
+
+    @contextmanager
+    def phase(self, name: str):
+        started = time.perf_counter()
+        try:
+            yield
+        finally:
+            self.record(name, started)
+
+    def mark_ready(self):
+        with self._lock:
+            self.ready = True
+            self._ready_at = time.perf_counter()
+
+    def as_dict(self) -> dict:
+        with self._lock:
+            return {
+                "ready": self.ready,
+                "error": self.error,
+                "phases_ms": dict(self.phases),
+                "total_ms": round((self._ready_at - IMPORT_STARTED) * 1000, 3)
+                if self._ready_at is not None
+                else None,
+            }
+
+
+startup_report = StartupReport()
+
+
+def start_warm_up(steps: list[tuple[str, Callable[[], object]]]) -> threading.Thread:
+    """
+    Run the warm-up steps one after the other in a background thread, so the
+    worker accepts connections right away, then mark the worker ready. A failing
+    step is reported and leaves the worker not ready.
+    Args:
+        steps (list[tuple[str, Callable]]): The name and function of every step.
+    Returns:
+        threading.Thread: The warm-up thread.
+    """
+
+    def warm_up():
+        try:
+            for name, step in steps:
+                with startup_report.phase(f"warm_up.{name}"):
+                    step()
+        except Exception as exc:
+            startup_report.error = f"{name}: {exc!r}"
+            return
+        startup_report.mark_ready()
+
+    thread = threading.Thread(target=warm_up, name="warm-up", daemon=True)
+    thread.start()
+    return thread
@@ -0,0 +1,63 @@
+import asyncio
+
+import pytest
+from fastapi.testclient import TestClient
+
+from base.admission import AdmissionLimit, admission_limits, parse_limits
+
+
+def test_admission_limit_queue_and_rejections():
+    """
+    Test that requests beyond the concurrency limit wait in the queue, get the
+    slots in order, and are rejected once the queue is full or their wait times
+    out.
+    """
+
+    async def scenario():
+        limit = AdmissionLimit(concurrency=1, queue_size=1, queue_timeout=0.05)
+        assert await limit.acquire()
+
+        waiting = asyncio.create_task(limit.acquire())
+        await asyncio.sleep(0)
+        assert not await limit.acquire()
+        limit.release()
+        assert await waiting
+        assert limit.active == 1
+
+        assert not await limit.acquire()
+        limit.release()
+        assert limit.active == 0
+        return limit.as_dict()
+
+    stats = asyncio.run(scenario())
+    assert stats["admitted"] == 2
+    assert stats["queued"] == 1
+    assert stats["rejected"] == 1
+    assert stats["timed_out"] == 1
+
+
+def test_admission_control_sheds_load(client: TestClient, monkeypatch):
+    """
+    Test that a saturated router answers 503 with Retry-After, while the other
+    routers and the paths outside them keep working.
+    Args:
+        client (TestClient): The test client used to simulate API requests.
+        monkeypatch: Replaces the limit of the movie reads.
+    """
+
+    assert client.get("/movies").status_code == 200
+    monkeypatch.setitem(admission_limits, "movies.read", AdmissionLimit(0, 0, 0))
+
+    response = client.get("/movies")
+    assert response.status_code == 503
+    assert response.headers["Retry-After"] == "1"
+    assert client.get("/clients/").status_code == 200
+    assert client.get("/health").status_code == 200
+
+    stats = client.get("/admin/admission").json()
+    assert stats["movies.read"]["rejected"] == 1
+    assert stats["clients.read"]["admitted"] >= 1
+
+    assert parse_limits("movie_rents.write=4/16") == {"movie_rents.write": (4, 16)}
+    with pytest.raises(ValueError):
+        parse_limits("movies.delete=1/1")
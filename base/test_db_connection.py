@@ -0,0 +1,42 @@
+import asyncio
+
+from fastapi.testclient import TestClient
+from sqlalchemy import Engine, event
+
+
+def test_reads_run_off_the_event_loop(client: TestClient):
+    """
+    Test that the GET routes run their queries in the threadpool, so a slow
+    read never blocks the event loop serving the other requests.
+    Args:
+        client (TestClient): The test client used to simulate API requests.
+    """
+
+    on_loop = []
+
+    def record(conn, cursor, statement, parameters, context, executemany):
+        try:
+            asyncio.get_running_loop()
+        except RuntimeError:
+            return
+        on_loop.append(statement)
+
+    event.listen(Engine, "before_cursor_execute", record)
+    try:
+        for path in (
+            "/genres",
+            "/genres/1",
+            "/movies",
+            "/movies/1",
+            "/clients/",
+            "/clients/1",
+            "/clients/1/rents",
+            "/movie_rents",
+            "/movie_rents/1",
+            "/analytics/top_movies",
+            "/changes",
+        ):
+            assert client.get(path).status_code == 200, path
+    finally:
+        event.remove(Engine, "before_cursor_execute", record)
+    assert on_loop == []
@@ -0,0 +1,43 @@
+import tracemalloc
+
+from fastapi import FastAPI
+from fastapi.responses import StreamingResponse
+from fastapi.testclient import TestClient
+
+from base.memory import MemoryStats, MemoryTrackingMiddleware
+
+
+def test_memory_tracked_per_route():
+    """
+    Test that the allocations of every request are recorded under the method
+    and route path, not the concrete URL.
+    """
+
+    app = FastAPI()
+
+    @app.get("/items/{id}")
+    async def retrieve_item(id: int):
+        return {"id": id, "payload": [list(range(100)) for _ in range(100)]}
+
+    @app.get("/availability/stream")
+    async def stream():
+        async def events():
+            yield "data: 1\n\n"
+
+        return StreamingResponse(events(), media_type="text/event-stream")
+
+    stats = MemoryStats()
+    app.add_middleware(MemoryTrackingMiddleware, stats=stats)
+    client = TestClient(app)
+
+    try:
+        client.get("/items/1")
+        client.get("/items/2")
+        client.get("/availability/stream")
+    finally:
+        tracemalloc.stop()
+
+    routes = stats.as_dict()
+    assert list(routes) == ["GET /items/{id}"]
+    assert routes["GET /items/{id}"]["requests"] == 2
+    assert routes["GET /items/{id}"]["peak_max_kib"] > 0
@@ -0,0 +1,80 @@
+import os
+
+from fastapi import FastAPI
+from fastapi.responses import StreamingResponse
+from fastapi.testclient import TestClient
+
+from base.profiling import ProfilingMiddleware
+
+
+def _profiled_client(directory, **kwargs) -> TestClient:
+    app = FastAPI()
+
+    @app.get("/ping")
+    async def ping():
+        return {"message": "pong"}
+
+    @app.get("/availability/stream")
+    async def stream():
+        async def events():
+            for id in range(3):
+                yield f"data: {id}\n\n"
+
+        return StreamingResponse(events(), media_type="text/event-stream")
+
+    app.add_middleware(ProfilingMiddleware, directory=directory, **kwargs)
+    return TestClient(app)
+
+
+def test_profile_requested_with_token(tmp_path):
+    """
+    Test that a request carrying the profiling token is profiled: the profile
+    is dumped to the directory and its summary is attached to the response.
+    """
+
+    client = _profiled_client(str(tmp_path), token="secret")
+
+    response = client.get("/ping", headers={"X-Profile": "secret"})
+
+    assert response.status_code == 200
+    assert response.json() == {"message": "pong"}
+    assert os.listdir(tmp_path) == [response.headers["x-profile-id"]]
+    assert response.headers["x-profile-summary"]
+    assert response.headers["server-timing"].startswith("app;dur=")
+
+
+def test_profile_not_requested(tmp_path):
+    """
+    Test that requests without the token, or with a wrong one, are not profiled.
+    """
+
+    client = _profiled_client(str(tmp_path), token="secret")
+
+    assert "x-profile-id" not in client.get("/ping").headers
+    response = client.get("/ping", headers={"X-Profile": "wrong"})
+    assert "x-profile-id" not in response.headers
+    assert os.listdir(tmp_path) == []
+
+
+def test_profile_sampled(tmp_path):
+    """
+    Test that every request is profiled with a sample rate of 1.
+    """
+
+    client = _profiled_client(str(tmp_path), sample_rate=1.0)
+
+    assert "x-profile-id" in client.get("/ping").headers
+
+
+def test_streams_not_profiled(tmp_path):
+    """
+    Test that streaming responses are sent as they go, without being profiled,
+    even when the request is sampled.
+    """
+
+    client = _profiled_client(str(tmp_path), sample_rate=1.0)
+
+    response = client.get("/availability/stream")
+    assert response.text == "data: 0\n\ndata: 1\n\ndata: 2\n\n"
+    assert "x-profile-id" not in response.headers
+    assert os.listdir(tmp_path) == []
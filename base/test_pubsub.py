@@ -0,0 +1,31 @@
+import asyncio
+
+from base.pubsub import PubSub
+
+
+def test_pubsub_topics_and_bounded_queues():
+    """
+    Test that subscribers only receive the events of their topics and that a
+    full queue drops the oldest events instead of blocking the publisher.
+    """
+
+    async def scenario():
+        pubsub = PubSub(queue_size=2, max_subscribers=2)
+        movie = pubsub.subscribe(["movie:1"])
+        everything = pubsub.subscribe()
+        assert pubsub.subscribe() is None
+
+        for number in range(3):
+            pubsub.publish(["movie:1", "genre:1"], number)
+        pubsub.publish(["movie:2"], "other")
+        await asyncio.sleep(0)
+
+        assert [await movie.get(), await movie.get()] == [1, 2]
+        assert movie.lagged == 1
+        assert [await everything.get(), await everything.get()] == [2, "other"]
+        assert pubsub.metrics.dropped == 3
+
+        pubsub.unsubscribe(movie)
+        assert pubsub.subscribers == 1
+
+    asyncio.run(scenario())
@@ -0,0 +1,97 @@
+import sqlite3
+import time
+
+import pytest
+from fastapi.testclient import TestClient
+from sqlalchemy.exc import OperationalError
+from sqlmodel import Session
+
+from base.retry import (
+    DeadlineExceeded,
+    RetryPolicy,
+    interrupt_after_deadline,
+    request_deadline,
+)
+
+
+def _locked():
+    return OperationalError(
+        "COMMIT", {}, sqlite3.OperationalError("database is locked")
+    )
+
+
+def test_retry_policy_retries_lock_errors(session: Session):
+    """
+    Test that lock errors are retried until the operation succeeds, that other
+    errors are not, and that no attempt is made past the deadline.
+    Args:
+        session (Session): The database session rolled back between attempts.
+    """
+
+    policy = RetryPolicy(attempts=3, base_delay=0.001, max_delay=0.002)
+    failures = [_locked(), _locked()]
+
+    def operation(session):
+        if failures:
+            raise failures.pop()
+        return "done"
+
+    assert policy.run(session, operation) == "done"
+    assert policy.metrics.retries == 2
+    assert policy.metrics.recovered == 1
+
+    failures.extend([_locked()] * 3)
+    with pytest.raises(OperationalError):
+        policy.run(session, operation)
+    assert policy.metrics.exhausted == 1
+
+    with pytest.raises(ValueError):
+        policy.run(session, lambda session: int("x"))
+
+    token = request_deadline.set(time.monotonic() - 1)
+    try:
+        with pytest.raises(DeadlineExceeded):
+            policy.run(session, operation)
+    finally:
+        request_deadline.reset(token)
+
+
+def test_progress_handler_interrupts_queries_past_the_deadline():
+    """
+    Test that a query still running after the deadline is aborted by SQLite.
+    """
+
+    connection = sqlite3.connect(":memory:")
+    connection.set_progress_handler(interrupt_after_deadline, 1000)
+    query = (
+        "WITH RECURSIVE n(i) AS (SELECT 1 UNION ALL SELECT i + 1 FROM n "
+        "WHERE i < 1000000) SELECT count(*) FROM n"
+    )
+    assert connection.execute(query).fetchone() == (1000000,)
+
+    token = request_deadline.set(time.monotonic() - 1)
+    try:
+        with pytest.raises(sqlite3.OperationalError, match="interrupted"):
+            connection.execute(query)
+    finally:
+        request_deadline.reset(token)
+
+
+def test_request_deadline_header(client: TestClient):
+    """
+    Test that a write whose budget is already spent answers 504 without running.
+    Args:
+        client (TestClient): The test client used to simulate API requests.
+    """
+
+    client_data = {
+        "first_name": "Ada",
+        "last_name": "Lovelace",
+        "address": "Street 1",
+        "license_number": 12345678,
+    }
+    response = client.post(
+        "/clients/", json=client_data, headers={"X-Request-Timeout": "0"}
+    )
+    assert response.status_code == 504
+    assert client.post("/clients/", json=client_data).status_code == 200
@@ -0,0 +1,49 @@
+import asyncio
+import time
+
+import pytest
+
+from base.single_flight import SingleFlight, SingleFlightTimeout
+
+
+def test_concurrent_calls_share_one_execution():
+    """
+    Test that identical concurrent calls run the function once and all get its
+    result, while a different key runs separately.
+    """
+
+    group = SingleFlight("test")
+    executions = []
+
+    def fetch(key):
+        executions.append(key)
+        time.sleep(0.05)
+        return f"result {key}"
+
+    async def call_all():
+        return await asyncio.gather(
+            *(group.do("a", lambda: fetch("a"), timeout=1) for _ in range(10)),
+            group.do("b", lambda: fetch("b"), timeout=1),
+        )
+
+    results = asyncio.run(call_all())
+
+    assert results == ["result a"] * 10 + ["result b"]
+    assert sorted(executions) == ["a", "b"]
+    assert group.metrics.as_dict()["shared"] == 9
+
+
+def test_call_times_out():
+    """
+    Test that a caller gives up after its timeout, and that the timeout is
+    counted in the metrics.
+    """
+
+    group = SingleFlight("test")
+
+    async def call():
+        await group.do("a", lambda: time.sleep(0.2), timeout=0.01)
+
+    with pytest.raises(SingleFlightTimeout):
+        asyncio.run(call())
+    assert group.metrics.timeouts == 1
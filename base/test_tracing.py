@@ -0,0 +1,75 @@
+import json
+
+from fastapi import FastAPI
+from fastapi.testclient import TestClient
+from sqlmodel import Session
+
+from base.db_connection import get_read_session, get_session
+from base.tracing import FileExporter, install_tracing
+from clients.views import router as clients_router
+from movies.views import router as movies_router
+
+TRACE_ID = "4bf92f3577b34da6a3ce929d0e0e4736"
+
+
+def _spans(path) -> list[list[dict]]:
+    with open(path) as f:
+        return [
+            json.loads(line)["resourceSpans"][0]["scopeSpans"][0]["spans"] for line in f
+        ]
+
+
+def test_sampled_requests_are_traced(session: Session, tmp_path):
+    """
+    Test that a request whose traceparent asks for sampling is exported as one
+    trace, with the view, repository and SQL spans nested under the request
+    span, and that other requests are not traced at a sample rate of zero.
+    Args:
+        session (Session): The database session used by the traced app.
+    """
+
+    app = FastAPI()
+    app.include_router(movies_router)
+    app.include_router(clients_router)
+    app.dependency_overrides[get_session] = lambda: session
+    app.dependency_overrides[get_read_session] = lambda: session
+    path = tmp_path / "traces.jsonl"
+    install_tracing(app, FileExporter(str(path)), sample_rate=0.0)
+    client = TestClient(app)
+
+    assert client.get("/movies/1").headers.get("traceparent") is None
+    assert not path.exists()
+
+    traceparent = f"00-{TRACE_ID}-00f067aa0ba902b7-01"
+    response = client.get("/movies/1", headers={"traceparent": traceparent})
+    assert response.status_code == 200
+    assert response.headers["traceparent"].startswith(f"00-{TRACE_ID}-")
+
+    (spans,) = _spans(path)
+    by_id = {span["spanId"]: span for span in spans}
+    assert {span["traceId"] for span in spans} == {TRACE_ID}
+    (root,) = [span for span in spans if span["parentSpanId"] == "00f067aa0ba902b7"]
+    assert root["name"] == "GET /movies/{id}"
+
+    def parent(span: dict) -> dict:
+        return by_id[span["parentSpanId"]]
+
+    (repository,) = [span for span in spans if span["name"] == "MovieRepository.get"]
+    assert parent(parent(repository)) is root
+    assert parent(repository)["name"] == "view retrieve_movie"
+    assert any(
+        span["name"] == "SQL SELECT" and parent(span) is repository for span in spans
+    )
+
+    client_data = {
+        "first_name": "Ada",
+        "last_name": "Lovelace",
+        "address": "Street 1",
+        "license_number": 12345678,
+    }
+    response = client.post(
+        "/clients/", json=client_data, headers={"traceparent": traceparent}
+    )
+    assert response.status_code == 200
+    names = {span["name"] for span in _spans(path)[1]}
+    assert {"POST /clients/", "ClientRepository.add", "SQL INSERT"} <= names
@@ -0,0 +1,140 @@
+import asyncio
+import contextvars
+import sqlite3
+import time
+
+import pytest
+from sqlmodel import Session, SQLModel, select
+
+from base.retry import DeadlineExceeded, db_retry, request_deadline
+from base.write_pipeline import GroupCommitWriter, create_writer_engine
+from movies.models import Genre
+from movies.repositories import GenreRepository
+
+
+def _writer(tmp_path, window: float, busy_timeout: float = 1) -> GroupCommitWriter:
+    engine = create_writer_engine(f"sqlite:///{tmp_path}/database.db", busy_timeout)
+    SQLModel.metadata.create_all(engine)
+    return GroupCommitWriter(engine, window=window, busy_timeout=busy_timeout)
+
+
+def _hold_write_lock(tmp_path) -> sqlite3.Connection:
+    connection = sqlite3.connect(f"{tmp_path}/database.db", isolation_level=None)
+    connection.execute("BEGIN IMMEDIATE")
+    return connection
+
+
+def test_group_commit_isolates_failures(tmp_path):
+    """
+    Test that operations queued within the window are committed in one group,
+    and that a failing operation only fails its own caller.
+    """
+
+    writer = _writer(tmp_path, window=0.2)
+    writer.start()
+
+    def add_genre(id: int):
+        return lambda s: GenreRepository(s).add(
+            Genre(id=id, name=f"Genre {id}", description="")
+        )
+
+    def fail(session):
+        GenreRepository(session).add(Genre(id=1, name="Duplicate", description=""))
+
+    futures = [
+        writer.submit(add_genre(1)),
+        writer.submit(fail),
+        writer.submit(add_genre(2)),
+    ]
+    results = [future.exception(timeout=5) or future.result() for future in futures]
+    writer.stop()
+
+    assert writer.batches == 1
+    assert writer.operations == 3
+    assert results[0].id == 1
+    assert "UNIQUE constraint failed" in str(results[1])
+    assert results[2].id == 2
+    with Session(writer.engine) as session:
+        names = session.exec(select(Genre.name).order_by(Genre.id)).all()
+    assert names == ["Genre 1", "Genre 2"]
+
+
+def test_group_commit_from_coroutines(tmp_path):
+    """
+    Test that concurrent coroutines awaiting the writer all get their result.
+    """
+
+    writer = _writer(tmp_path, window=0.01)
+    writer.start()
+
+    async def add_genres():
+        return await asyncio.gather(
+            *(
+                writer.run(
+                    lambda s, id=id: GenreRepository(s)
+                    .add(Genre(id=id, name="", description=""))
+                    .id
+                )
+                for id in range(1, 21)
+            )
+        )
+
+    ids = asyncio.run(add_genres())
+    writer.stop()
+
+    assert ids == list(range(1, 21))
+    assert writer.operations == 20
+    assert writer.batches < 20
+
+
+def test_group_commit_retries_lock_errors(tmp_path, monkeypatch):
+    """
+    Test that a group finding the write lock taken by another connection is
+    run again once the lock is released, instead of failing its callers.
+    """
+
+    monkeypatch.setattr(db_retry, "attempts", 20)
+    writer = _writer(tmp_path, window=0, busy_timeout=0.05)
+    writer.start()
+    retries = db_retry.metrics.retries
+    locker = _hold_write_lock(tmp_path)
+    future = writer.submit(
+        lambda s: GenreRepository(s).add(Genre(id=1, name="Drama", description="")).id
+    )
+    time.sleep(0.2)
+    locker.rollback()
+
+    assert future.result(timeout=10) == 1
+    writer.stop()
+    locker.close()
+    assert db_retry.metrics.retries > retries
+    assert writer.batches == 1
+    with Session(writer.engine) as session:
+        assert session.exec(select(Genre.name)).all() == ["Drama"]
+
+
+def test_group_commit_lock_wait_stops_at_the_deadline(tmp_path):
+    """
+    Test that an operation waiting for a write lock that is never released
+    fails with DeadlineExceeded once its deadline passes, not after every
+    attempt has waited the full busy timeout.
+    """
+
+    writer = _writer(tmp_path, window=0, busy_timeout=5)
+    writer.start()
+    locker = _hold_write_lock(tmp_path)
+
+    def submit():
+        request_deadline.set(time.monotonic() + 0.3)
+        return writer.submit(
+            lambda s: GenreRepository(s).add(Genre(id=1, name="", description=""))
+        )
+
+    started = time.monotonic()
+    future = contextvars.Context().run(submit)
+    with pytest.raises(DeadlineExceeded):
+        future.result(timeout=10)
+    assert time.monotonic() - started < 2
+    writer.stop()
+    locker.rollback()
+    locker.close()
@@ -0,0 +1,405 @@
+import functools
+import inspect
+import json
+import os
+import random
+import sys
+import threading
+import time
+from contextlib import contextmanager
+from contextvars import ContextVar
+from dataclasses import dataclass, field
+from typing import Any, Callable, Optional, TextIO
+
+from sqlalchemy import Engine, event
+
+SERVICE_NAME = "movie-rental-api"
+TRACEPARENT_HEADER = b"traceparent"
+
+# OTLP span kinds and status codes
+SPAN_KIND_INTERNAL = 1
+SPAN_KIND_SERVER = 2
+SPAN_KIND_CLIENT = 3
+STATUS_OK = 1
+STATUS_ERROR = 2
+
+# longest SQL statement recorded in a span
+MAX_STATEMENT_LENGTH = 2000
+
+
+@dataclass
+class Span:
+    """
+    A timed operation of a trace, with the fields of an OpenTelemetry span.
+    Spans of the same trace share the `spans` list of their root, to which they
+    are added when they end.
+    """
+
+    name: str
+    trace_id: str
+    span_id: str
+    parent_span_id: Optional[str] = None
+    kind: int = SPAN_KIND_INTERNAL
+    start_ns: int = field(default_factory=time.time_ns)
+    end_ns: int = 0
+    attributes: dict[str, Any] = field(default_factory=dict)
+    status: int = 0
+    error: Optional[str] = None
+    spans: list["Span"] = field(default_factory=list, repr=False)
+
+    def child(self, name: str, kind: int = SPAN_KIND_INTERNAL, **attributes) -> "Span":
+        span = Span(
+            name,
+            self.trace_id,
+            _random_id(8),
+            self.span_id,
+            kind,
+            attributes=attributes,
+        )
+        span.spans = self.spans
+        return span
+
+    def end(self, exc: Optional[BaseException] = None):
+        self.end_ns = time.time_ns()
+        if exc is not None:
+            self.status = STATUS_ERROR
+            self.error = repr(exc)
+        self.spans.append(self)
+
+    @property
+    def duration_ms(self) -> float:
+        return (self.end_ns - self.start_ns) / 1e6
+
+    def to_otlp(self) -> dict:
+        """
+        Returns:
+            dict: The span in the OTLP/JSON encoding.
+        """
+
+        status: dict[str, Any] = {"code": self.status}
+        span = {
+            "traceId": self.trace_id,
+            "spanId": self.span_id,
+            "name": self.name,
+            "kind": self.kind,
+            "startTimeUnixNano": str(self.start_ns),
+            "endTimeUnixNano": str(self.end_ns),
+            "attributes": [
+                {"key": key, "value": _otlp_value(value)}
+                for key, value in self.attributes.items()
+            ],
+            "status": status,
+        }
+        if self.parent_span_id:
+            span["parentSpanId"] = self.parent_span_id
+        if self.error:
+            status["message"] = self.error
+        return span
+
+
+def _random_id(size: int) -> str:
+    return os.urandom(size).hex()
+
+
+def _otlp_value(value: Any) -> dict:
+    if isinstance(value, bool):
+        return {"boolValue": value}
+    if isinstance(value, int):
+        return {"intValue": str(value)}
+    if isinstance(value, float):
+        return {"doubleValue": value}
+    return {"stringValue": str(value)}
+
+
+# the span the code currently runs in; None when the request is not traced
+current_span: ContextVar[Optional[Span]] = ContextVar("current_span", default=None)
+
+
+@contextmanager
+def span(name: str, kind: int = SPAN_KIND_INTERNAL, **attributes):
+    """
+    Time the wrapped block as a child of the current span. Outside traced
+    requests it only costs a context variable lookup.
+    Yields:
+        Optional[Span]: The new span, or None when the request is not traced.
+    """
+
+    parent = current_span.get()
+    if parent is None:
+        yield None
+        return
+    child = parent.child(name, kind, **attributes)
+    token = current_span.set(child)
+    try:
+        yield child
+    except BaseException as exc:
+        child.end(exc)
+        raise
+    else:
+        child.end()
+    finally:
+        current_span.reset(token)
+
+
+def traced(function: Callable, name: Optional[str] = None) -> Callable:
+    """
+    Wrap a function, or a coroutine function, so every call is a span.
+    """
+
+    name = name or function.__qualname__
+    if inspect.iscoroutinefunction(function):
+
+        @functools.wraps(function)
+        async def async_wrapper(*args, **kwargs):
+            with span(name):
+                return await function(*args, **kwargs)
+
+        return async_wrapper
+
+    @functools.wraps(function)
+    def wrapper(*args, **kwargs):
+        with span(name):
+            return function(*args, **kwargs)
+
+    return wrapper
+
+
+class FileExporter:
+    """
+    Append every finished trace to a file as one line of OTLP/JSON
+    (`{"resourceSpans": [...]}`), the format of the file exporter of the
+    OpenTelemetry collector, so the traces can be replayed into any OTLP backend.
+    """
+
+    def __init__(self, path: str):
+        self.path = path
+        self._lock = threading.Lock()
+
+    def export(self, spans: list[Span]):
+        line = json.dumps(
+            {
+                "resourceSpans": [
+                    {
+                        "resource": {
+                            "attributes": [
+                                {
+                                    "key": "service.name",
+                                    "value": {"stringValue": SERVICE_NAME},
+                                }
+                            ]
+                        },
+                        "scopeSpans": [
+                            {
+                                "scope": {"name": __name__},
+                                "spans": [span.to_otlp() for span in spans],
+                            }
+                        ],
+                    }
+                ]
+            },
+            separators=(",", ":"),
+        )
+        with self._lock, open(self.path, "a") as f:
+            f.write(line + "\n")
+
+
+class ConsoleExporter:
+    """
+    Print every finished trace as an indented tree of its spans with their
+    durations, for reading a slow request at a glance.
+    """
+
+    def __init__(self, stream: TextIO = sys.stderr):
+        self.stream = stream
+        self._lock = threading.Lock()
+
+    def export(self, spans: list[Span]):
+        children: dict[Optional[str], list[Span]] = {}
+        for span in sorted(spans, key=lambda span: span.start_ns):
+            children.setdefault(span.parent_span_id, []).append(span)
+        ids = {span.span_id for span in spans}
+        roots = [span for span in spans if span.parent_span_id not in ids]
+
+        lines = []
+
+        def walk(span: Span, depth: int):
+            error = f"  ! {span.error}" if span.error else ""
+            lines.append(f"{'  ' * depth}{span.name}  {span.duration_ms:.3f} ms{error}")
+            for child in children.get(span.span_id, ()):
+                walk(child, depth + 1)
+
+        for root in roots:
+            lines.append(f"trace {root.trace_id}")
+            walk(root, 1)
+        with self._lock:
+            print("\n".join(lines), file=self.stream, flush=True)
+
+
+class Tracer:
+    """
+    Starts the root span of the sampled requests and exports their traces.
+    A request is traced when its W3C `traceparent` header has the sampled flag,
+    continuing the trace of the caller, or when it is picked by `sample_rate`.
+    """
+
+    def __init__(self, exporter, sample_rate: float = 0.0):
+        self.exporter = exporter
+        self.sample_rate = sample_rate
+
+    def start(self, name: str, traceparent: Optional[str] = None) -> Optional[Span]:
+        trace_id, parent_id, sampled = _parse_traceparent(traceparent)
+        if not sampled and not (
+            self.sample_rate > 0 and random.random() < self.sample_rate
+        ):
+            return None
+        return Span(
+            name, trace_id or _random_id(16), _random_id(8), parent_id, SPAN_KIND_SERVER
+        )
+
+    def finish(self, root: Span):
+        try:
+            self.exporter.export(root.spans)
+        except Exception as exc:  # a broken exporter must not fail requests
+            print(f"Trace export failed: {exc!r}", file=sys.stderr)
+
+
+def _parse_traceparent(
+    value: Optional[str],
+) -> tuple[Optional[str], Optional[str], bool]:
+    # version-traceid-parentid-flags, e.g. 00-<32 hex>-<16 hex>-01
+    parts = (value or "").strip().split("-")
+    if len(parts) != 4 or len(parts[1]) != 32 or len(parts[2]) != 16:
+        return None, None, False
+    try:
+        sampled = bool(int(parts[3], 16) & 1)
+        int(parts[1], 16), int(parts[2], 16)
+    except ValueError:
+        return None, None, False
+    return parts[1], parts[2], sampled
+
+
+class TracingMiddleware:
+    """
+    ASGI middleware opening the root span of every sampled request, named after
+    its route (e.g. `POST /movie_rents`), and exporting the trace once the
+    response is sent. The response gets a `traceparent` header pointing at the
+    trace. Requests that are not sampled only pay for the sampling decision.
+    """
+
+    def __init__(self, app, tracer: Tracer):
+        self.app = app
+        self.tracer = tracer
+
+    async def __call__(self, scope, receive, send):
+        if scope["type"] != "http":
+            await self.app(scope, receive, send)
+            return
+        traceparent = None
+        for name, value in scope["headers"]:
+            if name == TRACEPARENT_HEADER:
+                traceparent = value.decode("latin-1")
+        root = self.tracer.start(f"{scope['method']} {scope['path']}", traceparent)
+        if root is None:
+            await self.app(scope, receive, send)
+            return
+
+        root.attributes.update(
+            {"http.request.method": scope["method"], "url.path": scope["path"]}
+        )
+        header = f"00-{root.trace_id}-{root.span_id}-01".encode()
+
+        async def traced_send(message):
+            if message["type"] == "http.response.start":
+                root.attributes["http.response.status_code"] = message["status"]
+                message["headers"] = [
+                    *message.get("headers", []),
+                    (b"traceparent", header),
+                ]
+            await send(message)
+
+        token = current_span.set(root)
+        error = None
+        try:
+            await self.app(scope, receive, traced_send)
+        except BaseException as exc:
+            error = exc
+            raise
+        finally:
+            current_span.reset(token)
+            route = scope.get("route")
+            if route is not None and hasattr(route, "path"):
+                root.name = f"{scope['method']} {route.path}"
+                root.attributes["http.route"] = route.path
+            root.end(error)
+            self.tracer.finish(root)
+
+
+def _before_cursor_execute(conn, cursor, statement, parameters, context, executemany):
+    parent = current_span.get()
+    if parent is None:
+        return
+    operation = statement.lstrip().split(None, 1)[0].upper() if statement else "SQL"
+    child = parent.child(
+        f"SQL {operation}",
+        SPAN_KIND_CLIENT,
+        **{
+            "db.system": "sqlite",
+            "db.statement": statement[:MAX_STATEMENT_LENGTH],
+            "db.executemany": executemany,
+        },
+    )
+    conn.info.setdefault("trace_spans", []).append(child)
+
+
+def _after_cursor_execute(conn, cursor, statement, parameters, context, executemany):
+    spans = conn.info.get("trace_spans")
+    if spans:
+        child = spans.pop()
+        if cursor.rowcount is not None and cursor.rowcount >= 0:
+            child.attributes["db.rowcount"] = cursor.rowcount
+        child.end()
+
+
+def _handle_error(exception_context):
+    connection = exception_context.connection
+    spans = connection.info.get("trace_spans") if connection is not None else None
+    if spans:
+        spans.pop().end(exception_context.original_exception)
+
+
+def trace_views(routes):
+    """
+    Wrap the endpoint of every route in a `view <name>` span, so the time of
+    the view is told apart from the dependencies and the response validation.
+    """
+
+    for route in routes:
+        dependant = getattr(route, "dependant", None)
+        if dependant is not None and dependant.call is not None:
+            dependant.call = traced(dependant.call, f"view {route.name}")
+
+
+def install_tracing(app, exporter, sample_rate: float):
+    """
+    Trace the requests of the app: the middleware opens the request spans, the
+    views get their own spans, and every SQL statement run by any engine
+    becomes a span (the repositories are traced by base/repository.py).
+    """
+
+    trace_views(app.routes)
+    for name, listener in (
+        ("before_cursor_execute", _before_cursor_execute),
+        ("after_cursor_execute", _after_cursor_execute),
+        ("handle_error", _handle_error),
+    ):
+        if not event.contains(Engine, name, listener):
+            event.listen(Engine, name, listener)
+    app.add_middleware(TracingMiddleware, tracer=Tracer(exporter, sample_rate))
+
+
+def create_exporter(name: str, path: str):
+    if name == "file":
+        return FileExporter(path)
+    if name == "console":
+        return ConsoleExporter()
+    raise ValueError(f"Unknown trace exporter {name!r}, expected file or console")
@@ -0,0 +1,282 @@
+import asyncio
+import contextvars
+import queue
+import threading
+import time
+from concurrent.futures import Future
+from typing import Any, Callable, Optional
+
+from pydantic import BaseModel
+from sqlalchemy import Engine, event
+from sqlmodel import Session, create_engine
+
+from base import settings
+from base.repository import DEFERRED_COMMIT
+from base.retry import (
+    DeadlineExceeded,
+    db_retry,
+    is_lock_error,
+    request_deadline,
+)
+from base.tracing import span
+
+WriteOperation = Callable[[Session], Any]
+# the future of an operation, and its result or error
+Outcome = tuple[Future, Any, Optional[BaseException]]
+
+
+def create_writer_engine(
+    url: str, busy_timeout: float = settings.DB_BUSY_TIMEOUT_SECONDS
+) -> Engine:
+    """
+    Create the engine of the group commit writer.
+    The pysqlite driver emits its own BEGIN and breaks SAVEPOINT, so it is
+    switched to autocommit and the transaction is started explicitly with
+    BEGIN IMMEDIATE, which takes the write lock up front, waiting at most
+    `busy_timeout` seconds for it. `synchronous = FULL` keeps every group
+    commit durable.
+    """
+
+    engine = create_engine(
+        url, connect_args={"check_same_thread": False, "timeout": busy_timeout}
+    )
+
+    @event.listens_for(engine, "connect")
+    def _configure(dbapi_connection, connection_record):
+        dbapi_connection.isolation_level = None
+        cursor = dbapi_connection.cursor()
+        cursor.execute("PRAGMA journal_mode = WAL")
+        cursor.execute("PRAGMA synchronous = FULL")
+        cursor.close()
+
+    @event.listens_for(engine, "begin")
+    def _begin(connection):
+        connection.exec_driver_sql("BEGIN IMMEDIATE")
+
+    return engine
+
+
+class GroupCommitWriter:
+    """
+    Single writer thread that commits concurrent write operations in groups.
+    Operations are queued with `submit`. The writer takes the first queued
+    operation, waits up to `window` seconds for more (at most `max_batch`) and
+    runs them one after the other in a single transaction, each inside its own
+    SAVEPOINT, so a failing operation is rolled back alone and reported to its
+    caller only. The group is then committed once, paying one fsync for all of
+    them, and every caller gets its result after the commit succeeded. If the
+    commit fails every caller of the group gets the error.
+    Operations receive a session flagged with `DEFERRED_COMMIT`, so repository
+    commits only flush. The session does not expire objects on commit, but
+    relationships are not loaded afterwards: operations should return
+    serialized results (see `run_write`).
+    Every operation runs in a copy of the context of the request that submitted
+    it, so with its deadline and in its trace; operations whose deadline passed
+    while queued are not run. A group failing with a lock error, at BEGIN
+    IMMEDIATE, in an operation or at COMMIT, is rolled back and run again with
+    the backoff of `db_retry`. The wait for the lock is cut to the latest
+    deadline of the group, and operations whose deadline passed in the meantime
+    are dropped from the next attempt.
+    """
+
+    def __init__(
+        self,
+        engine: Engine,
+        window: float = 0.002,
+        max_batch: int = 64,
+        busy_timeout: float = settings.DB_BUSY_TIMEOUT_SECONDS,
+    ):
+        self.engine = engine
+        self.busy_timeout = busy_timeout
+        self.window = window
+        self.max_batch = max_batch
+        self.batches = 0
+        self.operations = 0
+        self._queue: queue.Queue = queue.Queue()
+        self._thread: Optional[threading.Thread] = None
+
+    def start(self):
+        self._thread = threading.Thread(
+            target=self._run, name="group-commit-writer", daemon=True
+        )
+        self._thread.start()
+
+    def stop(self):
+        if self._thread is not None:
+            self._queue.put(None)
+            self._thread.join()
+            self._thread = None
+
+    def submit(self, operation: WriteOperation) -> Future:
+        future: Future = Future()
+        self._queue.put((operation, future, contextvars.copy_context()))
+        return future
+
+    async def run(self, operation: WriteOperation) -> Any:
+        return await asyncio.wrap_future(self.submit(operation))
+
+    def _run(self):
+        while True:
+            item = self._queue.get()
+            if item is None:
+                return
+            batch = [item]
+            deadline = time.monotonic() + self.window
+            while len(batch) < self.max_batch:
+                remaining = deadline - time.monotonic()
+                if remaining <= 0:
+                    break
+                try:
+                    item = self._queue.get(timeout=remaining)
+                except queue.Empty:
+                    break
+                if item is None:
+                    self._queue.put(None)
+                    break
+                batch.append(item)
+            self._commit_batch(batch)
+
+    def _commit_batch(
+        self, batch: list[tuple[WriteOperation, Future, contextvars.Context]]
+    ):
+        self.batches += 1
+        self.operations += len(batch)
+        try:
+            for attempt in range(db_retry.attempts):
+                batch = _drop_expired(batch)
+                if not batch:
+                    return
+                try:
+                    outcomes = self._run_batch(batch)
+                    break
+                except Exception as exc:
+                    if not is_lock_error(exc):
+                        raise
+                    time.sleep(db_retry.next_delay(attempt, exc))
+        except Exception as exc:
+            for _, future, _ in batch:
+                future.set_exception(exc)
+            return
+
+        for future, result, error in outcomes:
+            if error is not None:
+                future.set_exception(error)
+            else:
+                future.set_result(result)
+
+    def _run_batch(
+        self, batch: list[tuple[WriteOperation, Future, contextvars.Context]]
+    ) -> list[Outcome]:
+        outcomes: list[Outcome] = []
+        with self.engine.connect() as connection:
+            # set on the driver connection, which does not start the transaction
+            driver_connection = connection.connection.driver_connection
+            if driver_connection is not None:
+                driver_connection.execute(
+                    f"PRAGMA busy_timeout = {int(self._busy_timeout(batch) * 1000)}"
+                )
+            with Session(connection, expire_on_commit=False) as session:
+                session.info[DEFERRED_COMMIT] = True
+                # take the write lock before running anything
+                session.connection()
+                for operation, future, context in batch:
+                    deadline = context.get(request_deadline)
+                    if deadline is not None and time.monotonic() > deadline:
+                        outcomes.append((future, None, DeadlineExceeded()))
+                        continue
+                    try:
+                        result = context.run(
+                            _run_nested, session, operation, len(batch)
+                        )
+                        outcomes.append((future, result, None))
+                    except Exception as exc:
+                        if is_lock_error(exc):
+                            # the whole group is rolled back and run again
+                            raise
+                        outcomes.append((future, None, exc))
+                session.commit()
+        return outcomes
+
+    def _busy_timeout(
+        self, batch: list[tuple[WriteOperation, Future, contextvars.Context]]
+    ) -> float:
+        # no point waiting for the lock after the last caller gave up
+        deadlines = [context.get(request_deadline) for _, _, context in batch]
+        known = [deadline for deadline in deadlines if deadline is not None]
+        if len(known) < len(deadlines):
+            return self.busy_timeout
+        return max(0.0, min(self.busy_timeout, max(known) - time.monotonic()))
+
+
+def _drop_expired(
+    batch: list[tuple[WriteOperation, Future, contextvars.Context]],
+) -> list[tuple[WriteOperation, Future, contextvars.Context]]:
+    # fail the operations whose deadline passed and return the others
+    now = time.monotonic()
+    live = []
+    for item in batch:
+        deadline = item[2].get(request_deadline)
+        if deadline is not None and now > deadline:
+            item[1].set_exception(DeadlineExceeded())
+        else:
+            live.append(item)
+    return live
+
+
+def _run_nested(session: Session, operation: WriteOperation, batch_size: int) -> Any:
+    with span("write_pipeline.operation", batch_size=batch_size):
+        with session.begin_nested():
+            return operation(session)
+
+
+write_pipeline: Optional[GroupCommitWriter] = None
+
+
+def start_write_pipeline(url: str, window: float, max_batch: int):
+    global write_pipeline
+    write_pipeline = GroupCommitWriter(create_writer_engine(url), window, max_batch)
+    write_pipeline.start()
+
+
+def stop_write_pipeline():
+    global write_pipeline
+    if write_pipeline is not None:
+        write_pipeline.stop()
+        write_pipeline.engine.dispose()
+        write_pipeline = None
+
+
+async def run_write(
+    session: Session,
+    operation: WriteOperation,
+    response_model: Optional[type[BaseModel]] = None,
+) -> Any:
+    """
+    Run a write operation, through the group commit writer when it is enabled
+    or directly on the request session otherwise, where it is rolled back and
+    run again after a lock error (see base/retry.py). Sessions whose commit is
+    deferred, like the one of an atomic batch, always run it directly, once.
+    Args:
+        session (Session): The session of the request.
+        operation (Callable[[Session], Any]): Runs the repository method with the
+            session it is given.
+        response_model (Optional[type[BaseModel]]): The response model of the
+            route. Through the writer, the result is validated into it before
+            the group is committed, while relationships can still be loaded.
+    Returns:
+        Any: The result of the operation.
+    """
+
+    if session.info.get(DEFERRED_COMMIT):
+        # the owner of the transaction decides what to do with lock errors
+        return operation(session)
+    if write_pipeline is None:
+        return await db_retry.run_async(session, operation)
+
+    def serialized_operation(writer_session: Session):
+        result = operation(writer_session)
+        if response_model is not None:
+            return response_model.model_validate(result)
+        return result
+
+    return await write_pipeline.run(serialized_operation)
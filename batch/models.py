@@ -0,0 +1,33 @@
+from typing import Any, Literal, Optional
+
+from sqlmodel import Field, SQLModel
+
+from base import settings
+
+
+class BatchCall(SQLModel):
+    method: Literal["GET", "POST", "PUT", "PATCH", "DELETE"]
+    # path and query string, e.g. "/movies?ids=1,2"; "{{0.id}}" is replaced by
+    # the `id` of the body of the first response
+    path: str
+    body: Optional[Any] = None
+    headers: dict[str, str] = {}
+
+
+class BatchRequest(SQLModel):
+    requests: list[BatchCall] = Field(
+        min_length=1, max_length=settings.BATCH_MAX_REQUESTS
+    )
+    # run every call in one transaction, committed only if they all succeed
+    atomic: bool = False
+
+
+class BatchResult(SQLModel):
+    status: int
+    headers: dict[str, str] = {}
+    body: Optional[Any] = None
+
+
+class BatchResponse(SQLModel):
+    committed: bool
+    responses: list[BatchResult]
@@ -0,0 +1,194 @@
+import json
+import re
+from typing import Any
+
+from fastapi import Request
+from sqlmodel import Session
+
+from base import settings
+from base.admission import OVERLOADED_DETAIL, admission_limit
+from base.db_connection import batch_session
+from base.repository import DEFERRED_COMMIT
+from batch.models import BatchCall, BatchRequest, BatchResponse, BatchResult
+
+# "{{2.details.0.id}}": a value of the body of a previous response
+REFERENCE = re.compile(r"\{\{(\d+)((?:\.[\w-]+)*)\}\}")
+
+
+class BatchError(Exception):
+    """
+    Raised for a call that cannot be run, reported as its result.
+    """
+
+    def __init__(self, status: int, detail: str):
+        self.status = status
+        self.detail = detail
+
+
+async def run_batch(
+    request: Request, batch: BatchRequest, session: Session
+) -> BatchResponse:
+    """
+    Run the calls of a batch, in order, through the routers of the application.
+    The calls skip the middlewares and share the session of the batch request
+    (see `batch_session`), so they see the writes of the previous calls. Every
+    call is admitted against the admission limit of its router, like a request
+    of its own; a call rejected by the limit is answered 503.
+    Without `atomic` every call commits as it would on its own and a failing
+    call does not stop the batch. With `atomic` commits are deferred; the batch
+    stops at the first failing call and its writes are rolled back.
+    Args:
+        request (Request): The batch request, whose scope the calls inherit.
+        batch (BatchRequest): The calls and the transaction mode.
+        session (Session): The read-write session of the batch request.
+    Returns:
+        BatchResponse: The status, headers and body of every call, in order, and
+                       whether the writes were committed.
+    """
+
+    results: list[BatchResult] = []
+    failed = False
+    token = batch_session.set(session)
+    if batch.atomic:
+        session.info[DEFERRED_COMMIT] = True
+    try:
+        for call in batch.requests:
+            if failed:
+                results.append(
+                    BatchResult(
+                        status=424,
+                        body={"detail": "A previous call of the atomic batch failed"},
+                    )
+                )
+                continue
+            try:
+                result = await _run_call(request, call, results, batch.atomic)
+            except BatchError as exc:
+                result = BatchResult(status=exc.status, body={"detail": exc.detail})
+            results.append(result)
+            if result.status >= 400:
+                failed = batch.atomic
+                session.rollback()
+            elif not batch.atomic:
+                # end the transaction, so the next call reads fresh data
+                session.commit()
+        if batch.atomic and not failed:
+            session.commit()
+    except BaseException:
+        session.rollback()
+        raise
+    finally:
+        session.info.pop(DEFERRED_COMMIT, None)
+        batch_session.reset(token)
+    return BatchResponse(committed=not failed, responses=results)
+
+
+async def _run_call(
+    request: Request, call: BatchCall, results: list[BatchResult], atomic: bool
+) -> BatchResult:
+    path = REFERENCE.sub(
+        lambda match: str(_reference(match, results)), call.path
+    ).strip()
+    path, _, query = path.partition("?")
+    if not path.startswith("/") or path.startswith("/batch"):
+        raise BatchError(400, f"Invalid path: {path}")
+    if atomic and any(name.lower() == "idempotency-key" for name in call.headers):
+        raise BatchError(400, "Idempotency-Key is not supported in atomic batches")
+
+    body = b""
+    if call.body is not None:
+        body = json.dumps(_resolve(call.body, results)).encode()
+    headers = [
+        (name.lower().encode(), value.encode()) for name, value in call.headers.items()
+    ]
+    headers += [
+        (b"content-type", b"application/json"),
+        (b"content-length", str(len(body)).encode()),
+    ]
+    scope = {
+        **{
+            key: value
+            for key, value in request.scope.items()
+            if key not in ("route", "endpoint", "path_params", "router")
+            and not key.startswith("fastapi_")
+        },
+        "method": call.method,
+        "path": path,
+        "raw_path": path.encode(),
+        "query_string": query.encode(),
+        "headers": headers,
+    }
+
+    received = False
+
+    async def receive():
+        nonlocal received
+        if received:
+            return {"type": "http.disconnect"}
+        received = True
+        return {"type": "http.request", "body": body, "more_body": False}
+
+    status = 500
+    response_headers: dict[str, str] = {}
+    chunks: list[bytes] = []
+
+    async def send(message):
+        nonlocal status
+        if message["type"] == "http.response.start":
+            status = message["status"]
+            for name, value in message.get("headers", ()):
+                if name.lower() != b"content-length":
+                    response_headers[name.decode()] = value.decode()
+        elif message["type"] == "http.response.body":
+            chunks.append(message.get("body", b""))
+
+    limit = admission_limit(call.method, path)
+    if limit is not None and not await limit.acquire():
+        return BatchResult(
+            status=503,
+            headers={"Retry-After": str(settings.ADMISSION_RETRY_AFTER_SECONDS)},
+            body={"detail": OVERLOADED_DETAIL},
+        )
+    try:
+        await request.app.router(scope, receive, send)
+    except Exception:
+        return BatchResult(status=500, body={"detail": "Internal Server Error"})
+    finally:
+        if limit is not None:
+            limit.release()
+
+    content = b"".join(chunks)
+    response_body: Any = content.decode() or None
+    if content and response_headers.get("content-type", "").startswith(
+        "application/json"
+    ):
+        response_body = json.loads(content)
+    return BatchResult(status=status, headers=response_headers, body=response_body)
+
+
+def _reference(match: re.Match, results: list[BatchResult]) -> Any:
+    index = int(match.group(1))
+    if index >= len(results):
+        raise BatchError(400, f"{match.group(0)} refers to a later call")
+    value = results[index].body
+    for key in match.group(2).split(".")[1:]:
+        if value is None:
+            raise BatchError(400, f"{match.group(0)} not found")
+        try:
+            value = value[int(key)] if isinstance(value, list) else value[key]
+        except (KeyError, IndexError, ValueError, TypeError):
+            raise BatchError(400, f"{match.group(0)} not found")
+    return value
+
+
+def _resolve(value: Any, results: list[BatchResult]) -> Any:
+    # a string that is only a reference takes the type of the referenced value
+    if isinstance(value, str):
+        if match := REFERENCE.fullmatch(value):
+            return _reference(match, results)
+        return REFERENCE.sub(lambda match: str(_reference(match, results)), value)
+    if isinstance(value, list):
+        return [_resolve(item, results) for item in value]
+    if isinstance(value, dict):
+        return {key: _resolve(item, results) for key, item in value.items()}
+    return value
@@ -0,0 +1,111 @@
+from fastapi.testclient import TestClient
+
+from base.admission import AdmissionLimit, admission_limits
+
+
+def test_batch_create_rent_and_fetch(client: TestClient):
+    """
+    Test a batch that creates a client, rents a copy for it and fetches the
+    rent, using references to the previous responses.
+    Args:
+        client (TestClient): The test client used to simulate API requests.
+    """
+
+    response = client.post(
+        "/batch",
+        json={
+            "requests": [
+                {
+                    "method": "POST",
+                    "path": "/clients/",
+                    "body": {
+                        "first_name": "Ada",
+                        "last_name": "Lovelace",
+                        "address": "London",
+                        "license_number": 1815,
+                    },
+                },
+                {
+                    "method": "POST",
+                    "path": "/movie_rents",
+                    "body": {
+                        "client_id": "{{0.id}}",
+                        "details": [{"movie_copy_id": 2}],
+                    },
+                },
+                {"method": "GET", "path": "/movie_rents/{{1.id}}"},
+                {"method": "GET", "path": "/clients/0"},
+            ]
+        },
+    )
+    data = response.json()
+    assert response.status_code == 200
+    assert data["committed"] is True
+    statuses = [result["status"] for result in data["responses"]]
+    assert statuses == [200, 200, 200, 404]
+    client_id = data["responses"][0]["body"]["id"]
+    assert data["responses"][2]["body"]["client_id"] == client_id
+    assert client.get(f"/clients/{client_id}").status_code == 200
+
+
+def test_batch_atomic_rolls_back(client: TestClient):
+    """
+    Test that an atomic batch with a failing call commits nothing and skips
+    the calls after the failure.
+    Args:
+        client (TestClient): The test client used to simulate API requests.
+    """
+
+    clients_before = len(client.get("/clients/").json())
+    response = client.post(
+        "/batch",
+        json={
+            "atomic": True,
+            "requests": [
+                {
+                    "method": "POST",
+                    "path": "/clients/",
+                    "body": {
+                        "first_name": "Alan",
+                        "last_name": "Turing",
+                        "address": "Manchester",
+                        "license_number": 1912,
+                    },
+                },
+                {"method": "PUT", "path": "/movie_rents/0/close"},
+                {"method": "GET", "path": "/clients/{{0.id}}"},
+            ],
+        },
+    )
+    data = response.json()
+    assert response.status_code == 200
+    assert data["committed"] is False
+    assert [result["status"] for result in data["responses"]][2] == 424
+    assert len(client.get("/clients/").json()) == clients_before
+
+
+def test_batch_calls_are_admitted(client: TestClient, monkeypatch):
+    """
+    Test that the calls of a batch are admitted against the limits of their
+    routers, so a saturated router rejects its calls while the others run.
+    Args:
+        client (TestClient): The test client used to simulate API requests.
+        monkeypatch: Replaces the limit of the movie reads.
+    """
+
+    monkeypatch.setitem(admission_limits, "movies.read", AdmissionLimit(0, 0, 0))
+    response = client.post(
+        "/batch",
+        json={
+            "requests": [
+                {"method": "GET", "path": "/movies"},
+                {"method": "GET", "path": "/clients/"},
+            ]
+        },
+    )
+    data = response.json()
+    assert response.status_code == 200
+    assert [result["status"] for result in data["responses"]] == [503, 200]
+    assert data["responses"][0]["headers"]["Retry-After"] == "1"
+    assert admission_limits["movies.read"].metrics.rejected == 1
+    assert admission_limits["clients.read"].active == 0
@@ -0,0 +1,34 @@
+from fastapi import APIRouter, Request
+
+from base.db_connection import SessionDep
+from batch.models import BatchRequest, BatchResponse
+from batch.services import run_batch
+
+router = APIRouter()
+
+
+@router.post("/batch", tags=["batch"], response_model=BatchResponse)
+async def batch(request: Request, batch: BatchRequest, session: SessionDep):
+    """
+    Run several API calls in one HTTP request.
+    The calls run in order, in-process, against one shared session. Strings like
+    "{{0.id}}" in the path or body of a call are replaced by values of the body
+    of a previous response. With `atomic`, the calls run in one transaction that
+    is committed only if they all succeed; the calls after a failure are
+    answered with 424.
+    Args:
+        request (Request): The incoming request.
+        batch (BatchRequest): The calls, at most BATCH_MAX_REQUESTS, and the
+            transaction mode.
+        session (SessionDep): The database session shared by the calls.
+    Returns:
+        BatchResponse: The status, headers and body of every call, and whether
+                       the writes were committed.
+    Example:
+        {"atomic": true, "requests": [
+            {"method": "POST", "path": "/movie_rents",
+             "body": {"client_id": 1, "details": [{"movie_copy_id": 2}]}},
+            {"method": "GET", "path": "/movie_rents/{{0.id}}"}]}
+    """
+
+    return await run_batch(request, batch, session)
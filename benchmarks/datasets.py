@@ -0,0 +1,47 @@
+from sqlalchemy import Engine, func
+from sqlmodel import Session, select
+
+from base.repository import model_table
+from clients.models import Client
+from datasets.generator import DatasetGenerator, GeneratorConfig
+from movie_rents.models import MovieRent
+from movies.models import Movie, MovieCopy
+
+SCALES = {
+    "1k": 1_000,
+    "100k": 100_000,
+    "1M": 1_000_000,
+}
+
+
+def build_database(path: str, rows: int, seed: int = 42) -> Engine:
+    """
+    Create a SQLite database populated with synthetic data for benchmarking.
+    `rows` is the number of rents, the other tables are sized from it by
+    `datasets.generator.GeneratorConfig`.
+    Args:
+        path (str): The SQLite file to create.
+        rows (int): The number of rents.
+        seed (int): The seed of the generator, so runs are repeatable.
+    Returns:
+        Engine: An engine connected to the populated database.
+    """
+
+    return DatasetGenerator(GeneratorConfig(rents=rows, seed=seed)).write_sqlite(path)
+
+
+def count_rows(engine: Engine) -> dict[str, int]:
+    """
+    Count the rows of the tables the benchmarks pick random ids from.
+    Args:
+        engine (Engine): The engine connected to the benchmark database.
+    Returns:
+        dict[str, int]: The row count of each table, keyed by table name.
+    """
+
+    counts = {}
+    with Session(engine) as session:
+        for model in (Movie, MovieCopy, Client, MovieRent):
+            statement = select(func.count()).select_from(model)
+            counts[model_table(model).name] = session.exec(statement).one()
+    return counts
@@ -0,0 +1,159 @@
+import argparse
+import json
+import os
+import shutil
+import sys
+import tempfile
+
+from sqlmodel import create_engine
+
+from benchmarks.datasets import SCALES, build_database, count_rows
+from benchmarks.suite import CASES, run_suite
+
+BASE_DIR = os.path.dirname(os.path.abspath(__file__))
+DATA_DIR = os.path.join(BASE_DIR, ".data")
+BASELINES_DIR = os.path.join(BASE_DIR, "baselines")
+
+DEFAULT_THRESHOLD = 20.0
+
+
+def baseline_path(scale: str) -> str:
+    return os.path.join(BASELINES_DIR, f"{scale}.json")
+
+
+def load_baseline(scale: str) -> dict | None:
+    path = baseline_path(scale)
+    if not os.path.exists(path):
+        return None
+    with open(path) as f:
+        return json.load(f)
+
+
+def save_baseline(scale: str, results: dict):
+    os.makedirs(BASELINES_DIR, exist_ok=True)
+    with open(baseline_path(scale), "w") as f:
+        json.dump(results, f, indent=4, sort_keys=True)
+        f.write("\n")
+
+
+def compare(
+    results: dict, baseline: dict, threshold: float = DEFAULT_THRESHOLD
+) -> list[dict]:
+    """
+    Compare benchmark results against a baseline.
+    A case regresses when its median is more than `threshold` percent slower
+    than the baseline median. Cases missing from the baseline are ignored.
+    Args:
+        results (dict): The timing statistics keyed by case name.
+        baseline (dict): The baseline timing statistics keyed by case name.
+        threshold (float): The allowed slowdown, in percent.
+    Returns:
+        list[dict]: The regressed cases with their baseline and current medians.
+    """
+
+    regressions = []
+    for name, stats in results.items():
+        if name not in baseline:
+            continue
+        before = baseline[name]["median_ms"]
+        after = stats["median_ms"]
+        change = (after - before) / before * 100 if before else 0.0
+        if change > threshold:
+            regressions.append(
+                {
+                    "name": name,
+                    "baseline_ms": before,
+                    "current_ms": after,
+                    "change_percent": round(change, 2),
+                }
+            )
+    return regressions
+
+
+def prepare_database(scale: str) -> str:
+    """
+    Return the cached synthetic database of a scale, building it on first use.
+    Args:
+        scale (str): One of the keys of `SCALES`.
+    Returns:
+        str: The path of the SQLite file.
+    """
+
+    os.makedirs(DATA_DIR, exist_ok=True)
+    path = os.path.join(DATA_DIR, f"{scale}.db")
+    if not os.path.exists(path):
+        build_database(path + ".tmp", SCALES[scale]).dispose()
+        os.replace(path + ".tmp", path)
+    return path
+
+
+def run(
+    scale: str,
+    case_names: list[str] | None = None,
+    repeat: int | None = None,
+    memory: bool = False,
+):
+    """
+    Run the benchmark suite against a scratch copy of the cached database of a
+    scale, so write benchmarks never alter the cached data.
+    """
+
+    cases = [case for case in CASES if not case_names or case.name in case_names]
+    with tempfile.TemporaryDirectory() as directory:
+        path = os.path.join(directory, "benchmark.db")
+        shutil.copyfile(prepare_database(scale), path)
+        engine = create_engine(f"sqlite:///{path}")
+        try:
+            return run_suite(engine, count_rows(engine), cases, repeat, memory)
+        finally:
+            engine.dispose()
+
+
+def main(argv=None) -> int:
+    parser = argparse.ArgumentParser(description="Repository micro-benchmarks")
+    parser.add_argument("--scale", choices=SCALES.keys(), default="1k")
+    parser.add_argument("--cases", help="comma separated case names to run")
+    parser.add_argument("--repeat", type=int, help="timed calls per case")
+    parser.add_argument(
+        "--memory",
+        action="store_true",
+        help="also report the peak and retained allocations of every case",
+    )
+    parser.add_argument(
+        "--threshold",
+        type=float,
+        default=DEFAULT_THRESHOLD,
+        help="allowed slowdown against the baseline, in percent",
+    )
+    parser.add_argument(
+        "--save-baseline",
+        action="store_true",
+        help="store the results as the new baseline of the scale",
+    )
+    args = parser.parse_args(argv)
+
+    case_names = args.cases.split(",") if args.cases else None
+    results = run(args.scale, case_names, args.repeat, args.memory)
+    print(json.dumps(results, indent=4, sort_keys=True))
+
+    if args.save_baseline:
+        save_baseline(args.scale, results)
+        print(f"Baseline saved to {baseline_path(args.scale)}")
+        return 0
+
+    baseline = load_baseline(args.scale)
+    if baseline is None:
+        print(f"No baseline for scale {args.scale}, run with --save-baseline")
+        return 0
+
+    regressions = compare(results, baseline, args.threshold)
+    for regression in regressions:
+        print(
+            "REGRESSION {name}: {baseline_ms}ms -> {current_ms}ms "
+            "(+{change_percent}%)".format(**regression)
+        )
+    return 1 if regressions else 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,254 @@
+import itertools
+import random
+import statistics
+import time
+import tracemalloc
+from dataclasses import dataclass
+from typing import Any, Callable
+
+from sqlalchemy import Engine
+from sqlmodel import Session
+
+from base.memory import track_allocations
+from clients.repositories import ClientRepository
+from movie_rents.models import MovieRentCreate, MovieRentDetail, MovieRentUpdate
+from movie_rents.repositories import MovieRentRepository
+from movies.models import MovieCreate, MovieUpdate
+from movies.repositories import MovieRepository
+
+
+@dataclass
+class BenchmarkCase:
+    """
+    A single repository method to time.
+    Attributes:
+        name (str): The name the results and baselines are keyed by.
+        run (Callable): Receives a session, a random generator and the table
+            row counts, and calls the repository method once.
+        repeat (int): The number of timed calls.
+    """
+
+    name: str
+    run: Callable[[Session, random.Random, dict[str, int]], Any]
+    repeat: int = 50
+
+
+def _movie_payload(rng: random.Random, stock: int) -> dict:
+    return {
+        "title": f"Benchmark movie {rng.randint(1, 10**9)}",
+        "description": "Benchmark movie",
+        "year": 2025,
+        "director": "Benchmark director",
+        "genre_id": 1,
+        "stock": stock,
+    }
+
+
+def _details(rng: random.Random, counts: dict[str, int], size: int):
+    return [
+        MovieRentDetail(movie_copy_id=rng.randint(1, counts["moviecopy"]))
+        for _ in range(size)
+    ]
+
+
+def _add_with_stock(session, rng, counts):
+    movie = MovieCreate(**_movie_payload(rng, stock=5))
+    return MovieRepository(session).add_with_stock(movie)
+
+
+# update_with_stock removes the oldest copies when the stock shrinks, and those
+# may be referenced by rents, so the benchmark only ever grows the stock.
+_growing_stock = itertools.count(20)
+
+
+def _update_with_stock(session, rng, counts):
+    movie = MovieUpdate(**_movie_payload(rng, stock=next(_growing_stock)))
+    return MovieRepository(session).update_with_stock(
+        rng.randint(1, counts["movie"]), movie
+    )
+
+
+def _add_rent(session, rng, counts):
+    movie_rent = MovieRentCreate(
+        client_id=rng.randint(1, counts["client"]),
+        details=_details(rng, counts, 2),
+    )
+    return MovieRentRepository(session).add_rent(movie_rent)
+
+
+def _update_rent(session, rng, counts):
+    movie_rent = MovieRentUpdate(
+        client_id=rng.randint(1, counts["client"]),
+        details=_details(rng, counts, 3),
+    )
+    return MovieRentRepository(session).update_rent(
+        rng.randint(1, counts["movierent"]), movie_rent
+    )
+
+
+CASES = [
+    BenchmarkCase(
+        "movies.get",
+        lambda session, rng, counts: MovieRepository(session).get(
+            rng.randint(1, counts["movie"])
+        ),
+    ),
+    BenchmarkCase(
+        "movies.get_all",
+        lambda session, rng, counts: MovieRepository(session).get_all(),
+        repeat=3,
+    ),
+    BenchmarkCase("movies.add_with_stock", _add_with_stock),
+    BenchmarkCase("movies.update_with_stock", _update_with_stock),
+    BenchmarkCase(
+        "clients.get",
+        lambda session, rng, counts: ClientRepository(session).get(
+            rng.randint(1, counts["client"])
+        ),
+    ),
+    BenchmarkCase(
+        "clients.get_all",
+        lambda session, rng, counts: ClientRepository(session).get_all(),
+        repeat=3,
+    ),
+    BenchmarkCase(
+        "movie_rents.get",
+        lambda session, rng, counts: MovieRentRepository(session).get(
+            rng.randint(1, counts["movierent"])
+        ),
+    ),
+    BenchmarkCase(
+        "movie_rents.get_all",
+        lambda session, rng, counts: MovieRentRepository(session).get_all(),
+        repeat=3,
+    ),
+    BenchmarkCase("movie_rents.add_rent", _add_rent),
+    BenchmarkCase("movie_rents.update_rent", _update_rent),
+    BenchmarkCase(
+        "movie_rents.close_rent",
+        lambda session, rng, counts: MovieRentRepository(session).close_rent(
+            rng.randint(1, counts["movierent"])
+        ),
+    ),
+]
+
+
+def _percentile(samples: list[float], percent: float) -> float:
+    ordered = sorted(samples)
+    index = min(len(ordered) - 1, round(percent / 100 * (len(ordered) - 1)))
+    return ordered[index]
+
+
+def run_case(
+    engine: Engine,
+    case: BenchmarkCase,
+    counts: dict[str, int],
+    seed: int = 42,
+    repeat: int | None = None,
+) -> dict[str, float]:
+    """
+    Time a benchmark case, using a fresh session for every call.
+    One untimed call warms up the connection pool and the SQLite page cache.
+    Args:
+        engine (Engine): The engine connected to the benchmark database.
+        case (BenchmarkCase): The case to run.
+        counts (dict[str, int]): The row counts of the benchmark tables.
+        seed (int): The seed of the random generator used to pick ids.
+        repeat (int | None): Overrides the number of timed calls of the case.
+    Returns:
+        dict[str, float]: The timing statistics of the case, in milliseconds.
+    """
+
+    rng = random.Random(seed)
+    repeat = repeat or case.repeat
+    samples = []
+    for i in range(repeat + 1):
+        with Session(engine) as session:
+            start = time.perf_counter()
+            case.run(session, rng, counts)
+            elapsed = (time.perf_counter() - start) * 1000
+        if i:
+            samples.append(elapsed)
+
+    return {
+        "repeat": repeat,
+        "min_ms": round(min(samples), 4),
+        "median_ms": round(statistics.median(samples), 4),
+        "p95_ms": round(_percentile(samples, 95), 4),
+        "mean_ms": round(statistics.fmean(samples), 4),
+    }
+
+
+def measure_case_memory(
+    engine: Engine,
+    case: BenchmarkCase,
+    counts: dict[str, int],
+    seed: int = 42,
+    repeat: int | None = None,
+) -> dict[str, float]:
+    """
+    Measure the allocations of a benchmark case with tracemalloc. This runs
+    separately from the timing loop because tracing slows every allocation down.
+    The retained memory is measured after the session is closed, so it only
+    counts what outlives the call, such as caches.
+    Args:
+        engine (Engine): The engine connected to the benchmark database.
+        case (BenchmarkCase): The case to run.
+        counts (dict[str, int]): The row counts of the benchmark tables.
+        seed (int): The seed of the random generator used to pick ids.
+        repeat (int | None): Overrides the number of measured calls of the case.
+    Returns:
+        dict[str, float]: The highest peak and retained allocations, in KiB.
+    """
+
+    rng = random.Random(seed)
+    repeat = min(repeat or case.repeat, 5)
+    started = not tracemalloc.is_tracing()
+    if started:
+        tracemalloc.start()
+    peak = retained = 0
+    try:
+        for _ in range(repeat):
+            with track_allocations() as sample:
+                with Session(engine) as session:
+                    result = case.run(session, rng, counts)
+                del result
+            peak = max(peak, sample.peak)
+            retained = max(retained, sample.retained)
+    finally:
+        if started:
+            tracemalloc.stop()
+
+    return {
+        "peak_kib": round(peak / 1024, 2),
+        "retained_kib": round(retained / 1024, 2),
+    }
+
+
+def run_suite(
+    engine: Engine,
+    counts: dict[str, int],
+    cases: list[BenchmarkCase] | None = None,
+    repeat: int | None = None,
+    memory: bool = False,
+) -> dict[str, dict[str, float]]:
+    """
+    Run every benchmark case against the same database.
+    Args:
+        engine (Engine): The engine connected to the benchmark database.
+        counts (dict[str, int]): The row counts of the benchmark tables.
+        cases (list[BenchmarkCase] | None): The cases to run, all by default.
+        repeat (int | None): Overrides the number of timed calls of every case.
+        memory (bool): Also measure the allocations of every case.
+    Returns:
+        dict[str, dict[str, float]]: The statistics keyed by case name.
+    """
+
+    results = {}
+    for case in cases or CASES:
+        results[case.name] = run_case(engine, case, counts, repeat=repeat)
+        if memory:
+            results[case.name].update(
+                measure_case_memory(engine, case, counts, repeat=repeat)
+            )
+    return results
@@ -0,0 +1,54 @@
+import os
+
+from benchmarks.datasets import build_database, count_rows
+from benchmarks.runner import compare
+from benchmarks.suite import CASES, run_suite
+
+
+def test_compare_flags_regressions_over_threshold():
+    """
+    Test that only the cases slower than the threshold are reported, and that
+    cases without a baseline are ignored.
+    """
+
+    baseline = {"movies.get": {"median_ms": 1.0}, "clients.get": {"median_ms": 1.0}}
+    results = {
+        "movies.get": {"median_ms": 1.5},
+        "clients.get": {"median_ms": 1.1},
+        "movie_rents.get": {"median_ms": 9.0},
+    }
+
+    regressions = compare(results, baseline, threshold=20)
+
+    assert [regression["name"] for regression in regressions] == ["movies.get"]
+    assert regressions[0]["change_percent"] == 50.0
+
+
+def test_run_suite_times_every_case(tmp_path):
+    """
+    Test that the whole suite runs against a small synthetic database and
+    reports statistics for every repository method.
+    """
+
+    engine = build_database(os.path.join(tmp_path, "benchmark.db"), rows=200)
+    results = run_suite(engine, count_rows(engine), repeat=2)
+    engine.dispose()
+
+    assert set(results) == {case.name for case in CASES}
+    for stats in results.values():
+        assert stats["repeat"] == 2
+        assert 0 <= stats["min_ms"] <= stats["median_ms"] <= stats["p95_ms"]
+
+
+def test_run_suite_measures_memory(tmp_path):
+    """
+    Test that the suite reports the allocations of a case when asked to.
+    """
+
+    engine = build_database(os.path.join(tmp_path, "benchmark.db"), rows=200)
+    cases = [case for case in CASES if case.name == "movie_rents.get_all"]
+    results = run_suite(engine, count_rows(engine), cases, repeat=1, memory=True)
+    engine.dispose()
+
+    assert results["movie_rents.get_all"]["peak_kib"] > 0
+    assert "retained_kib" in results["movie_rents.get_all"]
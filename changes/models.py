@@ -0,0 +1,38 @@
+from datetime import datetime
+from typing import Any, Optional
+
+from sqlmodel import Field, SQLModel
+
+
+class ChangeLog(SQLModel, table=True):
+    """
+    Append-only log of the changes of the catalog and the rents, written in the
+    transaction of the change. AUTOINCREMENT never reuses a sequence number and
+    SQLite commits one writer at a time, so sequence numbers follow commit order.
+    """
+
+    __table_args__ = {"sqlite_autoincrement": True}
+
+    seq: Optional[int] = Field(default=None, primary_key=True)
+    entity: str
+    entity_id: int
+    operation: str  # insert, update or delete
+    data: Optional[str] = None  # the row after the change, as JSON
+    created_at: datetime = Field(default_factory=datetime.now)
+
+
+class Change(SQLModel):
+    seq: int
+    entity: str
+    entity_id: int
+    operation: str
+    data: Optional[dict[str, Any]] = None
+    created_at: datetime
+
+
+class ChangePage(SQLModel):
+    changes: list[Change]
+    # pass it as `since` to get the next changes
+    next_since: int
+    has_more: bool
+    latest_seq: int
@@ -0,0 +1,157 @@
+import json
+from datetime import datetime, timedelta
+from typing import Iterable
+
+from fastapi.encoders import jsonable_encoder
+from sqlalchemy import delete, event, func, insert
+from sqlmodel import Session, col, select
+
+from changes.models import Change, ChangeLog, ChangePage
+from clients.models import Client
+from movie_rents.models import MovieRent, MovieRentDetail
+from movies.models import Genre, Movie, MovieCopy
+
+# the models whose changes are published
+TRACKED_MODELS = (Genre, Movie, MovieCopy, Client, MovieRent, MovieRentDetail)
+
+
+class ChangesPruned(Exception):
+    """
+    Raised when the changes after `since` were pruned from the log, so the
+    client has to download the data again.
+    """
+
+
+def _row(instance) -> dict:
+    return {
+        column.key: getattr(instance, column.key)
+        for column in instance.__table__.columns
+    }
+
+
+def _entry(entity: str, entity_id: int, operation: str, data=None) -> dict:
+    return {
+        "entity": entity,
+        "entity_id": entity_id,
+        "operation": operation,
+        "data": json.dumps(jsonable_encoder(data), separators=(",", ":"))
+        if data is not None
+        else None,
+        "created_at": datetime.now(),
+    }
+
+
+def _write(session: Session, entries: list[dict]):
+    if entries:
+        session.connection().execute(insert(ChangeLog), entries)
+
+
+@event.listens_for(Session, "after_flush")
+def _log_flushed_changes(session, flush_context):
+    # the new, dirty and deleted collections still hold the flushed objects
+    entries = []
+    for instance in session.new:
+        if isinstance(instance, TRACKED_MODELS):
+            entries.append(
+                _entry(instance.__tablename__, instance.id, "insert", _row(instance))
+            )
+    for instance in session.dirty:
+        if isinstance(instance, TRACKED_MODELS) and session.is_modified(instance):
+            entries.append(
+                _entry(instance.__tablename__, instance.id, "update", _row(instance))
+            )
+    for instance in session.deleted:
+        if isinstance(instance, TRACKED_MODELS):
+            entries.append(_entry(instance.__tablename__, instance.id, "delete"))
+    _write(session, entries)
+
+
+def record_updates(session: Session, model, ids: Iterable[int]):
+    """
+    Log the current rows of a tracked model after a bulk UPDATE, which bypasses
+    the flush.
+    """
+
+    ids = list(ids)
+    if not ids:
+        return
+    rows = session.exec(select(model).where(col(model.id).in_(ids)))
+    _write(
+        session,
+        [_entry(model.__tablename__, row.id, "update", _row(row)) for row in rows],
+    )
+
+
+def record_deletes(session: Session, model, ids: Iterable[int]):
+    """
+    Log the deletion of rows of a tracked model by a bulk DELETE.
+    """
+
+    _write(session, [_entry(model.__tablename__, id, "delete") for id in ids])
+
+
+def get_changes(session: Session, since: int, limit: int) -> ChangePage:
+    """
+    Retrieve the changes logged after a sequence number, oldest first.
+    Args:
+        session (Session): The session used to read the log.
+        since (int): The last sequence number the client applied, 0 at first.
+        limit (int): The maximum number of changes.
+    Returns:
+        ChangePage: The changes, the `since` of the next page, whether more
+                    changes follow and the latest sequence number.
+    Raises:
+        ChangesPruned: If changes after `since` were pruned.
+    """
+
+    first_seq, latest_seq = session.exec(
+        select(func.min(ChangeLog.seq), func.max(ChangeLog.seq))
+    ).one()
+    # sequence numbers start at 1, a log starting later was pruned
+    if first_seq is not None and first_seq > 1 and since + 1 < first_seq:
+        raise ChangesPruned(since)
+
+    rows = session.exec(
+        select(ChangeLog)
+        .where(col(ChangeLog.seq) > since)
+        .order_by(col(ChangeLog.seq))
+        .limit(limit + 1)
+    ).all()
+    has_more = len(rows) > limit
+    changes = [
+        Change(
+            seq=row.seq,  # type: ignore
+            entity=row.entity,
+            entity_id=row.entity_id,
+            operation=row.operation,
+            data=json.loads(row.data) if row.data is not None else None,
+            created_at=row.created_at,
+        )
+        for row in rows[:limit]
+    ]
+    return ChangePage(
+        changes=changes,
+        next_since=changes[-1].seq if changes else max(since, 0),
+        has_more=has_more,
+        latest_seq=latest_seq or 0,
+    )
+
+
+def prune_changes(session: Session, older_than: timedelta) -> int:
+    """
+    Delete the changes logged before a given age, always keeping the latest
+    one so the log never restarts its sequence.
+    Returns:
+        int: The number of deleted changes.
+    """
+
+    latest_seq = session.exec(select(func.max(ChangeLog.seq))).one()
+    if latest_seq is None:
+        return 0
+    result = session.exec(
+        delete(ChangeLog).where(
+            col(ChangeLog.created_at) < datetime.now() - older_than,
+            col(ChangeLog.seq) < latest_seq,
+        )  # type: ignore
+    )
+    return result.rowcount
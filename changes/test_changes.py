@@ -0,0 +1,79 @@
+from fastapi.testclient import TestClient
+
+
+def test_changes_follow_rent_operations(client: TestClient):
+    """
+    Test that the change feed publishes the writes of a rent in order.
+    Steps:
+    1. Read the latest sequence number.
+    2. Create a rent and close it.
+    3. Page through the changes since the sequence number and check the rent,
+       its detail and the stock counters of the movie were published.
+    Args:
+        client (TestClient): The test client used to simulate API requests.
+    """
+
+    since = client.get("/changes", params={"limit": 1}).json()["latest_seq"]
+    response = client.post(
+        "/movie_rents",
+        json={"client_id": 1, "details": [{"movie_copy_id": 2}]},
+    )
+    rent_id = response.json()["id"]
+    client.put(f"/movie_rents/{rent_id}/close")
+
+    changes = []
+    while True:
+        page = client.get("/changes", params={"since": since, "limit": 2}).json()
+        changes += page["changes"]
+        since = page["next_since"]
+        if not page["has_more"]:
+            break
+
+    seqs = [change["seq"] for change in changes]
+    assert seqs == sorted(seqs) and len(seqs) == len(set(seqs))
+    rent_changes = [
+        change
+        for change in changes
+        if change["entity"] == "movierent" and change["entity_id"] == rent_id
+    ]
+    assert [change["operation"] for change in rent_changes] == ["insert", "update"]
+    assert rent_changes[-1]["data"]["is_closed"] is True
+    assert any(change["entity"] == "movierentdetail" for change in changes)
+    assert any(
+        change["entity"] == "movie" and change["operation"] == "update"
+        for change in changes
+    )
+
+
+def test_changes_follow_movie_stock(client: TestClient):
+    """
+    Test that the copies added by the stock routes are published with their
+    codes, both when a movie is created and when its stock is increased.
+    Args:
+        client (TestClient): The test client used to simulate API requests.
+    """
+
+    since = client.get("/changes", params={"limit": 1}).json()["latest_seq"]
+    payload = {
+        "title": "Spirited Away",
+        "director": "Hayao Miyazaki",
+        "year": 2001,
+        "description": "A girl in the spirit world",
+        "genre_id": 1,
+        "stock": 2,
+    }
+    movie_id = client.post("/movies/with_stock", json=payload).json()["id"]
+    client.put(f"/movies/{movie_id}/with_stock", json={**payload, "stock": 3})
+
+    changes = client.get("/changes", params={"since": since, "limit": 100}).json()[
+        "changes"
+    ]
+    copies = [
+        change
+        for change in changes
+        if change["entity"] == "moviecopy" and change["operation"] == "insert"
+    ]
+    assert len(copies) == 3
+    assert all(change["data"]["movie_id"] == movie_id for change in copies)
+    assert all(change["data"]["code"] for change in copies)
+    assert len({change["entity_id"] for change in copies}) == 3
@@ -0,0 +1,42 @@
+from typing import Annotated
+
+from fastapi import APIRouter, HTTPException, Query
+
+from base.db_connection import ReadSessionDep
+from changes.models import ChangePage
+from changes.services import ChangesPruned, get_changes
+
+router = APIRouter()
+
+
+@router.get("/changes", tags=["changes"], response_model=ChangePage)
+def list_changes(
+    session: ReadSessionDep,
+    since: Annotated[int, Query(ge=0)] = 0,
+    limit: Annotated[int, Query(ge=1, le=5000)] = 500,
+):
+    """
+    Retrieve the changes of genres, movies, copies, clients and rents logged
+    after a sequence number, oldest first, to sync a local copy incrementally.
+    A client downloads the data once, keeps the `latest_seq` of a first call and
+    then applies the changes of every page, passing its `next_since` as `since`
+    until `has_more` is false. `data` holds the row after an insert or update.
+    Args:
+        session (ReadSessionDep): The read-only database session dependency.
+        since (int): The last sequence number applied by the client.
+        limit (int): The maximum number of changes of the page.
+    Returns:
+        ChangePage: The changes, the `since` of the next page, whether more
+                    changes follow and the latest sequence number.
+    Raises:
+        HTTPException: 410 if changes after `since` were pruned, the client has
+                       to download the data again.
+    """
+
+    try:
+        return get_changes(session, since, limit)
+    except ChangesPruned:
+        raise HTTPException(
+            status_code=410,
+            detail="Changes since this sequence number were pruned, resync",
+        )
@@ -6,6 +6,8 @@ from clients.models import Client
 
 
 class ClientRepository(Repository[Client]):
+    model = Client
+
     def get(self, id: int):
         return self.session.get(Client, id)
 
@@ -16,7 +18,7 @@ class ClientRepository(Repository[Client]):
 
     def add(self, new_instance: Client) -> Client:
         self.session.add(new_instance)
-        self.session.commit()
+        self.commit()
         self.session.refresh(new_instance)
         return new_instance
 
@@ -27,12 +29,12 @@ class ClientRepository(Repository[Client]):
         instance_data = instance.model_dump(exclude_unset=True)
         db_instance.sqlmodel_update(instance_data)
         self.session.add(db_instance)
-        self.session.commit()
+        self.commit()
         self.session.refresh(db_instance)
         return db_instance
 
     def delete(self, id: int) -> bool:
         instance = self.session.get(Client, id)
         self.session.delete(instance)
-        self.session.commit()
+        self.commit()
         return True
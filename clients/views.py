@@ -1,6 +1,16 @@
-from fastapi import APIRouter, HTTPException
-
-from base.db_connection import SessionDep
+from typing import Annotated, Optional
+
+from fastapi import APIRouter, Depends, HTTPException
+
+from base.db_connection import ReadSessionDep, SessionDep
+from base.repository import (
+    FieldFilter,
+    QuerySpec,
+    parse_ids,
+    query_response,
+    query_spec,
+)
+from base.write_pipeline import run_write
 from clients.models import Client
 from clients.repositories import ClientRepository
 from sqlalchemy.orm.exc import UnmappedInstanceError
@@ -8,15 +18,24 @@ from sqlalchemy.orm.exc import UnmappedInstanceError
 
 router = APIRouter()
 
+ClientQueryDep = Annotated[QuerySpec, Depends(query_spec("ids"))]
+
 
 @router.get("/clients/", response_model=list[Client], tags=["clients"])
-async def get_clients(session: SessionDep):
+def get_clients(
+    session: ReadSessionDep, spec: ClientQueryDep, ids: Optional[str] = None
+):
     """
     Retrieve a list of all clients.
     Args:
-        session (SessionDep): The database session dependency.
+        session (ReadSessionDep): The read-only database session dependency.
+        spec (QuerySpec): Filters, sort keys, projection and page parsed from the
+                          query string, e.g. `?id__in=1,2&fields=id,last_name`.
+        ids (Optional[str]): Comma separated ids: only return these clients, in this
+                             order, with one query. Missing ids are skipped.
     Returns:
-        list[Client]: A list of all clients in the database.
+        list[Client]: A list of all clients in the database, or only the requested
+                      fields of the matching clients.
     Swagger:
         summary: Get all clients
         description: Fetches a list of all clients from the database.
@@ -32,16 +51,23 @@ async def get_clients(session: SessionDep):
     """
 
     repository = ClientRepository(session)
+    if ids is not None:
+        batch_ids = parse_ids(ids)
+        if not spec:
+            return repository.get_many(batch_ids)
+        spec.filters.append(FieldFilter("id", "in", batch_ids))
+    if spec:
+        return query_response(lambda: repository.query(spec))
     return repository.get_all()
 
 
 @router.get("/clients/{client_id}", response_model=Client, tags=["clients"])
-async def get_client(client_id: int, session: SessionDep):
+def get_client(client_id: int, session: ReadSessionDep):
     """
     Retrieve a client by their ID.
     Args:
         client_id (int): The unique identifier of the client to retrieve.
-        session (SessionDep): The database session dependency.
+        session (ReadSessionDep): The read-only database session dependency.
     Returns:
         dict: The client data if found.
     Raises:
@@ -118,8 +144,7 @@ async def create_client(client: Client, session: SessionDep):
                 description: Invalid input or error during creation.
     """
 
-    repository = ClientRepository(session)
-    return repository.add(client)
+    return await run_write(session, lambda s: ClientRepository(s).add(client), Client)
 
 
 @router.put("/clients/{client_id}", response_model=Client, tags=["clients"])
@@ -161,8 +186,9 @@ async def update_client(client_id: int, client: Client, session: SessionDep):
             description: Client not found.
     """
 
-    repository = ClientRepository(session)
-    updated_client = repository.update(client_id, client)
+    updated_client = await run_write(
+        session, lambda s: ClientRepository(s).update(client_id, client), Client
+    )
     if not updated_client:
         raise HTTPException(status_code=404, detail="Client not found")
     return updated_client
@@ -212,9 +238,8 @@ async def delete_client(client_id: int, session: SessionDep):
                                     example: Client not found
     """
 
-    repository = ClientRepository(session)
     try:
-        repository.delete(client_id)
+        await run_write(session, lambda s: ClientRepository(s).delete(client_id))
         return {"message": "Client deleted successfully"}
     except UnmappedInstanceError:
         raise HTTPException(status_code=404, detail="Client not found")
@@ -0,0 +1,323 @@
+import argparse
+import itertools
+import json
+import math
+import os
+import random
+from array import array
+from bisect import bisect_left
+from dataclasses import dataclass
+from datetime import datetime, timedelta
+from typing import Iterable, Iterator, Optional
+
+from sqlalchemy import Engine, Table, text
+from sqlmodel import Session, SQLModel, create_engine
+
+from clients.models import Client
+from movie_rents.models import MovieRent, MovieRentDetail
+from movies.models import Genre, Movie, MovieCopy
+from movies.services import refresh_stock_counters
+from analytics.services import rebuild_summaries
+
+CHUNK_SIZE = 10_000
+
+# Name of the file (and table) each generated entity goes to; they match the
+# files of the `datasets` folder.
+TABLES: dict[str, Table] = {
+    "genre": Genre.__table__,  # type: ignore
+    "movie": Movie.__table__,  # type: ignore
+    "moviecopy": MovieCopy.__table__,  # type: ignore
+    "client": Client.__table__,  # type: ignore
+    "movierent": MovieRent.__table__,  # type: ignore
+    "movierentdetail": MovieRentDetail.__table__,  # type: ignore
+}
+
+
+@dataclass
+class GeneratorConfig:
+    """
+    The shape of a synthetic dataset.
+    Attributes:
+        rents (int): The number of movie rents, which sets the scale of the dataset.
+        seed (int): The seed every random stream is derived from.
+        genres (int): The number of genres.
+        movies (Optional[int]): The number of movies, a tenth of the rents by default.
+        clients (Optional[int]): The number of clients, a tenth of the rents by default.
+        copies (Optional[int]): The number of movie copies, half the rents by default.
+        movie_popularity_exponent (float): The Zipf exponent of movie popularity,
+            used both for renting and for distributing copies.
+        client_activity_exponent (float): The Zipf exponent of client activity,
+            lower values give a longer tail of occasional clients.
+        open_ratio (float): The share of rents that are still open.
+        details_weights (tuple[float, ...]): The relative frequency of rents with
+            1, 2, 3... copies.
+        start (datetime): The creation date of the first rent.
+        days (int): The number of days the rents are spread over.
+    """
+
+    rents: int
+    seed: int = 42
+    genres: int = 20
+    movies: Optional[int] = None
+    clients: Optional[int] = None
+    copies: Optional[int] = None
+    movie_popularity_exponent: float = 1.1
+    client_activity_exponent: float = 0.8
+    open_ratio: float = 0.1
+    details_weights: tuple[float, ...] = (0.6, 0.3, 0.1)
+    start: datetime = datetime(2024, 1, 1)
+    days: int = 365
+
+    def __post_init__(self):
+        self.movies = self.movies or max(self.rents // 10, 1)
+        self.clients = self.clients or max(self.rents // 10, 1)
+        self.copies = max(self.copies or self.rents // 2, self.movies)
+
+
+class ZipfSampler:
+    """
+    Draw ranks 0..n-1 with probability proportional to 1 / (rank + 1) ** exponent.
+    Ranks are mapped to ids through a seeded permutation, so the most popular
+    items are spread over the whole id range instead of being the first ids.
+    """
+
+    def __init__(self, n: int, exponent: float, rng: random.Random):
+        total = 0.0
+        self.cumulative = array("d")
+        for rank in range(1, n + 1):
+            total += 1 / rank**exponent
+            self.cumulative.append(total)
+        self.total = total
+        self.ids = array("i", range(1, n + 1))
+        rng.shuffle(self.ids)  # type: ignore
+
+    def sample(self, rng: random.Random) -> int:
+        rank = bisect_left(self.cumulative, rng.random() * self.total)
+        return self.ids[min(rank, len(self.ids) - 1)]
+
+
+class DatasetGenerator:
+    """
+    Deterministic generator of genres, movies, copies, clients, rents and rent
+    details with a realistic skew. Every table is produced lazily, so datasets
+    of any scale are streamed without holding the rows in memory.
+    """
+
+    def __init__(self, config: GeneratorConfig):
+        self.config = config
+        self.movie_popularity = ZipfSampler(
+            config.movies,  # type: ignore
+            config.movie_popularity_exponent,
+            self._rng("movie_popularity"),
+        )
+        self.client_activity = ZipfSampler(
+            config.clients,  # type: ignore
+            config.client_activity_exponent,
+            self._rng("client_activity"),
+        )
+        self._copies_by_movie = self._distribute_copies()
+
+    def _rng(self, stream: str) -> random.Random:
+        return random.Random(f"{self.config.seed}-{stream}")
+
+    def _distribute_copies(self) -> array:
+        # every movie has at least one copy, popular movies get the rest
+        rng = self._rng("copies")
+        counts = array("i", itertools.repeat(1, self.config.movies + 1))  # type: ignore
+        counts[0] = 0
+        for _ in range(self.config.copies - self.config.movies):  # type: ignore
+            counts[self.movie_popularity.sample(rng)] += 1
+        # first copy id of every movie, copies are numbered movie by movie
+        first_copy = array("i", itertools.repeat(0, self.config.movies + 2))  # type: ignore
+        first_copy[1] = 1
+        for movie_id in range(1, self.config.movies + 1):  # type: ignore
+            first_copy[movie_id + 1] = first_copy[movie_id] + counts[movie_id]
+        return first_copy
+
+    def genres(self) -> Iterator[dict]:
+        for genre_id in range(1, self.config.genres + 1):
+            yield {
+                "id": genre_id,
+                "name": f"Genre {genre_id}",
+                "description": f"Movies of genre {genre_id}",
+            }
+
+    def movies(self) -> Iterator[dict]:
+        rng = self._rng("movies")
+        directors = max(self.config.movies // 5, 1)  # type: ignore
+        for movie_id in range(1, self.config.movies + 1):  # type: ignore
+            yield {
+                "id": movie_id,
+                "title": f"Movie {movie_id}",
+                "description": f"Description of movie {movie_id}",
+                "year": rng.randint(1950, self.config.start.year),
+                "director": f"Director {rng.randint(1, directors)}",
+                "genre_id": rng.randint(1, self.config.genres),
+            }
+
+    def movie_copies(self) -> Iterator[dict]:
+        first_copy = self._copies_by_movie
+        for movie_id in range(1, self.config.movies + 1):  # type: ignore
+            for copy_id in range(first_copy[movie_id], first_copy[movie_id + 1]):
+                yield {"id": copy_id, "movie_id": movie_id, "code": None}
+
+    def clients(self) -> Iterator[dict]:
+        for client_id in range(1, self.config.clients + 1):  # type: ignore
+            yield {
+                "id": client_id,
+                "first_name": f"First {client_id}",
+                "last_name": f"Last {client_id}",
+                "address": f"Street {client_id}",
+                "license_number": 10_000_000 + client_id,
+            }
+
+    def movie_rents(self) -> Iterator[tuple[dict, list[dict]]]:
+        """
+        Yield every rent together with its details, in creation order.
+        Clients follow a long-tail distribution and the rented movies follow the
+        movie popularity. Closed rents last a log-normally distributed number of
+        days around three.
+        """
+
+        rng = self._rng("rents")
+        first_copy = self._copies_by_movie
+        details_sizes = range(1, len(self.config.details_weights) + 1)
+        end = self.config.start + timedelta(days=self.config.days)
+        step = self.config.days * 86400 / self.config.rents
+        detail_id = itertools.count(1)
+
+        for rent_id in range(1, self.config.rents + 1):
+            created = self.config.start + timedelta(seconds=rent_id * step)
+            is_closed = rng.random() >= self.config.open_ratio
+            closed = None
+            if is_closed:
+                duration = timedelta(days=rng.lognormvariate(math.log(3), 0.6))
+                closed = min(created + duration, end)
+            rent = {
+                "id": rent_id,
+                "client_id": self.client_activity.sample(rng),
+                "creation_datetime": created,
+                "closed_datetime": closed,
+                "is_closed": is_closed,
+            }
+
+            details = []
+            size = rng.choices(details_sizes, weights=self.config.details_weights)[0]
+            for _ in range(size):
+                movie_id = self.movie_popularity.sample(rng)
+                details.append(
+                    {
+                        "id": next(detail_id),
+                        "movie_rent_id": rent_id,
+                        "movie_copy_id": rng.randrange(
+                            first_copy[movie_id], first_copy[movie_id + 1]
+                        ),
+                    }
+                )
+            yield rent, details
+
+    def tables(self) -> Iterator[tuple[str, Iterable[dict]]]:
+        """
+        Yield the name and rows of every table except the rents and their
+        details, which are produced together by `movie_rents`.
+        """
+
+        yield "genre", self.genres()
+        yield "movie", self.movies()
+        yield "moviecopy", self.movie_copies()
+        yield "client", self.clients()
+
+    def write_sqlite(self, path: str) -> Engine:
+        """
+        Create the schema in a SQLite file, insert the dataset in chunks and
+        compute the stock counters and the rental summaries.
+        Args:
+            path (str): The SQLite file to create.
+        Returns:
+            Engine: An engine connected to the populated database.
+        """
+
+        engine = create_engine(f"sqlite:///{path}")
+        SQLModel.metadata.create_all(engine)
+        with engine.begin() as connection:
+            connection.execute(text("PRAGMA synchronous = OFF"))
+            for name, rows in self.tables():
+                for chunk in _chunks(rows):
+                    connection.execute(TABLES[name].insert(), chunk)
+
+            for chunk in _chunks(self.movie_rents()):
+                rents = [rent for rent, _ in chunk]
+                details = [
+                    detail for _, rent_details in chunk for detail in rent_details
+                ]
+                connection.execute(TABLES["movierent"].insert(), rents)
+                connection.execute(TABLES["movierentdetail"].insert(), details)
+
+        with Session(engine) as session:
+            refresh_stock_counters(session)
+            rebuild_summaries(session)
+            session.commit()
+        return engine
+
+    def write_ndjson(self, directory: str):
+        """
+        Stream the dataset to one newline delimited JSON file per table, named
+        after the table, which `loader.load_ndjson` can ingest.
+        Args:
+            directory (str): The directory the files are written to.
+        """
+
+        os.makedirs(directory, exist_ok=True)
+
+        def open_file(name):
+            return open(os.path.join(directory, f"{name}.ndjson"), "w")
+
+        for name, rows in self.tables():
+            with open_file(name) as f:
+                for row in rows:
+                    f.write(json.dumps(row) + "\n")
+
+        with open_file("movierent") as rents, open_file("movierentdetail") as details:
+            for rent, rent_details in self.movie_rents():
+                rents.write(json.dumps(rent, default=datetime.isoformat) + "\n")
+                for detail in rent_details:
+                    details.write(json.dumps(detail) + "\n")
+
+
+def _chunks(rows: Iterable, size: int = CHUNK_SIZE) -> Iterator[list]:
+    iterator = iter(rows)
+    while chunk := list(itertools.islice(iterator, size)):
+        yield chunk
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Synthetic dataset generator")
+    parser.add_argument("--rents", type=int, required=True)
+    parser.add_argument("--seed", type=int, default=42)
+    parser.add_argument("--movies", type=int)
+    parser.add_argument("--clients", type=int)
+    parser.add_argument("--copies", type=int)
+    parser.add_argument("--open-ratio", type=float, default=0.1)
+    output = parser.add_mutually_exclusive_group(required=True)
+    output.add_argument("--sqlite", help="SQLite file to create")
+    output.add_argument("--ndjson", help="directory of the NDJSON files")
+    args = parser.parse_args(argv)
+
+    generator = DatasetGenerator(
+        GeneratorConfig(
+            rents=args.rents,
+            seed=args.seed,
+            movies=args.movies,
+            clients=args.clients,
+            copies=args.copies,
+            open_ratio=args.open_ratio,
+        )
+    )
+    if args.sqlite:
+        generator.write_sqlite(args.sqlite).dispose()
+    else:
+        generator.write_ndjson(args.ndjson)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,55 @@
+from sqlmodel import Session, SQLModel, create_engine, func, select
+from sqlmodel.pool import StaticPool
+
+from datasets.generator import DatasetGenerator, GeneratorConfig
+from loader import load_ndjson
+from movie_rents.models import MovieRent, MovieRentDetail
+from movies.models import MovieCopy
+
+
+def test_generator_is_deterministic():
+    """
+    Test that two generators with the same seed produce the same rents, and
+    that a different seed produces different ones.
+    """
+
+    config = GeneratorConfig(rents=300, seed=7)
+    first = list(DatasetGenerator(config).movie_rents())
+    second = list(DatasetGenerator(GeneratorConfig(rents=300, seed=7)).movie_rents())
+    other = list(DatasetGenerator(GeneratorConfig(rents=300, seed=8)).movie_rents())
+
+    assert first == second
+    assert first != other
+
+
+def test_generated_ndjson_is_loaded(tmp_path):
+    """
+    Test that the NDJSON output is ingested by the loader, that every rent
+    detail references an existing copy and that some rents are left open.
+    """
+
+    generator = DatasetGenerator(GeneratorConfig(rents=500, open_ratio=0.2))
+    generator.write_ndjson(str(tmp_path))
+
+    engine = create_engine(
+        "sqlite://", connect_args={"check_same_thread": False}, poolclass=StaticPool
+    )
+    SQLModel.metadata.create_all(engine)
+    load_ndjson(engine, str(tmp_path))
+
+    with Session(engine) as session:
+        assert session.exec(select(func.count()).select_from(MovieRent)).one() == 500
+        assert session.exec(select(func.count()).select_from(MovieCopy)).one() == 250
+        orphan_details = session.exec(
+            select(func.count())
+            .select_from(MovieRentDetail)
+            .outerjoin(MovieCopy)
+            .where(MovieCopy.id == None)  # noqa: E711
+        ).one()
+        assert orphan_details == 0
+        open_rents = session.exec(
+            select(func.count())
+            .select_from(MovieRent)
+            .where(MovieRent.is_closed == False)  # noqa: E712
+        ).one()
+        assert 0 < open_rents < 500
@@ -0,0 +1,101 @@
+import time
+from concurrent.futures import ThreadPoolExecutor
+from concurrent.futures import TimeoutError as FutureTimeout
+
+from sqlalchemy import Engine, QueuePool, text
+
+from base import settings
+from base.db_connection import engine, read_engine
+from base.latency import request_latency
+from base.single_flight import single_flights
+from base.startup import startup_report
+
+# the engines probed by the readiness check
+probed_engines: dict[str, Engine] = {"write": engine, "read": read_engine}
+
+# probes run in their own threads, so a locked or stuck database cannot block
+# the caller past the timeout
+_probes = ThreadPoolExecutor(max_workers=4, thread_name_prefix="health-probe")
+
+
+def _round_trip(probed: Engine) -> float:
+    start = time.perf_counter()
+    with probed.connect() as connection:
+        connection.execute(text("SELECT 1 FROM sqlite_master LIMIT 1"))
+    return (time.perf_counter() - start) * 1000
+
+
+def probe_database(probed: Engine, timeout: float) -> dict:
+    """
+    Run one query on a connection of the engine, waiting at most `timeout`
+    seconds, so a missing, locked or stuck database fails the check.
+    Returns:
+        dict: Whether the probe succeeded, its latency and its error.
+    """
+
+    try:
+        latency = _probes.submit(_round_trip, probed).result(timeout)
+    except FutureTimeout:
+        return {"ok": False, "error": f"no answer within {timeout}s"}
+    except Exception as exc:
+        return {"ok": False, "error": repr(exc)}
+    return {"ok": True, "latency_ms": round(latency, 3)}
+
+
+def pool_usage(probed: Engine, max_saturation: float) -> dict:
+    """
+    Report the connections of the pool of the engine in use, against the size
+    of the pool: connections opened beyond it, in the overflow, push the
+    saturation above 1. Pools without a fixed size, like the single connection
+    of the tests, are always ok.
+    """
+
+    pool = probed.pool
+    if not isinstance(pool, QueuePool):
+        return {"ok": True}
+    size = pool.size()
+    checked_out = pool.checkedout()
+    saturation = checked_out / size if size else 0.0
+    return {
+        "ok": saturation <= max_saturation,
+        "checked_out": checked_out,
+        "size": size,
+        "overflow": max(pool.overflow(), 0),
+        "saturation": round(saturation, 4),
+    }
+
+
+def readiness() -> tuple[bool, dict]:
+    """
+    Run the checks of the readiness endpoint against their thresholds (see the
+    HEALTH_* settings).
+    Returns:
+        tuple[bool, dict]: Whether every check passed, and the result of every
+                           check with the measured values.
+    """
+
+    checks = {
+        "warm_up": {"ok": startup_report.ready, "error": startup_report.error},
+    }
+    for name, probed in probed_engines.items():
+        checks[f"database.{name}"] = probe_database(
+            probed, settings.HEALTH_DB_TIMEOUT_SECONDS
+        )
+        checks[f"pool.{name}"] = pool_usage(probed, settings.HEALTH_MAX_POOL_SATURATION)
+
+    latency = request_latency.as_dict()
+    latency["ok"] = (
+        latency["requests"] < settings.HEALTH_MIN_REQUESTS
+        or latency["p99_ms"] <= settings.HEALTH_MAX_P99_MS
+    )
+    checks["latency"] = latency
+
+    # coalesced reads are the closest thing to a cache hit: reported, not judged
+    checks["single_flight"] = {
+        "ok": True,
+        **{
+            name: group.metrics.as_dict()["shared_ratio"]
+            for name, group in single_flights.items()
+        },
+    }
+    return all(check["ok"] for check in checks.values()), checks
@@ -0,0 +1,141 @@
+import pytest
+from fastapi.testclient import TestClient
+from sqlalchemy import text
+from sqlmodel import Session, create_engine
+from sqlmodel.pool import StaticPool
+
+from base import settings, startup
+from base.db_connection import SchemaOutdated, sync_schema
+from base.latency import LatencyWindow
+from health import services
+
+
+def test_sync_schema_skips_up_to_date_databases():
+    """
+    Test that the schema is only created when the fingerprint stored in the
+    database differs from the one of the models.
+    """
+
+    engine = create_engine(
+        "sqlite://", connect_args={"check_same_thread": False}, poolclass=StaticPool
+    )
+    assert sync_schema(engine)
+    assert not sync_schema(engine)
+    assert sync_schema(engine, "always")
+    assert not sync_schema(engine, "never")
+
+
+def test_sync_schema_only_stamps_current_databases():
+    """
+    Test that indexes missing from existing tables are created, and that a
+    database whose tables lack columns of the models is reported and never
+    marked up to date.
+    """
+
+    engine = create_engine(
+        "sqlite://", connect_args={"check_same_thread": False}, poolclass=StaticPool
+    )
+    assert sync_schema(engine)
+    with engine.begin() as connection:
+        connection.exec_driver_sql("DROP INDEX ix_movie_title")
+        connection.exec_driver_sql("PRAGMA user_version = 0")
+    assert sync_schema(engine)
+    with engine.connect() as connection:
+        indexes = connection.exec_driver_sql("PRAGMA index_list(movie)").all()
+    assert "ix_movie_title" in {index[1] for index in indexes}
+
+    with engine.begin() as connection:
+        connection.exec_driver_sql("ALTER TABLE movie DROP COLUMN total_copies")
+        connection.exec_driver_sql("PRAGMA user_version = 0")
+    for _ in range(2):
+        with pytest.raises(SchemaOutdated, match="movie.total_copies is missing"):
+            sync_schema(engine)
+    with engine.connect() as connection:
+        assert connection.execute(text("PRAGMA user_version")).scalar() == 0
+
+
+def test_readiness_after_warm_up(client: TestClient, session: Session, monkeypatch):
+    """
+    Test that the worker is only ready once every warm-up step ran, and never
+    when one of them failed.
+    Args:
+        client (TestClient): The test client used to simulate API requests.
+        session (Session): Its engine is the probed database.
+        monkeypatch: Gives the test its own startup report and engines.
+    """
+
+    monkeypatch.setattr(services, "probed_engines", {"write": session.get_bind()})
+    report = startup.StartupReport()
+    monkeypatch.setattr(startup, "startup_report", report)
+    monkeypatch.setattr(services, "startup_report", report)
+
+    response = client.get("/health/ready")
+    assert response.status_code == 503
+    assert response.json()["failing"] == ["warm_up"]
+
+    startup.start_warm_up([("noop", lambda: None)]).join()
+    response = client.get("/health/ready")
+    assert response.status_code == 200
+    assert response.json()["status"] == "ready"
+    assert response.json()["checks"]["database.write"]["ok"]
+    assert "warm_up.noop" in report.as_dict()["phases_ms"]
+
+    report = startup.StartupReport()
+    monkeypatch.setattr(startup, "startup_report", report)
+    monkeypatch.setattr(services, "startup_report", report)
+    startup.start_warm_up([("broken", lambda: 1 / 0)]).join()
+    response = client.get("/health/ready")
+    assert response.status_code == 503
+    assert "ZeroDivisionError" in response.json()["checks"]["warm_up"]["error"]
+
+
+def test_readiness_thresholds(client: TestClient, monkeypatch, tmp_path):
+    """
+    Test that an unreachable database and a slow p99 latency make the worker not
+    ready, while the liveness check keeps answering.
+    Args:
+        client (TestClient): The test client used to simulate API requests.
+        monkeypatch: Replaces the probed engines and the latency window.
+        tmp_path: A directory without database.
+    """
+
+    missing = create_engine(f"sqlite:///file:{tmp_path}/missing.db?mode=ro&uri=true")
+    monkeypatch.setattr(services, "probed_engines", {"read": missing})
+    window = LatencyWindow()
+    for _ in range(settings.HEALTH_MIN_REQUESTS):
+        window.record(settings.HEALTH_MAX_P99_MS / 1000 + 1)
+    monkeypatch.setattr(services, "request_latency", window)
+    monkeypatch.setattr(services.startup_report, "ready", True)
+
+    response = client.get("/health/ready")
+    assert response.status_code == 503
+    assert set(response.json()["failing"]) == {"database.read", "latency"}
+    assert client.get("/health/live").json()["status"] == "alive"
+
+
+def test_pool_usage_counts_the_overflow(tmp_path):
+    """
+    Test that the saturation of a pool is measured against its size, with the
+    connections opened in the overflow pushing it past the threshold.
+    Args:
+        tmp_path: The directory of the database.
+    """
+
+    engine = create_engine(
+        f"sqlite:///{tmp_path}/database.db", pool_size=2, max_overflow=2
+    )
+    connections = [engine.connect()]
+    try:
+        usage = services.pool_usage(engine, 0.95)
+        assert usage["ok"]
+        assert (usage["checked_out"], usage["size"]) == (1, 2)
+
+        connections += [engine.connect(), engine.connect()]
+        usage = services.pool_usage(engine, 0.95)
+        assert not usage["ok"]
+        assert (usage["checked_out"], usage["overflow"]) == (3, 1)
+        assert usage["saturation"] == 1.5
+    finally:
+        for connection in connections:
+            connection.close()
+        engine.dispose()
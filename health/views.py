@@ -0,0 +1,54 @@
+import time
+
+from fastapi import APIRouter
+from fastapi.responses import JSONResponse
+
+from base.startup import IMPORT_STARTED
+from health.services import readiness
+
+router = APIRouter()
+
+
+@router.get("/health/live", tags=["health"])
+async def liveness_check():
+    """
+    Tell the orchestrator whether the worker is alive. It answers as long as the
+    event loop runs, whatever the state of the database, so a degraded worker
+    is taken out of the load balancer (see /health/ready) but not restarted.
+    Returns:
+        dict: {"status": "alive"} and the seconds since the worker started.
+    """
+
+    return {
+        "status": "alive",
+        "uptime_seconds": round(time.perf_counter() - IMPORT_STARTED, 3),
+    }
+
+
+@router.get("/health/ready", tags=["health"])
+def readiness_check():
+    """
+    Tell the load balancer whether the worker can take traffic.
+    The worker is ready once the warm-up that follows the startup hook is done
+    (connection pools opened, movie suggestion index built, OpenAPI schema
+    generated) and while the checks stay within their thresholds: a query
+    answered on both databases within HEALTH_DB_TIMEOUT_SECONDS, connection
+    pools used below HEALTH_MAX_POOL_SATURATION and a p99 latency of the recent
+    requests below HEALTH_MAX_P99_MS. The share of coalesced reads is reported
+    too.
+    Returns:
+        JSONResponse: 200 with {"status": "ready"} or 503 with
+                      {"status": "not_ready"}, the names of the failing checks
+                      and the result of every check.
+    """
+
+    ready, checks = readiness()
+    failing = [name for name, check in checks.items() if not check["ok"]]
+    return JSONResponse(
+        {
+            "status": "ready" if ready else "not_ready",
+            "failing": failing,
+            "checks": checks,
+        },
+        status_code=200 if ready else 503,
+    )
@@ -1,8 +1,13 @@
+import argparse
 import json
 import datetime
+import itertools
+import os
 from movies.models import Genre, Movie, MovieCopy
 from clients.models import Client
 from movie_rents.models import MovieRent, MovieRentDetail
+from movies.services import backfill_copy_codes, refresh_stock_counters
+from analytics.services import rebuild_summaries
 from sqlmodel import Session
 
 from base.db_connection import engine
@@ -75,6 +80,23 @@ def load_movie_rent_details(engine):
             session.commit()
 
 
+def load_stock_counters(engine):
+    with Session(engine) as session:
+        refresh_stock_counters(session)
+        session.commit()
+
+
+def load_copy_codes(engine):
+    with Session(engine) as session:
+        backfill_copy_codes(session)
+
+
+def load_analytics(engine):
+    with Session(engine) as session:
+        rebuild_summaries(session)
+        session.commit()
+
+
 def load_initial_data(engine):
     load_genres(engine)
     load_movies(engine)
@@ -82,10 +104,59 @@ def load_initial_data(engine):
     load_clients(engine)
     load_movie_rents(engine)
     load_movie_rent_details(engine)
+    load_copy_codes(engine)
+    load_stock_counters(engine)
+    load_analytics(engine)
+
+
+NDJSON_TABLES = {
+    "genre": Genre,
+    "movie": Movie,
+    "moviecopy": MovieCopy,
+    "client": Client,
+    "movierent": MovieRent,
+    "movierentdetail": MovieRentDetail,
+}
+NDJSON_DATETIME_FIELDS = ("creation_datetime", "closed_datetime")
+NDJSON_CHUNK_SIZE = 10_000
+
+
+def load_ndjson(engine, directory):
+    """
+    Load newline delimited JSON files, one per table and named after it (as
+    written by `datasets.generator`), streaming them in chunks so datasets of
+    any size can be ingested. Missing files are skipped.
+    """
+
+    with engine.begin() as connection:
+        for name, model in NDJSON_TABLES.items():
+            path = os.path.join(directory, f"{name}.ndjson")
+            if not os.path.exists(path):
+                continue
+            with open(path) as f:
+                rows = map(json.loads, f)
+                while chunk := list(itertools.islice(rows, NDJSON_CHUNK_SIZE)):
+                    for row in chunk:
+                        for field in NDJSON_DATETIME_FIELDS:
+                            if row.get(field):
+                                row[field] = datetime.datetime.fromisoformat(row[field])
+                    connection.execute(model.__table__.insert(), chunk)
+    load_copy_codes(engine)
+    load_stock_counters(engine)
+    load_analytics(engine)
 
 
 def main():
-    load_initial_data(engine)
+    parser = argparse.ArgumentParser(description="Load data into the database")
+    parser.add_argument(
+        "--ndjson", help="directory of NDJSON files to load instead of the datasets"
+    )
+    args = parser.parse_args()
+
+    if args.ndjson:
+        load_ndjson(engine, args.ndjson)
+    else:
+        load_initial_data(engine)
 
 
 if __name__ == "__main__":
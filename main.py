@@ -1,21 +1,137 @@
 # main.py
 
+# first, so the import time of the application is measured
+from base.startup import IMPORT_STARTED, start_warm_up, startup_report
 from fastapi import FastAPI
 from movies.views import router as movies_router
 from clients.views import router as clients_router
 from movie_rents.views import router as movie_rents_router
-from base.db_connection import create_db_and_tables
+from analytics.views import router as analytics_router
+from availability.views import router as availability_router
+from changes.views import router as changes_router
+from admin.views import router as admin_router
+from health.views import router as health_router
+from batch.views import router as batch_router
+from sqlalchemy import text
+from sqlalchemy.exc import OperationalError
+from sqlmodel import Session
+
+from base.admission import AdmissionControlMiddleware, parse_limits
+from base.latency import LatencyMiddleware, request_latency
+from base.retry import DeadlineExceeded, DeadlineMiddleware, database_error_handler
+from base.db_connection import create_db_and_tables, engine, read_engine, sqlite_url
+from base.memory import MemoryTrackingMiddleware
+from base.profiling import ProfilingMiddleware
+from base.tracing import create_exporter, install_tracing
+from base.write_pipeline import start_write_pipeline, stop_write_pipeline
+from base import settings
+from search.index import (
+    movie_search,
+    start_search_refresher,
+    stop_search_refresher,
+)
+from recommendations.engine import (
+    start_co_rental_rebuilder,
+    stop_co_rental_rebuilder,
+)
 
 app = FastAPI()
 
+if settings.PROFILING_TOKEN or settings.PROFILING_SAMPLE_RATE:
+    app.add_middleware(
+        ProfilingMiddleware,
+        directory=settings.PROFILING_DIR,
+        token=settings.PROFILING_TOKEN,
+        sample_rate=settings.PROFILING_SAMPLE_RATE,
+    )
+
+if settings.MEMORY_TRACKING_ENABLED:
+    app.add_middleware(MemoryTrackingMiddleware, frames=settings.MEMORY_TRACKING_FRAMES)
+
+if settings.ADMISSION_CONTROL_ENABLED:
+    app.add_middleware(
+        AdmissionControlMiddleware,
+        read=(settings.ADMISSION_READ_CONCURRENCY, settings.ADMISSION_READ_QUEUE),
+        write=(settings.ADMISSION_WRITE_CONCURRENCY, settings.ADMISSION_WRITE_QUEUE),
+        queue_timeout=settings.ADMISSION_QUEUE_TIMEOUT_SECONDS,
+        retry_after=settings.ADMISSION_RETRY_AFTER_SECONDS,
+        overrides=parse_limits(settings.ADMISSION_LIMITS),
+    )
+
+# outermost, so the deadline also counts the time queued by the admission control
+app.add_middleware(
+    DeadlineMiddleware,
+    default=settings.REQUEST_TIMEOUT_SECONDS,
+    maximum=settings.REQUEST_TIMEOUT_MAX_SECONDS,
+)
+# outermost, so the latency seen by the readiness check includes the queueing
+app.add_middleware(LatencyMiddleware, window=request_latency)
+app.add_exception_handler(DeadlineExceeded, database_error_handler)
+app.add_exception_handler(OperationalError, database_error_handler)
+
 app.include_router(movies_router)
 app.include_router(clients_router)
 app.include_router(movie_rents_router)
+app.include_router(analytics_router)
+app.include_router(availability_router)
+app.include_router(changes_router)
+app.include_router(batch_router)
+app.include_router(admin_router)
+app.include_router(health_router)
+
+# after the routers, whose views it wraps, and outermost, so the request span
+# covers the whole middleware stack
+if settings.TRACING_EXPORTER:
+    install_tracing(
+        app,
+        create_exporter(settings.TRACING_EXPORTER, settings.TRACING_FILE),
+        settings.TRACING_SAMPLE_RATE,
+    )
+
+startup_report.record("imports", IMPORT_STARTED)
+
+
+def _open_pools():
+    for pool_engine in (engine, read_engine):
+        with pool_engine.connect() as connection:
+            connection.execute(text("SELECT 1"))
+
+
+def _build_movie_search():
+    with Session(read_engine) as session:
+        movie_search.ensure_ready(session)
 
 
 @app.on_event("startup")
 def on_startup():
-    create_db_and_tables()
+    with startup_report.phase("schema"):
+        create_db_and_tables()
+    if settings.WRITE_PIPELINE_ENABLED:
+        with startup_report.phase("write_pipeline"):
+            start_write_pipeline(
+                sqlite_url,
+                window=settings.WRITE_PIPELINE_WINDOW_MS / 1000,
+                max_batch=settings.WRITE_PIPELINE_MAX_BATCH,
+            )
+    if settings.RECOMMENDATIONS_ENABLED:
+        start_co_rental_rebuilder(read_engine, settings.RECOMMENDATIONS_REBUILD_SECONDS)
+    start_search_refresher(read_engine, settings.SEARCH_REFRESH_SECONDS)
+    # the rest runs after the worker started accepting connections, see
+    # GET /health/ready and GET /admin/startup
+    start_warm_up(
+        [
+            ("pools", _open_pools),
+            ("movie_search", _build_movie_search),
+            ("openapi", app.openapi),
+        ]
+    )
+
+
+@app.on_event("shutdown")
+def on_shutdown():
+    stop_co_rental_rebuilder()
+    stop_search_refresher()
+    stop_write_pipeline()
 
 
 @app.get("/")
@@ -29,6 +145,7 @@ def health_check():
     Perform a health check for the API.
     This function is used to verify that the API is running and operational.
     It returns a JSON response indicating the health status of the service.
+    It does not look at the database: load balancers should use /health/ready.
     Returns:
         dict: A dictionary containing the health status of the API.
               Example: {"status": "healthy"}
@@ -0,0 +1,147 @@
+import argparse
+import sys
+from datetime import timedelta
+
+from sqlalchemy import inspect, text
+from sqlmodel import Session
+
+from analytics.services import rebuild_summaries
+from base.db_connection import engine
+from changes.services import prune_changes
+from movie_rents.services import archive_closed_rents, enable_rent_autoincrement
+from movies.services import (
+    backfill_copy_codes,
+    refresh_stock_counters,
+    verify_stock_counters,
+)
+
+
+def stock_counters(args) -> int:
+    """
+    Verify the stock counters of the movies, or rebuild them with --rebuild.
+    Returns 1 when a verification finds wrong counters.
+    """
+
+    with Session(engine) as session:
+        if args.rebuild:
+            refresh_stock_counters(session)
+            session.commit()
+            print("Stock counters rebuilt")
+            return 0
+
+        mismatches = verify_stock_counters(session)
+    for mismatch in mismatches:
+        print(
+            "Movie {id}: total_copies {total_copies} (expected "
+            "{expected_total_copies}), available_copies {available_copies} "
+            "(expected {expected_available_copies})".format(**mismatch)
+        )
+    print(f"{len(mismatches)} movies with wrong stock counters")
+    return 1 if mismatches else 0
+
+
+def analytics(args) -> int:
+    """
+    Rebuild the rental summary tables from the rents.
+    """
+
+    with Session(engine) as session:
+        rebuild_summaries(session)
+        session.commit()
+    print("Rental summaries rebuilt")
+    return 0
+
+
+def changes(args) -> int:
+    """
+    Delete the change feed entries older than --days days.
+    """
+
+    with Session(engine) as session:
+        deleted = prune_changes(session, timedelta(days=args.days))
+        session.commit()
+    print(f"{deleted} changes pruned")
+    return 0
+
+
+def archive_rents(args) -> int:
+    """
+    Move the rents closed more than --days days ago to the archive tables,
+    first recreating the hot tables with AUTOINCREMENT on databases created
+    without it.
+    """
+
+    for table in enable_rent_autoincrement(engine):
+        print(f"{table} recreated with AUTOINCREMENT")
+    archived = archive_closed_rents(
+        engine, timedelta(days=args.days), args.batch_size, args.pause
+    )
+    print(f"{archived} rents archived")
+    return 0
+
+
+def copy_codes(args) -> int:
+    """
+    Give a code to every copy without one, then make the code index unique on
+    databases created before codes were unique.
+    """
+
+    with Session(engine) as session:
+        filled = backfill_copy_codes(session, args.batch_size)
+    print(f"{filled} copies got a code")
+
+    unique = any(
+        index["name"] == "ix_moviecopy_code" and index["unique"]
+        for index in inspect(engine).get_indexes("moviecopy")
+    )
+    if not unique:
+        with engine.begin() as connection:
+            connection.execute(text("DROP INDEX IF EXISTS ix_moviecopy_code"))
+            connection.execute(
+                text("CREATE UNIQUE INDEX ix_moviecopy_code ON moviecopy (code)")
+            )
+        print("Unique index on the copy codes created")
+    return 0
+
+
+def main(argv=None) -> int:
+    parser = argparse.ArgumentParser(description="Maintenance commands")
+    commands = parser.add_subparsers(dest="command", required=True)
+
+    command = commands.add_parser(
+        "stock-counters", help="verify or rebuild the stock counters of the movies"
+    )
+    command.add_argument("--rebuild", action="store_true")
+    command.set_defaults(handler=stock_counters)
+
+    command = commands.add_parser(
+        "rebuild-analytics", help="rebuild the rental summary tables"
+    )
+    command.set_defaults(handler=analytics)
+
+    command = commands.add_parser(
+        "prune-changes", help="delete the old entries of the change feed"
+    )
+    command.add_argument("--days", type=int, default=30)
+    command.set_defaults(handler=changes)
+
+    command = commands.add_parser(
+        "archive-rents", help="move old closed rents to the archive tables"
+    )
+    command.add_argument("--days", type=int, default=365)
+    command.add_argument("--batch-size", type=int, default=500)
+    command.add_argument("--pause", type=float, default=0.05)
+    command.set_defaults(handler=archive_rents)
+
+    command = commands.add_parser(
+        "copy-codes", help="give a scannable code to the copies without one"
+    )
+    command.add_argument("--batch-size", type=int, default=1000)
+    command.set_defaults(handler=copy_codes)
+
+    args = parser.parse_args(argv)
+    return args.handler(args)
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -1,4 +1,5 @@
 from datetime import datetime
+from sqlalchemy import Index
 from sqlmodel import Field, SQLModel, Relationship
 from typing import Optional
 from movies.models import MovieCopy, MovieCopyPublic
@@ -6,12 +7,24 @@ from movies.models import MovieCopy, MovieCopyPublic
 
 class MovieRentBase(SQLModel):
     client_id: int = Field(foreign_key="client.id")
-    creation_datetime: Optional[datetime] = Field(default=datetime.now())
+    creation_datetime: Optional[datetime] = Field(default_factory=datetime.now)
     closed_datetime: Optional[datetime] = Field(default=None)
     is_closed: Optional[bool] = Field(default=False)
 
 
 class MovieRent(MovieRentBase, table=True):
+    # the rent history of a client, newest first (see get_client_rents)
+    __table_args__ = (
+        Index(
+            "ix_movierent_client_id_creation_datetime",
+            "client_id",
+            "creation_datetime",
+            "id",
+        ),
+        # ids are never reused, even once the newest rents are archived
+        {"sqlite_autoincrement": True},
+    )
+
     id: int = Field(default=None, primary_key=True)
     details: list["MovieRentDetail"] = Relationship(
         back_populates="movie_rent", cascade_delete=True
@@ -22,6 +35,12 @@ class MovieRentCreate(MovieRentBase):
     details: list["MovieRentDetail"]
 
 
+class MovieRentScan(SQLModel):
+    # a rent by the scanned codes of the copies, see POST /movie_rents/scan
+    client_id: int
+    codes: list[str] = Field(min_length=1, max_length=100)
+
+
 class MovieRentUpdate(MovieRentBase):
     details: list["MovieRentDetail"]
 
@@ -32,13 +51,15 @@ class MovieRentRetrieve(MovieRentBase):
 
 
 class MovieRentDetailBase(SQLModel):
-    movie_copy_id: int = Field(default=None, foreign_key="moviecopy.id")
+    movie_copy_id: int = Field(default=None, foreign_key="moviecopy.id", index=True)
     movie_rent_id: int = Field(
-        default=None, foreign_key="movierent.id", ondelete="CASCADE"
+        default=None, foreign_key="movierent.id", ondelete="CASCADE", index=True
     )
 
 
 class MovieRentDetail(MovieRentDetailBase, table=True):
+    __table_args__ = {"sqlite_autoincrement": True}
+
     id: Optional[int] = Field(default=None, primary_key=True)
     movie_rent: MovieRent = Relationship(back_populates="details")
     movie_copy: MovieCopy = Relationship(back_populates="rents")
@@ -50,3 +71,42 @@ class MovieRentDetailRetrieve(MovieRentDetailBase):
     movie_copy_id: int
     movie_rent: MovieRent
     movie_copy: MovieCopyPublic
+
+
+class MovieRentArchive(MovieRentBase, table=True):
+    # closed rents moved out of movierent (see movie_rents/services.py)
+    __table_args__ = (
+        Index(
+            "ix_movierentarchive_client_id_creation_datetime",
+            "client_id",
+            "creation_datetime",
+            "id",
+        ),
+    )
+
+    id: int = Field(primary_key=True)
+    archived_at: datetime = Field(default_factory=datetime.now)
+
+
+class MovieRentDetailArchive(SQLModel, table=True):
+    id: int = Field(primary_key=True)
+    movie_copy_id: int = Field(foreign_key="moviecopy.id")
+    movie_rent_id: int = Field(foreign_key="movierentarchive.id", index=True)
+
+
+class ClientRentDetail(SQLModel):
+    id: int
+    movie_copy_id: int
+    movie_id: int
+    title: Optional[str] = None
+
+
+class ClientRent(MovieRentBase):
+    id: int
+    archived: bool = False
+    details: list[ClientRentDetail] = []
+
+
+class ClientRentPage(SQLModel):
+    items: list[ClientRent]
+    next_cursor: Optional[str] = None
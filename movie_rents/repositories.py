@@ -1,17 +1,71 @@
 from datetime import datetime
-from sqlmodel import select, delete
+from typing import Any, Optional
+
+from sqlalchemy import Select, or_, tuple_
+from sqlalchemy import select as sa_select
+from sqlmodel import col, select, delete
+from base.pagination import InvalidCursor, decode_cursor, encode_cursor
 from base.repository import Repository
+from base.tracing import span
 from sqlalchemy.orm.exc import UnmappedInstanceError
 
 from movie_rents.models import (
+    ClientRent,
+    ClientRentDetail,
+    ClientRentPage,
     MovieRent,
+    MovieRentArchive,
     MovieRentCreate,
+    MovieRentScan,
     MovieRentUpdate,
     MovieRentDetail,
+    MovieRentDetailArchive,
+)
+from movies.models import Movie, MovieCopy
+from movies.services import (
+    refresh_stock_counters,
+    rented_copy_ids,
+    rented_movie_ids,
 )
+from analytics.services import record_rent
+from availability.services import queue_availability, rent_copy_ids
+from changes.services import record_deletes
+from recommendations.engine import queue_co_rentals
+
+
+class UnknownCopyCodes(Exception):
+    """
+    Raised when scanned codes match no copy.
+    """
+
+    def __init__(self, codes: list[str]):
+        super().__init__(codes)
+        self.codes = codes
+
+
+class CopiesUnavailable(Exception):
+    """
+    Raised when copies to rent are already part of an open rent.
+    """
+
+    def __init__(self, codes: list[str]):
+        super().__init__(codes)
+        self.codes = codes
+
+
+def _newest_first(rent) -> tuple:
+    # the sort key of the rent history, reversed: rents without a creation
+    # datetime come last, like NULLs in the descending order of the index
+    return (
+        rent.creation_datetime is not None,
+        rent.creation_datetime or datetime.min,
+        rent.id,
+    )
 
 
 class MovieRentRepository(Repository[MovieRent]):
+    model = MovieRent
+
     def get(self, id: int):
         return self.session.get(MovieRent, id)
 
@@ -20,9 +74,142 @@ class MovieRentRepository(Repository[MovieRent]):
         results = self.session.exec(statement).all()
         return results
 
+    def get_client_rents(
+        self,
+        client_id: int,
+        limit: int = 50,
+        cursor: Optional[str] = None,
+        is_closed: Optional[bool] = None,
+        include_titles: bool = False,
+        include_archived: bool = False,
+    ) -> ClientRentPage:
+        """
+        Retrieve a page of the rents of a client, newest first.
+        Rents are read from the (client_id, creation_datetime) index and paged by
+        keyset, so every page costs the same whatever its position. Rents without
+        a creation datetime, such as legacy rows, come last. The details
+        of the page, with their movie and optionally its title, are loaded with
+        one batched query.
+        Args:
+            client_id (int): The client whose rents are retrieved.
+            limit (int): The maximum number of rents of the page.
+            cursor (Optional[str]): The `next_cursor` of the previous page.
+            is_closed (Optional[bool]): Only return closed, or open, rents.
+            include_titles (bool): Add the movie title to every detail.
+            include_archived (bool): Also read the archived rents, merged in the
+                same order.
+        Returns:
+            ClientRentPage: The rents and the cursor of the next page, None on the
+                            last page.
+        Raises:
+            InvalidCursor: If the cursor is malformed.
+        """
+
+        after = None
+        if cursor is not None:
+            creation_datetime, id = decode_cursor(cursor, 2)
+            try:
+                after = (
+                    datetime.fromisoformat(creation_datetime)
+                    if creation_datetime is not None
+                    else None,
+                    int(id),
+                )
+            except (TypeError, ValueError) as exc:
+                raise InvalidCursor(cursor) from exc
+
+        tables: list[tuple[type[Any], type[Any]]] = [(MovieRent, MovieRentDetail)]
+        if include_archived:
+            tables.append((MovieRentArchive, MovieRentDetailArchive))
+        # every table is read from its own index, the pages are then merged
+        rents = sorted(
+            (
+                (rent, rent_model is MovieRentArchive)
+                for rent_model, _ in tables
+                for rent in self._client_rents(
+                    rent_model, client_id, limit + 1, after, is_closed
+                )
+            ),
+            key=lambda item: _newest_first(item[0]),
+            reverse=True,
+        )
+
+        next_cursor = None
+        if len(rents) > limit:
+            rents = rents[:limit]
+            last = rents[-1][0]
+            next_cursor = encode_cursor(
+                last.creation_datetime.isoformat()
+                if last.creation_datetime is not None
+                else None,
+                last.id,
+            )
+
+        items = {
+            rent.id: ClientRent.model_validate(
+                rent, update={"details": [], "archived": archived}
+            )
+            for rent, archived in rents
+        }
+        for rent_model, detail_model in tables:
+            archived = rent_model is MovieRentArchive
+            rent_ids = [id for id, item in items.items() if item.archived == archived]
+            if not rent_ids:
+                continue
+            columns = [
+                col(detail_model.id),
+                col(detail_model.movie_rent_id),
+                col(detail_model.movie_copy_id),
+                col(MovieCopy.movie_id),
+            ]
+            if include_titles:
+                columns.append(col(Movie.title))
+            details: Select = (
+                sa_select(*columns)
+                .join(MovieCopy, col(MovieCopy.id) == detail_model.movie_copy_id)
+                .where(col(detail_model.movie_rent_id).in_(rent_ids))
+                .order_by(col(detail_model.id))
+            )
+            if include_titles:
+                details = details.join(Movie, col(Movie.id) == MovieCopy.movie_id)
+            for row in self.session.exec(details):  # type: ignore[call-overload]
+                items[row.movie_rent_id].details.append(
+                    ClientRentDetail.model_validate(row._mapping)
+                )
+
+        return ClientRentPage(items=list(items.values()), next_cursor=next_cursor)
+
+    def _client_rents(self, model, client_id, limit, after, is_closed):
+        statement = select(model).where(model.client_id == client_id)
+        if is_closed is not None:
+            statement = statement.where(
+                col(model.is_closed).is_(True)
+                if is_closed
+                else col(model.is_closed).is_not(True)
+            )
+        if after is not None:
+            creation_datetime, id = after
+            # NULLs sort last in descending order, see `_newest_first`
+            if creation_datetime is None:
+                statement = statement.where(
+                    col(model.creation_datetime).is_(None), col(model.id) < id
+                )
+            else:
+                statement = statement.where(
+                    or_(
+                        tuple_(col(model.creation_datetime), col(model.id))
+                        < tuple_(creation_datetime, id),
+                        col(model.creation_datetime).is_(None),
+                    )
+                )
+        statement = statement.order_by(
+            col(model.creation_datetime).desc(), col(model.id).desc()
+        ).limit(limit)
+        return self.session.exec(statement).all()
+
     def add(self, new_instance: MovieRent):
         self.session.add(new_instance)
-        self.session.commit()
+        self.commit()
         self.session.refresh(new_instance)
         return new_instance
 
@@ -33,28 +220,92 @@ class MovieRentRepository(Repository[MovieRent]):
         instance_data = instance.model_dump(exclude_unset=True)
         db_instance.sqlmodel_update(instance_data)
         self.session.add(db_instance)
-        self.session.commit()
+        self.commit()
         self.session.refresh(db_instance)
         return db_instance
 
     def delete(self, id):
         instance = self.session.get(MovieRent, id)
+        movie_ids = rented_movie_ids(self.session, id)
+        queue_availability(self.session, rent_copy_ids(self.session, id))
+        record_rent(self.session, id, -1)
         # statement = delete(MovieRentDetail).where(MovieRentDetail.movie_rent_id == id)
         # self.session.exec(statement)
         self.session.delete(instance)
-        self.session.commit()
+        self.session.flush()
+        refresh_stock_counters(self.session, movie_ids)
+        self.commit()
         return True
 
-    def add_rent(self, new_instance: MovieRentCreate):
-        rent_instance = MovieRent.model_validate(new_instance)
-        new_rent = self.add(rent_instance)
-        self.session.commit()
-        self.session.refresh(new_rent)
-        return new_rent
+    def add_rent(self, new_instance: MovieRentCreate, exclusive: bool = False):
+        with span("validate MovieRent"):
+            rent_instance = MovieRent.model_validate(new_instance)
+        self.session.add(rent_instance)
+        self.session.flush()
+        if exclusive:
+            # checked after the flush, once the transaction holds the write
+            # lock, so no concurrent rent can take the copies in between
+            copy_ids = [detail.movie_copy_id for detail in rent_instance.details]
+            rented = rented_copy_ids(self.session, copy_ids, rent_instance.id)
+            if rented:
+                # the copies of exclusive rents are scanned, so they have a code
+                raise CopiesUnavailable(
+                    [
+                        detail.movie_copy.code
+                        for detail in rent_instance.details
+                        if detail.movie_copy_id in rented
+                        and detail.movie_copy.code is not None
+                    ]
+                )
+        record_rent(self.session, rent_instance.id)
+        movie_ids = rented_movie_ids(self.session, rent_instance.id)
+        refresh_stock_counters(self.session, movie_ids)
+        queue_co_rentals(self.session, rent_instance.client_id, movie_ids)
+        queue_availability(self.session, rent_copy_ids(self.session, rent_instance.id))
+        self.commit()
+        self.session.refresh(rent_instance)
+        return rent_instance
+
+    def scan_rent(self, scan: MovieRentScan):
+        """
+        Rent the copies of scanned codes, resolved with one IN query on the
+        unique code index. The rent is created only if every code matches a copy
+        and no copy is part of another open rent.
+        Raises:
+            UnknownCopyCodes: Some codes match no copy.
+            CopiesUnavailable: Some copies are already rented.
+        """
+
+        codes = list(dict.fromkeys(scan.codes))
+        copy_ids = dict(
+            self.session.exec(
+                select(MovieCopy.code, MovieCopy.id).where(
+                    col(MovieCopy.code).in_(codes)
+                )
+            ).all()
+        )
+        missing = [code for code in codes if code not in copy_ids]
+        if missing:
+            raise UnknownCopyCodes(missing)
+        rent = MovieRentCreate(
+            client_id=scan.client_id,
+            details=[MovieRentDetail(movie_copy_id=copy_ids[code]) for code in codes],
+        )
+        return self.add_rent(rent, exclusive=True)
 
     def update_rent(self, id: int, instance: MovieRentUpdate):
-        rent_instance = MovieRent.model_validate(instance)
-        updated_rent = self.update(id, rent_instance)
+        updated_rent = self.session.get(MovieRent, id)
+        if not updated_rent:
+            raise UnmappedInstanceError(updated_rent)
+        movie_ids = rented_movie_ids(self.session, id)
+        copy_ids = rent_copy_ids(self.session, id)
+        record_rent(self.session, id, -1)
+        # only the fields sent by the client, the defaults of MovieRentUpdate
+        # would reset the dates and reopen closed rents
+        updated_rent.sqlmodel_update(
+            instance.model_dump(exclude_unset=True, exclude={"details"})
+        )
+        self.session.add(updated_rent)
 
         # remove, add, update MovieRentDetails
         details_to_update = instance.details
@@ -89,17 +340,33 @@ class MovieRentRepository(Repository[MovieRent]):
         )
 
         self.session.exec(statement)  # type: ignore
-        self.session.commit()
+        record_deletes(
+            self.session,
+            MovieRentDetail,
+            [detail_id for detail_id in details_to_remove_ids if detail_id is not None],
+        )
+        self.session.flush()
+        record_rent(self.session, id)
+        new_movie_ids = rented_movie_ids(self.session, id)
+        refresh_stock_counters(self.session, movie_ids | new_movie_ids)
+        queue_co_rentals(self.session, updated_rent.client_id, new_movie_ids)
+        queue_availability(self.session, copy_ids | rent_copy_ids(self.session, id))
+        self.commit()
         self.session.refresh(updated_rent)
 
         return updated_rent
 
     def close_rent(self, id: int):
         movie_rent = self.get(id)
+        record_rent(self.session, id, -1)
         movie_rent.is_closed = True
         movie_rent.closed_datetime = datetime.now()
 
         self.session.add(movie_rent)
-        self.session.commit()
+        self.session.flush()
+        record_rent(self.session, id)
+        refresh_stock_counters(self.session, rented_movie_ids(self.session, id))
+        queue_availability(self.session, rent_copy_ids(self.session, id))
+        self.commit()
         self.session.refresh(movie_rent)
         return movie_rent
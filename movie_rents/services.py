@@ -0,0 +1,177 @@
+import time
+from datetime import datetime, timedelta
+
+from sqlalchemy import Connection, Engine, Table, delete, func, insert, literal, text
+from sqlalchemy.schema import CreateTable
+from sqlmodel import Session, col, select
+
+from base.repository import model_table
+from movie_rents.models import (
+    MovieRent,
+    MovieRentArchive,
+    MovieRentDetail,
+    MovieRentDetailArchive,
+)
+
+RENT_COLUMNS = ("id", "client_id", "creation_datetime", "closed_datetime", "is_closed")
+DETAIL_COLUMNS = ("id", "movie_copy_id", "movie_rent_id")
+
+# the hot tables and the archive table of their ids
+ARCHIVED_TABLES = (
+    (model_table(MovieRent), model_table(MovieRentArchive)),
+    (model_table(MovieRentDetail), model_table(MovieRentDetailArchive)),
+)
+
+
+class ArchiveUnsafe(Exception):
+    """
+    Raised when the hot rent tables were created without AUTOINCREMENT, so new
+    rents could be given the ids of archived ones.
+    """
+
+
+def has_autoincrement(connection: Connection, table_name: str) -> bool:
+    sql = connection.execute(
+        text("SELECT sql FROM sqlite_master WHERE type = 'table' AND name = :name"),
+        {"name": table_name},
+    ).scalar()
+    return sql is not None and "AUTOINCREMENT" in sql.upper()
+
+
+def enable_rent_autoincrement(engine: Engine) -> list[str]:
+    """
+    Recreate movierent and movierentdetail with AUTOINCREMENT on databases
+    created before rents were archived, copying their rows and indexes, and
+    start their id sequence above the largest archived id.
+    Returns:
+        list[str]: The names of the recreated tables.
+    """
+
+    rebuilt = []
+    with engine.begin() as connection:
+        for table, archive in ARCHIVED_TABLES:
+            if not has_autoincrement(connection, table.name):
+                _recreate(connection, table)
+                rebuilt.append(table.name)
+            archived_max = connection.execute(select(func.max(archive.c.id))).scalar()
+            if archived_max is None:
+                continue
+            updated = connection.execute(
+                text(
+                    "UPDATE sqlite_sequence SET seq = max(seq, :seq) WHERE name = :name"
+                ),
+                {"seq": archived_max, "name": table.name},
+            ).rowcount
+            if not updated:
+                connection.execute(
+                    text(
+                        "INSERT INTO sqlite_sequence (name, seq) VALUES (:name, :seq)"
+                    ),
+                    {"seq": archived_max, "name": table.name},
+                )
+    return rebuilt
+
+
+def _recreate(connection: Connection, table: Table):
+    # SQLite cannot add AUTOINCREMENT to a table: copy it into a new one
+    temporary = f"{table.name}_autoincrement"
+    ddl = str(CreateTable(table).compile(dialect=connection.dialect))
+    columns = ", ".join(column.name for column in table.columns)
+    connection.execute(text(f"DROP TABLE IF EXISTS {temporary}"))
+    connection.execute(
+        text(
+            ddl.replace(f"CREATE TABLE {table.name} ", f"CREATE TABLE {temporary} ", 1)
+        )
+    )
+    connection.execute(
+        text(f"INSERT INTO {temporary} ({columns}) SELECT {columns} FROM {table.name}")
+    )
+    connection.execute(text(f"DROP TABLE {table.name}"))
+    connection.execute(text(f"ALTER TABLE {temporary} RENAME TO {table.name}"))
+    for index in table.indexes:
+        index.create(connection)
+
+
+def archive_closed_rents(
+    engine: Engine,
+    older_than: timedelta,
+    batch_size: int = 500,
+    pause: float = 0.05,
+) -> int:
+    """
+    Move the rents closed before a cutoff, with their details, from the hot
+    tables to movierentarchive and movierentdetailarchive.
+    Rents are moved in batches, each in its own short transaction, walking the
+    primary key so every batch reads only the rows after the previous one;
+    `pause` seconds between batches let the API writers take the write lock.
+    The hot tables must use AUTOINCREMENT, which never gives new rows the ids
+    of archived ones (see `enable_rent_autoincrement`).
+    Args:
+        engine (Engine): The read-write engine of the database.
+        older_than (timedelta): Archive the rents closed longer ago than this.
+        batch_size (int): The number of rents moved per transaction.
+        pause (float): Seconds to wait between batches.
+    Returns:
+        int: The number of archived rents.
+    Raises:
+        ArchiveUnsafe: If a hot table was created without AUTOINCREMENT.
+    """
+
+    with engine.connect() as connection:
+        for table, _ in ARCHIVED_TABLES:
+            if not has_autoincrement(connection, table.name):
+                raise ArchiveUnsafe(table.name)
+
+    cutoff = datetime.now() - older_than
+    archived, last_id = 0, 0
+
+    while True:
+        with Session(engine) as session:
+            scanned = session.exec(
+                select(MovieRent.id, MovieRent.is_closed, MovieRent.closed_datetime)
+                .where(col(MovieRent.id) > last_id)
+                .order_by(col(MovieRent.id))
+                .limit(batch_size)
+            ).all()
+            if not scanned:
+                break
+            last_id = scanned[-1][0]
+            ids = [
+                id
+                for id, is_closed, closed_datetime in scanned
+                if is_closed
+                and closed_datetime is not None
+                and closed_datetime < cutoff
+            ]
+            if not ids:
+                continue
+            _move(session, ids)
+            session.commit()
+        archived += len(ids)
+        if pause:
+            time.sleep(pause)
+    return archived
+
+
+def _move(session: Session, ids: list[int]):
+    session.exec(
+        insert(MovieRentArchive).from_select(  # type: ignore
+            [*RENT_COLUMNS, "archived_at"],
+            select(  # type: ignore[call-overload]
+                *(getattr(MovieRent, column) for column in RENT_COLUMNS),
+                literal(datetime.now()),
+            ).where(col(MovieRent.id).in_(ids)),
+        )
+    )
+    session.exec(
+        insert(MovieRentDetailArchive).from_select(  # type: ignore
+            DETAIL_COLUMNS,
+            select(
+                *(getattr(MovieRentDetail, column) for column in DETAIL_COLUMNS)
+            ).where(col(MovieRentDetail.movie_rent_id).in_(ids)),
+        )
+    )
+    session.exec(
+        delete(MovieRentDetail).where(col(MovieRentDetail.movie_rent_id).in_(ids))  # type: ignore
+    )
+    session.exec(delete(MovieRent).where(col(MovieRent.id).in_(ids)))  # type: ignore
@@ -1,4 +1,26 @@
+from datetime import datetime, timedelta
+from typing import Any, Optional
+
+import pytest
 from fastapi.testclient import TestClient
+from sqlalchemy import Engine, event, func, inspect, text, update
+from sqlalchemy.schema import CreateTable
+from sqlmodel import Session, SQLModel, col, create_engine, select
+
+from base.idempotency import IdempotencyRecord, request_hash
+from loader import load_initial_data
+from movie_rents.models import (
+    MovieRent,
+    MovieRentArchive,
+    MovieRentCreate,
+    MovieRentDetail,
+    MovieRentDetailArchive,
+)
+from movie_rents.services import (
+    ArchiveUnsafe,
+    archive_closed_rents,
+    enable_rent_autoincrement,
+)
 
 
 def test_rent_movies_pass(client: TestClient):
@@ -93,3 +115,397 @@ def test_close_movie_rent_pass(client: TestClient):
     assert response.status_code == 200
     assert data["is_closed"] is True
     assert data["closed_datetime"] is not None
+
+
+def test_rent_movies_idempotency_key_replay(client: TestClient):
+    """
+    Test that retrying a rent with the same Idempotency-Key replays the first
+    response instead of creating a second rent.
+    Steps:
+    1. Send a POST request to create a movie rent with an Idempotency-Key header.
+    2. Send the same request again with the same key.
+    3. Assert that both responses describe the same rent and that the second one
+       is flagged as replayed.
+    4. Assert that only one rent was added.
+    Args:
+        client (TestClient): The test client used to simulate API requests.
+    """
+
+    rents_before = len(client.get("/movie_rents").json())
+    payload = {"client_id": 1, "details": [{"movie_copy_id": 2}]}
+    headers = {"Idempotency-Key": "rent-1"}
+
+    first = client.post("/movie_rents", json=payload, headers=headers)
+    second = client.post("/movie_rents", json=payload, headers=headers)
+
+    assert first.status_code == 200
+    assert second.status_code == 200
+    assert second.json() == first.json()
+    assert "idempotent-replayed" not in first.headers
+    assert second.headers["idempotent-replayed"] == "true"
+    assert len(client.get("/movie_rents").json()) == rents_before + 1
+
+
+def test_rent_movies_idempotency_key_reused_fail(client: TestClient):
+    """
+    Test that reusing an Idempotency-Key for a different rent is rejected with
+    a 422 status code.
+    Args:
+        client (TestClient): The test client used to simulate API requests.
+    """
+
+    headers = {"Idempotency-Key": "rent-2"}
+    response = client.post(
+        "/movie_rents",
+        json={"client_id": 1, "details": [{"movie_copy_id": 2}]},
+        headers=headers,
+    )
+    assert response.status_code == 200
+
+    response = client.post(
+        "/movie_rents",
+        json={"client_id": 1, "details": [{"movie_copy_id": 11}]},
+        headers=headers,
+    )
+    assert response.status_code == 422
+
+
+def _storing_response(orm_execute_state) -> bool:
+    statement = orm_execute_state.statement
+    return (
+        orm_execute_state.is_update
+        and statement.table.name == "idempotencyrecord"
+        and "response" in str(statement)
+    )
+
+
+def test_rent_movies_idempotency_key_stored_with_the_rent(
+    client: TestClient,
+):
+    """
+    Test that the response of a rent is stored in the transaction of the rent:
+    when storing it fails, the rent is rolled back too and a retry with the same
+    Idempotency-Key rents the copy instead of finding the key still in progress.
+    Args:
+        client (TestClient): The test client used to simulate API requests.
+    """
+
+    rents_before = len(client.get("/movie_rents").json())
+    payload = {"client_id": 1, "details": [{"movie_copy_id": 2}]}
+    headers = {"Idempotency-Key": "rent-3"}
+
+    def fail_storing_response(orm_execute_state):
+        if _storing_response(orm_execute_state):
+            event.remove(Session, "do_orm_execute", fail_storing_response)
+            raise RuntimeError("crashed while storing the response")
+
+    event.listen(Session, "do_orm_execute", fail_storing_response)
+    with pytest.raises(RuntimeError):
+        client.post("/movie_rents", json=payload, headers=headers)
+    assert len(client.get("/movie_rents").json()) == rents_before
+
+    response = client.post("/movie_rents", json=payload, headers=headers)
+    assert response.status_code == 200
+    assert "idempotent-replayed" not in response.headers
+    replayed = client.post("/movie_rents", json=payload, headers=headers)
+    assert replayed.json() == response.json()
+    assert len(client.get("/movie_rents").json()) == rents_before + 1
+
+
+def test_rent_movies_idempotency_key_stale_claim(client: TestClient, session: Session):
+    """
+    Test that a claim left in progress by a crashed worker is taken over once
+    it is older than the wait, instead of blocking the key until it expires,
+    and that the request losing its claim rolls its rent back with a 409.
+    Args:
+        client (TestClient): The test client used to simulate API requests.
+        session (Session): The database session shared with the client.
+    """
+
+    rents_before = len(client.get("/movie_rents").json())
+    payload = {"client_id": 1, "details": [{"movie_copy_id": 2}]}
+    session.add(
+        IdempotencyRecord(
+            key="rent-4",
+            request_hash=request_hash(
+                "POST /movie_rents", MovieRentCreate.model_validate(payload)
+            ),
+            created_at=datetime.now() - timedelta(hours=1),
+        )
+    )
+    session.commit()
+
+    response = client.post(
+        "/movie_rents", json=payload, headers={"Idempotency-Key": "rent-4"}
+    )
+    assert response.status_code == 200
+    assert "idempotent-replayed" not in response.headers
+    assert len(client.get("/movie_rents").json()) == rents_before + 1
+
+    # another request takes the claim over while the rent is being written
+    def take_over_claim(orm_execute_state):
+        if _storing_response(orm_execute_state) and "rent-5" not in taken:
+            taken.append("rent-5")
+            orm_execute_state.session.execute(
+                update(IdempotencyRecord)
+                .where(col(IdempotencyRecord.key) == "rent-5")
+                .values(created_at=datetime.now())
+            )
+
+    taken: list[str] = []
+    event.listen(Session, "do_orm_execute", take_over_claim)
+    try:
+        response = client.post(
+            "/movie_rents",
+            json={"client_id": 1, "details": [{"movie_copy_id": 11}]},
+            headers={"Idempotency-Key": "rent-5"},
+        )
+    finally:
+        event.remove(Session, "do_orm_execute", take_over_claim)
+    assert response.status_code == 409
+    assert len(client.get("/movie_rents").json()) == rents_before + 1
+
+
+def test_client_rents_history_pages(client: TestClient):
+    """
+    Test the rent history of a client.
+    Steps:
+    1. Create three rents for the client and close one of them.
+    2. Page through the history two rents at a time and check every rent is
+       returned once, newest first.
+    3. Check the open/closed filter and the movie titles of the copies.
+    Args:
+        client (TestClient): The test client used to simulate API requests.
+    """
+
+    rent_ids = []
+    for copy_id in (2, 11, 12):
+        response = client.post(
+            "/movie_rents",
+            json={"client_id": 3, "details": [{"movie_copy_id": copy_id}]},
+        )
+        assert response.status_code == 200
+        rent_ids.append(response.json()["id"])
+    client.put(f"/movie_rents/{rent_ids[0]}/close")
+
+    seen: list[int] = []
+    cursor: Optional[str] = None
+    while True:
+        params: dict[str, Any] = {"limit": 2}
+        if cursor:
+            params["cursor"] = cursor
+        page = client.get("/clients/3/rents", params=params).json()
+        seen += [rent["id"] for rent in page["items"]]
+        cursor = page["next_cursor"]
+        if cursor is None:
+            break
+    assert len(seen) == len(set(seen))
+    assert [id for id in seen if id in rent_ids] == rent_ids[::-1]
+
+    page = client.get(
+        "/clients/3/rents", params={"is_closed": False, "include_titles": True}
+    ).json()
+    ids = [rent["id"] for rent in page["items"]]
+    assert rent_ids[0] not in ids and rent_ids[1] in ids
+    assert all(detail["title"] for rent in page["items"] for detail in rent["details"])
+
+    assert client.get("/clients/3/rents", params={"cursor": "x"}).status_code == 400
+    assert client.get("/clients/0/rents").status_code == 404
+
+
+def test_client_rents_history_without_creation_datetime(
+    client: TestClient, session: Session
+):
+    """
+    Test that rents without a creation datetime, such as legacy rows, are paged
+    after the dated ones instead of failing the history or being skipped.
+    Args:
+        client (TestClient): The test client used to simulate API requests.
+        session (Session): The database session shared with the client.
+    """
+
+    undated = [MovieRent(client_id=3) for _ in range(2)]
+    session.add_all(undated)
+    session.commit()
+    undated_ids = sorted((rent.id for rent in undated), reverse=True)
+    session.execute(
+        update(MovieRent)
+        .where(col(MovieRent.id).in_(undated_ids))
+        .values(creation_datetime=None)
+    )
+    session.commit()
+    dated = client.post(
+        "/movie_rents", json={"client_id": 3, "details": [{"movie_copy_id": 2}]}
+    ).json()["id"]
+
+    seen: list[int] = []
+    cursor: Optional[str] = None
+    while True:
+        params: dict[str, Any] = {"limit": 1}
+        if cursor:
+            params["cursor"] = cursor
+        response = client.get("/clients/3/rents", params=params)
+        assert response.status_code == 200
+        seen += [rent["id"] for rent in response.json()["items"]]
+        cursor = response.json()["next_cursor"]
+        if cursor is None:
+            break
+    assert seen[0] == dated
+    assert seen[1:] == undated_ids
+
+
+def test_archive_closed_rents(client: TestClient, session: Session):
+    """
+    Test that old closed rents move to the archive tables and stay readable in
+    the client history with `include_archived`.
+    Steps:
+    1. Create two rents for a client, close them and backdate their closing.
+    2. Create a newer rent, which is never archived.
+    3. Archive the rents closed more than a day ago.
+    4. Check the hot tables no longer hold them and the history returns them
+       only with `include_archived`.
+    Args:
+        client (TestClient): The test client used to simulate API requests.
+        session (Session): The database session shared with the client.
+    """
+
+    rent_ids = []
+    for copy_id in (2, 11):
+        response = client.post(
+            "/movie_rents",
+            json={"client_id": 2, "details": [{"movie_copy_id": copy_id}]},
+        )
+        assert response.status_code == 200
+        rent_ids.append(response.json()["id"])
+        client.put(f"/movie_rents/{rent_ids[-1]}/close")
+    for rent_id in rent_ids:
+        rent = session.get(MovieRent, rent_id)
+        assert rent is not None
+        rent.closed_datetime = datetime.now() - timedelta(days=30)
+        session.add(rent)
+    session.commit()
+    client.post(
+        "/movie_rents", json={"client_id": 2, "details": [{"movie_copy_id": 12}]}
+    )
+
+    engine = session.get_bind()
+    assert isinstance(engine, Engine)
+    archived = archive_closed_rents(engine, timedelta(days=1), batch_size=2, pause=0)
+    session.expire_all()
+    assert archived >= 2
+    assert all(session.get(MovieRent, rent_id) is None for rent_id in rent_ids)
+
+    hot = client.get("/clients/2/rents").json()["items"]
+    assert not {rent["id"] for rent in hot} & set(rent_ids)
+
+    history = client.get(
+        "/clients/2/rents", params={"include_archived": True, "limit": 500}
+    ).json()["items"]
+    archived_rents = {rent["id"]: rent for rent in history if rent["archived"]}
+    assert set(rent_ids) <= set(archived_rents)
+    assert all(len(archived_rents[id]["details"]) == 1 for id in rent_ids)
+
+
+def test_archive_never_reuses_rent_ids(tmp_path):
+    """
+    Test that rents created after archiving every rent, the newest included,
+    get new ids, on a database created before the rent tables used
+    AUTOINCREMENT once the archive command upgraded them.
+    Steps:
+    1. Create a database whose rent tables lack AUTOINCREMENT; archiving refuses
+       to run on it.
+    2. Recreate the tables with AUTOINCREMENT, keeping their rows and indexes.
+    3. Close and archive every rent, then create a rent and a detail.
+    4. Check their ids are above every archived id.
+    """
+
+    engine = create_engine(f"sqlite:///{tmp_path}/database.db")
+    with engine.begin() as connection:
+        for table in SQLModel.metadata.sorted_tables:
+            ddl = str(CreateTable(table).compile(dialect=engine.dialect))
+            connection.execute(text(ddl.replace(" AUTOINCREMENT", "")))
+            for index in table.indexes:
+                index.create(connection)
+    load_initial_data(engine)
+    with pytest.raises(ArchiveUnsafe):
+        archive_closed_rents(engine, timedelta(days=1), pause=0)
+
+    with Session(engine) as session:
+        rents = session.exec(select(func.count(MovieRent.id))).one()
+    assert enable_rent_autoincrement(engine) == ["movierent", "movierentdetail"]
+    assert enable_rent_autoincrement(engine) == []
+    indexes = {index["name"] for index in inspect(engine).get_indexes("movierent")}
+    assert "ix_movierent_client_id_creation_datetime" in indexes
+
+    with Session(engine) as session:
+        session.exec(
+            update(MovieRent).values(
+                is_closed=True, closed_datetime=datetime.now() - timedelta(days=30)
+            )
+        )
+        session.commit()
+    assert archive_closed_rents(engine, timedelta(days=1), pause=0) == rents
+
+    with Session(engine) as session:
+        rent = MovieRent(client_id=1, details=[MovieRentDetail(movie_copy_id=1)])
+        session.add(rent)
+        session.commit()
+        assert rent.id > session.exec(select(func.max(MovieRentArchive.id))).one()
+        assert (
+            rent.details[0].id
+            > session.exec(select(func.max(MovieRentDetailArchive.id))).one()
+        )
+    engine.dispose()
+
+
+def test_scan_movie_rent(client: TestClient, session: Session):
+    """
+    Test renting copies by their scanned codes.
+    Steps:
+    1. Look up two copies by code.
+    2. Rent them with one scan and check they are no longer available.
+    3. Scanning one of them again fails with 409, an unknown code with 404, and
+       neither creates a rent.
+    Args:
+        client (TestClient): The test client used to simulate API requests.
+        session (Session): The database session shared with the client.
+    """
+
+    movie = client.post(
+        "/movies/with_stock",
+        json={
+            "title": "Barcode",
+            "director": "Scanner",
+            "year": 2024,
+            "description": "Copies to scan",
+            "genre_id": 1,
+            "stock": 2,
+        },
+    ).json()
+    codes = [copy["code"] for copy in movie["copies"]]
+    assert all(codes) and len(set(codes)) == 2
+
+    response = client.get(f"/copies/by_code/{codes[0]}")
+    assert response.status_code == 200
+    assert response.json()["movie"]["id"] == movie["id"]
+    assert response.json()["available"] is True
+
+    response = client.post("/movie_rents/scan", json={"client_id": 1, "codes": codes})
+    assert response.status_code == 200
+    rented = {detail["movie_copy"]["code"] for detail in response.json()["details"]}
+    assert rented == set(codes)
+    assert client.get(f"/copies/by_code/{codes[1]}").json()["available"] is False
+    rents = len(client.get("/movie_rents").json())
+
+    response = client.post(
+        "/movie_rents/scan", json={"client_id": 2, "codes": codes[1:]}
+    )
+    assert response.status_code == 409
+    assert response.json()["detail"]["codes"] == codes[1:]
+    response = client.post(
+        "/movie_rents/scan", json={"client_id": 2, "codes": ["NOPE"]}
+    )
+    assert response.status_code == 404
+    assert response.json()["detail"]["codes"] == ["NOPE"]
+    assert len(client.get("/movie_rents").json()) == rents
+    assert client.get("/copies/by_code/NOPE").status_code == 404
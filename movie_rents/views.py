@@ -1,22 +1,54 @@
-from fastapi import APIRouter, HTTPException
+from typing import Annotated, Optional
 
-from base.db_connection import SessionDep
-from movie_rents.models import MovieRentRetrieve, MovieRentCreate, MovieRentUpdate
-from movie_rents.repositories import MovieRentRepository
+from fastapi import APIRouter, Depends, Header, HTTPException, Query
+
+from base.db_connection import ReadSessionDep, SessionDep
+from base.idempotency import idempotency_store
+from base.pagination import InvalidCursor
+from base.repository import (
+    FieldFilter,
+    QuerySpec,
+    parse_ids,
+    query_response,
+    query_spec,
+)
+from base.write_pipeline import run_write
+from clients.models import Client
+from movie_rents.models import (
+    ClientRentPage,
+    MovieRentRetrieve,
+    MovieRentCreate,
+    MovieRentScan,
+    MovieRentUpdate,
+)
+from movie_rents.repositories import (
+    CopiesUnavailable,
+    MovieRentRepository,
+    UnknownCopyCodes,
+)
 from sqlalchemy.orm.exc import UnmappedInstanceError
 
 router = APIRouter()
 
+MovieRentQueryDep = Annotated[QuerySpec, Depends(query_spec("ids"))]
+
 
 @router.get("/movie_rents", tags=["movie_rents"])
-async def list_movie_rents(session: SessionDep):
+def list_movie_rents(
+    session: ReadSessionDep, spec: MovieRentQueryDep, ids: Optional[str] = None
+):
     """
     List all movie rents.
-    This asynchronous endpoint retrieves a list of all movie rents from the database.
+    This endpoint retrieves a list of all movie rents from the database.
     Args:
-        session (SessionDep): The database session dependency used to interact with the database.
+        session (ReadSessionDep): The read-only database session dependency used to interact with the database.
+        spec (QuerySpec): Filters, sort keys, projection and page parsed from the
+                          query string, e.g. `?client_id=3&sort=-id&limit=20`.
+        ids (Optional[str]): Comma separated ids: only return these rents, in this
+                             order, with one query. Missing ids are skipped.
     Returns:
-        List[MovieRent]: A list of movie rent objects.
+        List[MovieRent]: A list of movie rent objects, or only the requested fields
+                         of the matching rents.
     Raises:
         HTTPException: If there is an issue retrieving the movie rents.
     Swagger:
@@ -36,16 +68,63 @@ async def list_movie_rents(session: SessionDep):
     """
 
     repo = MovieRentRepository(session)
+    if ids is not None:
+        batch_ids = parse_ids(ids)
+        if not spec:
+            return repo.get_many(batch_ids)
+        spec.filters.append(FieldFilter("id", "in", batch_ids))
+    if spec:
+        return query_response(lambda: repo.query(spec))
     return repo.get_all()
 
 
+@router.get(
+    "/clients/{client_id}/rents", tags=["clients"], response_model=ClientRentPage
+)
+def list_client_rents(
+    client_id: int,
+    session: ReadSessionDep,
+    limit: Annotated[int, Query(ge=1, le=500)] = 50,
+    cursor: Optional[str] = None,
+    is_closed: Optional[bool] = None,
+    include_titles: bool = False,
+    include_archived: bool = False,
+):
+    """
+    Retrieve the rent history of a client, newest first.
+    Args:
+        client_id (int): The client whose rents are retrieved.
+        session (ReadSessionDep): The read-only database session dependency.
+        limit (int): The maximum number of rents of the page.
+        cursor (Optional[str]): The `next_cursor` of the previous page.
+        is_closed (Optional[bool]): Only return closed, or open, rents.
+        include_titles (bool): Add the movie title to every rented copy.
+        include_archived (bool): Also return the archived rents (`archived: true`).
+    Returns:
+        ClientRentPage: The rents with their copies and movies, and the cursor of
+                        the next page (None on the last page).
+    Raises:
+        HTTPException: 404 if the client does not exist, 400 if the cursor is
+                       invalid.
+    """
+
+    if session.get(Client, client_id) is None:
+        raise HTTPException(status_code=404, detail="Client not found")
+    try:
+        return MovieRentRepository(session).get_client_rents(
+            client_id, limit, cursor, is_closed, include_titles, include_archived
+        )
+    except InvalidCursor:
+        raise HTTPException(status_code=400, detail="Invalid cursor")
+
+
 @router.get("/movie_rents/{id}", tags=["movie_rents"], response_model=MovieRentRetrieve)
-async def retrieve_movie_rent(id: int, session: SessionDep):
+def retrieve_movie_rent(id: int, session: ReadSessionDep):
     """
     Retrieve a movie rent by its ID.
     Args:
         id (int): The unique identifier of the movie rent to retrieve.
-        session (SessionDep): The database session dependency.
+        session (ReadSessionDep): The read-only database session dependency.
     Returns:
         dict: The movie rent details if found.
     Raises:
@@ -147,20 +226,26 @@ async def delete_genre(id: int, session: SessionDep):
     """
 
     try:
-        repo = MovieRentRepository(session)
-        return repo.delete(id)
+        return await run_write(session, lambda s: MovieRentRepository(s).delete(id))
     except UnmappedInstanceError:
         raise HTTPException(status_code=404, detail="Movie Rent not found")
 
 
 @router.post("/movie_rents", tags=["movie_rents"], response_model=MovieRentRetrieve)
-async def add_movie_rent(movie_rent: MovieRentCreate, session: SessionDep):
+async def add_movie_rent(
+    movie_rent: MovieRentCreate,
+    session: SessionDep,
+    idempotency_key: Annotated[Optional[str], Header()] = None,
+):
     """
     Adds a new movie rent to the system.
     This endpoint allows the creation of a new movie rent record in the database.
+    Retries sent with the same Idempotency-Key header get the stored response of
+    the first request instead of renting the copies again.
     Args:
         movie_rent (MovieRentCreate): The data required to create a new movie rent, including details such as movie ID, user ID, and rental period.
         session (SessionDep): The database session dependency used to interact with the database.
+        idempotency_key (Optional[str]): The Idempotency-Key header, a unique value chosen by the client for each rent.
     Returns:
         dict: A dictionary containing the details of the newly created movie rent.
     Raises:
@@ -200,8 +285,62 @@ async def add_movie_rent(movie_rent: MovieRentCreate, session: SessionDep):
               description: Internal server error.
     """
 
-    repo = MovieRentRepository(session)
-    return repo.add_rent(movie_rent)
+    return await idempotency_store.run(
+        session,
+        idempotency_key,
+        "POST /movie_rents",
+        movie_rent,
+        lambda s: MovieRentRepository(s).add_rent(movie_rent),
+        MovieRentRetrieve,
+    )
+
+
+@router.post(
+    "/movie_rents/scan", tags=["movie_rents"], response_model=MovieRentRetrieve
+)
+async def scan_movie_rent(
+    scan: MovieRentScan,
+    session: SessionDep,
+    idempotency_key: Annotated[Optional[str], Header()] = None,
+):
+    """
+    Rent copies by their scanned barcodes, for the scanners at the counter.
+    The codes are resolved with one indexed query and the copies are rented in
+    one transaction: either all of them or none. Retries sent with the same
+    Idempotency-Key header get the stored response of the first request.
+    Args:
+        scan (MovieRentScan): The client and the scanned codes (1 to 100).
+        session (SessionDep): The database session dependency.
+        idempotency_key (Optional[str]): The Idempotency-Key header.
+    Returns:
+        MovieRentRetrieve: The new rent with its copies.
+    Raises:
+        HTTPException: 404 if the client or some codes are unknown, 409 if some
+                       copies are already rented; the detail lists the codes.
+    """
+
+    if session.get(Client, scan.client_id) is None:
+        raise HTTPException(status_code=404, detail="Client not found")
+    try:
+        return await idempotency_store.run(
+            session,
+            idempotency_key,
+            "POST /movie_rents/scan",
+            scan,
+            lambda s: MovieRentRepository(s).scan_rent(scan),
+            MovieRentRetrieve,
+        )
+    except UnknownCopyCodes as exc:
+        raise HTTPException(
+            status_code=404, detail={"message": "Unknown codes", "codes": exc.codes}
+        )
+    except CopiesUnavailable as exc:
+        # the rent was flushed before the check, drop it
+        session.rollback()
+        raise HTTPException(
+            status_code=409,
+            detail={"message": "Copies already rented", "codes": exc.codes},
+        )
 
 
 @router.put("/movie_rents/{id}", tags=["movie_rents"], response_model=MovieRentRetrieve)
@@ -246,8 +385,11 @@ async def update_movie_rent(id: int, movie_rent: MovieRentUpdate, session: Sessi
     """
 
     try:
-        repo = MovieRentRepository(session)
-        return repo.update_rent(id, movie_rent)
+        return await run_write(
+            session,
+            lambda s: MovieRentRepository(s).update_rent(id, movie_rent),
+            MovieRentRetrieve,
+        )
     except UnmappedInstanceError:
         raise HTTPException(status_code=404, detail="Movie Rent not found")
 
@@ -269,7 +411,6 @@ async def close_movie_rent(id: int, session: SessionDep):
     """
 
     try:
-        repo = MovieRentRepository(session)
-        return repo.close_rent(id)
+        return await run_write(session, lambda s: MovieRentRepository(s).close_rent(id))
     except UnmappedInstanceError:
         raise HTTPException(status_code=404, detail="Movie Rent not found")
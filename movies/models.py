@@ -14,11 +14,14 @@ class BaseMovie(SQLModel):
     year: int
     director: str
 
-    genre_id: int = Field(foreign_key="genre.id")
+    genre_id: int = Field(foreign_key="genre.id", index=True)
 
 
 class Movie(BaseMovie, table=True):
     id: int = Field(default=None, primary_key=True)
+    # denormalized stock, maintained by the repositories (see movies/services.py)
+    total_copies: int = Field(default=0)
+    available_copies: int = Field(default=0)
     copies: list["MovieCopy"] = Relationship(back_populates="movie")
 
 
@@ -32,12 +35,35 @@ class MovieUpdate(BaseMovie):
 
 class MoviePublic(BaseMovie):
     id: int
+    total_copies: int = 0
+    available_copies: int = 0
     copies: list["MovieCopyPublicSmall"]
 
 
+class AlsoRentedMovie(SQLModel):
+    id: int
+    title: str
+    clients: int
+
+
+class MovieDetailPublic(MoviePublic):
+    # "clients who rented this also rented", see recommendations/engine.py
+    also_rented: list[AlsoRentedMovie] = []
+
+
+class MovieSuggestion(SQLModel):
+    # fuzzy title and director match, see search/index.py
+    id: int
+    title: str
+    director: str
+    field: str
+    score: float
+
+
 class MovieCopyBase(SQLModel):
-    movie_id: int = Field(foreign_key="movie.id")
-    code: Optional[str] = Field(index=True)
+    movie_id: int = Field(foreign_key="movie.id", index=True)
+    # unique barcode of the copy, see movies/services.py generate_copy_codes
+    code: Optional[str] = Field(default=None, index=True, unique=True)
 
 
 class MovieCopy(MovieCopyBase, table=True):
@@ -53,6 +79,11 @@ class MovieCopyPublic(MovieCopyBase):
     movie: Movie
 
 
+class MovieCopyScan(MovieCopyPublic):
+    # whether the copy can be rented, i.e. it is in no open rent
+    available: bool
+
+
 class MovieCopyPublicSmall(MovieCopyBase):
     id: int
     code: Optional[str]
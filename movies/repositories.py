@@ -1,8 +1,28 @@
+from typing import Optional
+
+from sqlalchemy.orm import selectinload
 from sqlmodel import select, col
-from base.repository import Repository
+from analytics.services import move_genre_rentals
+from base.repository import QuerySpec, Repository
+from base.tracing import span
 from sqlalchemy.orm.exc import UnmappedInstanceError
 
-from movies.models import Movie, MovieCreate, MovieUpdate, MovieCopy, Genre
+from movies.models import (
+    Movie,
+    MovieCreate,
+    MovieUpdate,
+    MovieCopy,
+    MovieCopyScan,
+    Genre,
+)
+from movies.services import (
+    generate_copy_codes,
+    refresh_stock_counters,
+    rented_copy_ids,
+)
+
+# maintained by the repository, never taken from the client
+STOCK_COUNTER_FIELDS = {"total_copies", "available_copies"}
 
 
 class GenreRepository(Repository[Genre]):
@@ -22,6 +42,8 @@ class GenreRepository(Repository[Genre]):
             Deletes a Genre instance from the database by its ID and commits the transaction.
     """
 
+    model = Genre
+
     def get(self, id: int):
         return self.session.get(Genre, id)
 
@@ -32,7 +54,7 @@ class GenreRepository(Repository[Genre]):
 
     def add(self, new_instance: Genre):
         self.session.add(new_instance)
-        self.session.commit()
+        self.commit()
         self.session.refresh(new_instance)
         return new_instance
 
@@ -43,14 +65,14 @@ class GenreRepository(Repository[Genre]):
         instance_data = instance.model_dump(exclude_unset=True)
         db_instance.sqlmodel_update(instance_data)
         self.session.add(db_instance)
-        self.session.commit()
+        self.commit()
         self.session.refresh(db_instance)
         return db_instance
 
     def delete(self, id):
         instance = self.session.get(Genre, id)
         self.session.delete(instance)
-        self.session.commit()
+        self.commit()
         return True
 
 
@@ -62,6 +84,14 @@ class MovieRepository(Repository[Movie]):
             Retrieves a Movie instance by its ID.
         get_all() -> List[Movie]:
             Retrieves all Movie instances from the database.
+        get_many(ids: list[int]) -> List[Movie]:
+            Retrieves the Movie instances of several ids, with their copies,
+            in the order of the ids.
+        query(spec: QuerySpec, title: Optional[str]) -> list[dict]:
+            Runs a query spec, optionally on the movies whose title contains
+            `title`.
+        get_copy_by_code(code: str) -> Optional[MovieCopyScan]:
+            Retrieves a copy by its barcode, with its movie and availability.
         add(new_instance: Movie) -> Movie:
             Adds a new Movie instance to the database, commits the transaction,
             and refreshes the instance.
@@ -71,8 +101,10 @@ class MovieRepository(Repository[Movie]):
             Deletes a Movie instance from the database by its ID and commits the transaction.
     """
 
+    model = Movie
+
     def get(self, id: int):
-        return self.session.get(Genre, id)
+        return self.session.get(Movie, id)
 
     def get_all(self, **kwargs):
         title = kwargs.get("title")
@@ -84,47 +116,85 @@ class MovieRepository(Repository[Movie]):
         results = self.session.exec(statement).all()
         return results
 
+    def get_many(self, ids):
+        return super().get_many(ids, selectinload(Movie.copies))  # type: ignore
+
+    def query(self, spec: QuerySpec, title: Optional[str] = None) -> list[dict]:
+        conditions = [col(Movie.title).like(f"%{title}%")] if title else []
+        return super().query(spec, *conditions)
+
+    def get_copy_by_code(self, code: str) -> Optional[MovieCopyScan]:
+        statement = (
+            select(MovieCopy)
+            .where(MovieCopy.code == code)
+            .options(selectinload(MovieCopy.movie))  # type: ignore
+        )
+        movie_copy = self.session.exec(statement).first()
+        if movie_copy is None:
+            return None
+        rented = rented_copy_ids(self.session, [movie_copy.id])
+        return MovieCopyScan.model_validate(
+            movie_copy, update={"available": movie_copy.id not in rented}
+        )
+
     def add(self, new_instance: Movie):
         self.session.add(new_instance)
-        self.session.commit()
+        self.session.flush()
+        refresh_stock_counters(self.session, [new_instance.id])
+        self.commit()
         self.session.refresh(new_instance)
         return new_instance
 
     def update(self, id: int, instance: Movie):
+        db_instance = self._update(id, instance)
+        self.commit()
+        self.session.refresh(db_instance)
+        return db_instance
+
+    def _update(self, id: int, instance: Movie) -> Movie:
         db_instance = self.session.get(Movie, id)
         if not db_instance:
             raise UnmappedInstanceError(db_instance)
-        instance_data = instance.model_dump(exclude_unset=True)
+        instance_data = instance.model_dump(
+            exclude_unset=True, exclude=STOCK_COUNTER_FIELDS
+        )
+        old_genre_id = db_instance.genre_id
         db_instance.sqlmodel_update(instance_data)
         self.session.add(db_instance)
-        self.session.commit()
-        self.session.refresh(db_instance)
+        if db_instance.genre_id != old_genre_id:
+            move_genre_rentals(self.session, id, old_genre_id, db_instance.genre_id)
         return db_instance
 
     def delete(self, id: int):
         instance = self.session.get(Movie, id)
         self.session.delete(instance)
-        self.session.commit()
+        self.commit()
         return True
 
     def add_with_stock(self, movie: MovieCreate):
-        movie_instance = Movie.model_validate(movie)
-        new_movie = self.add(movie_instance)
+        # one transaction for the movie and its copies, so a retried write
+        # never leaves a movie without its stock
+        with span("validate Movie"):
+            new_movie = Movie.model_validate(movie)
+        self.session.add(new_movie)
+        self.session.flush()
         stock = movie.stock
 
         movie_copies = []
-        for i in range(stock):
-            specific_movie = MovieCopy(movie_id=new_movie.id)
+        for code in generate_copy_codes(self.session, stock):
+            specific_movie = MovieCopy(movie_id=new_movie.id, code=code)
             movie_copies.append(specific_movie)
-        self.session.bulk_save_objects(movie_copies)
+        self.session.add_all(movie_copies)
+        refresh_stock_counters(self.session, [new_movie.id])
+        self.commit()
         self.session.refresh(new_movie)
-        self.session.commit()
 
         return new_movie
 
     def update_with_stock(self, id: int, movie: MovieUpdate):
-        movie_instance = Movie.model_validate(movie)
-        updated_movie = self.update(id, movie_instance)
+        with span("validate Movie"):
+            movie_instance = Movie.model_validate(movie)
+        updated_movie = self._update(id, movie_instance)
 
         # reduce or increase the number of movies in stock
         stock = movie.stock
@@ -134,10 +204,10 @@ class MovieRepository(Repository[Movie]):
 
         if stock > movie_copies_count:
             movie_copies = []
-            for i in range(stock - movie_copies_count):
-                specific_movie = MovieCopy(movie_id=updated_movie.id)
+            for code in generate_copy_codes(self.session, stock - movie_copies_count):
+                specific_movie = MovieCopy(movie_id=updated_movie.id, code=code)
                 movie_copies.append(specific_movie)
-            self.session.bulk_save_objects(movie_copies)
+            self.session.add_all(movie_copies)
         elif stock < movie_copies_count:
             results = self.session.exec(
                 select(MovieCopy)
@@ -146,6 +216,8 @@ class MovieRepository(Repository[Movie]):
             ).all()
             for movie_copy in results:
                 self.session.delete(movie_copy)
-        self.session.commit()
+        self.session.flush()
+        refresh_stock_counters(self.session, [id])
+        self.commit()
         self.session.refresh(updated_movie)
         return updated_movie
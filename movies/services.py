@@ -0,0 +1,186 @@
+import secrets
+from typing import Iterable, Optional
+
+from sqlalchemy import ScalarSelect, bindparam, distinct, func, update
+from sqlmodel import Session, col, select
+
+from base.repository import model_table
+from changes.services import record_updates
+from movie_rents.models import MovieRent, MovieRentDetail
+from movies.models import Movie, MovieCopy
+
+
+def _total_copies() -> ScalarSelect:
+    return (
+        select(func.count(col(MovieCopy.id)))
+        .where(MovieCopy.movie_id == Movie.id)
+        .scalar_subquery()
+    )
+
+
+def _rented_copies() -> ScalarSelect:
+    # a copy is rented while it is part of a rent that is not closed
+    return (
+        select(func.count(distinct(col(MovieCopy.id))))
+        .select_from(MovieCopy)
+        .join(MovieRentDetail, col(MovieRentDetail.movie_copy_id) == MovieCopy.id)
+        .join(MovieRent, col(MovieRentDetail.movie_rent_id) == MovieRent.id)
+        .where(MovieCopy.movie_id == Movie.id, col(MovieRent.is_closed).is_not(True))
+        .scalar_subquery()
+    )
+
+
+def refresh_stock_counters(
+    session: Session, movie_ids: Optional[Iterable[int]] = None
+) -> None:
+    """
+    Recompute the `total_copies` and `available_copies` counters of movies from
+    their copies and open rents, within the current transaction of the session.
+    Repositories call it for the movies touched by a write, before committing,
+    so the counters always match the committed copies and rents.
+    Args:
+        session (Session): The session whose transaction is updated.
+        movie_ids (Optional[Iterable[int]]): The movies to refresh, all by default.
+    """
+
+    total_copies = _total_copies()
+    statement = update(Movie).values(
+        total_copies=total_copies, available_copies=total_copies - _rented_copies()
+    )
+    if movie_ids is not None:
+        movie_ids = set(movie_ids)
+        if not movie_ids:
+            return
+        statement = statement.where(col(Movie.id).in_(movie_ids))
+    session.exec(statement)  # type: ignore
+    if movie_ids is not None:
+        # the bulk UPDATE bypasses the flush, publish the new counters
+        record_updates(session, Movie, movie_ids)
+
+
+def verify_stock_counters(session: Session) -> list[dict]:
+    """
+    Compare the stored stock counters of every movie with the values computed
+    from its copies and open rents.
+    Args:
+        session (Session): The session used to read the movies.
+    Returns:
+        list[dict]: The movies whose counters are wrong, with the stored and the
+                    expected values.
+    """
+
+    total_copies = _total_copies().label("expected_total_copies")
+    available_copies = (_total_copies() - _rented_copies()).label(
+        "expected_available_copies"
+    )
+    statement = select(  # type: ignore[call-overload]
+        Movie.id,
+        Movie.total_copies,
+        Movie.available_copies,
+        total_copies,
+        available_copies,
+    )
+    return [
+        dict(row._mapping)
+        for row in session.exec(statement)
+        if row.total_copies != row.expected_total_copies
+        or row.available_copies != row.expected_available_copies
+    ]
+
+
+def rented_movie_ids(session: Session, movie_rent_id: int) -> set[int]:
+    """
+    Return the ids of the movies with copies in a rent.
+    """
+
+    statement = (
+        select(MovieCopy.movie_id)
+        .join(MovieRentDetail, col(MovieRentDetail.movie_copy_id) == MovieCopy.id)
+        .where(MovieRentDetail.movie_rent_id == movie_rent_id)
+        .distinct()
+    )
+    return set(session.exec(statement).all())
+
+
+# copy codes are printed as barcodes: 10 characters of Crockford's base32, which
+# has no ambiguous letters (I, L, O, U), about 50 random bits
+COPY_CODE_ALPHABET = "0123456789ABCDEFGHJKMNPQRSTVWXYZ"
+COPY_CODE_LENGTH = 10
+
+
+def generate_copy_codes(session: Session, count: int) -> list[str]:
+    """
+    Generate unique codes for new copies.
+    Codes are drawn at random and the few that already exist are drawn again,
+    checked with one indexed IN query per round.
+    Args:
+        session (Session): The session used to look up the existing codes.
+        count (int): The number of codes.
+    Returns:
+        list[str]: `count` distinct codes not used by any copy.
+    """
+
+    codes: set[str] = set()
+    while len(codes) < count:
+        drawn = {
+            "".join(secrets.choice(COPY_CODE_ALPHABET) for _ in range(COPY_CODE_LENGTH))
+            for _ in range(count - len(codes))
+        } - codes
+        taken = session.exec(
+            select(MovieCopy.code).where(col(MovieCopy.code).in_(drawn))
+        ).all()
+        codes.update(drawn.difference(taken))
+    return list(codes)
+
+
+def backfill_copy_codes(session: Session, batch_size: int = 1000) -> int:
+    """
+    Give a code to every copy that has none, `batch_size` copies at a time,
+    committing every batch.
+    Returns:
+        int: The number of copies that got a code.
+    """
+
+    filled = 0
+    while copy_ids := session.exec(
+        select(MovieCopy.id)
+        .where(col(MovieCopy.code).is_(None))
+        .order_by(col(MovieCopy.id))
+        .limit(batch_size)
+    ).all():
+        codes = generate_copy_codes(session, len(copy_ids))
+        copies = model_table(MovieCopy)
+        session.connection().execute(
+            update(copies)
+            .where(copies.c.id == bindparam("copy_id"))
+            .values(code=bindparam("copy_code")),
+            [
+                {"copy_id": copy_id, "copy_code": code}
+                for copy_id, code in zip(copy_ids, codes)
+            ],
+        )
+        record_updates(session, MovieCopy, copy_ids)
+        session.commit()
+        filled += len(copy_ids)
+    return filled
+
+
+def rented_copy_ids(
+    session: Session, copy_ids: Iterable[int], exclude_rent_id: Optional[int] = None
+) -> set[int]:
+    """
+    Return the copies, among `copy_ids`, that are part of an open rent other
+    than `exclude_rent_id`.
+    """
+
+    statement = (
+        select(MovieRentDetail.movie_copy_id)
+        .join(MovieRent, col(MovieRentDetail.movie_rent_id) == MovieRent.id)
+        .where(
+            col(MovieRentDetail.movie_copy_id).in_(set(copy_ids)),
+            col(MovieRent.is_closed).is_not(True),
+        )
+    )
+    if exclude_rent_id is not None:
+        statement = statement.where(MovieRent.id != exclude_rent_id)
+    return set(session.exec(statement).all())
@@ -1,4 +1,7 @@
 from fastapi.testclient import TestClient
+from sqlmodel import Session
+
+from movies.services import verify_stock_counters
 
 
 def test_create_movie_with_stock_pass(client: TestClient):
@@ -181,3 +184,177 @@ def test_list_movies_by_name(client: TestClient):
     data = response.json()
     assert response.status_code == 200
     assert len(data) == 4
+
+
+def test_create_movie_with_stock_idempotency_key_replay(client: TestClient):
+    """
+    Test that retrying the creation of a movie with stock with the same
+    Idempotency-Key returns the first movie instead of creating its stock twice.
+    Args:
+        client (TestClient): The test client used to simulate HTTP requests.
+    Assertions:
+        - Both responses have the same movie ID and copies.
+        - The second response is flagged as replayed.
+    """
+
+    payload = {
+        "title": "The Lion King",
+        "director": "Rob Minkoff · Roger Allers",
+        "year": 2024,
+        "description": "The Lion King movie",
+        "genre_id": 1,
+        "stock": 5,
+    }
+    headers = {"Idempotency-Key": "movie-1"}
+
+    first = client.post("/movies/with_stock", json=payload, headers=headers)
+    second = client.post("/movies/with_stock", json=payload, headers=headers)
+
+    assert first.status_code == 200
+    assert second.json()["id"] == first.json()["id"]
+    assert second.json()["copies"] == first.json()["copies"]
+    assert second.headers["idempotent-replayed"] == "true"
+
+
+def test_retrieve_movie(client: TestClient):
+    """
+    Test the endpoint for retrieving a movie by its ID.
+    This test creates a movie with stock and retrieves it, then requests a movie
+    that does not exist.
+    Args:
+        client (TestClient): The test client used to simulate HTTP requests.
+    Assertions:
+        - The retrieved movie has the created title and copies.
+        - A missing movie returns a 404 status code with "Movie not found".
+    """
+
+    response = client.post(
+        "/movies/with_stock",
+        json={
+            "title": "The Lion King",
+            "director": "Rob Minkoff · Roger Allers",
+            "year": 2024,
+            "description": "The Lion King movie",
+            "genre_id": 1,
+            "stock": 3,
+        },
+    )
+    movie_id = response.json()["id"]
+
+    response = client.get(f"/movies/{movie_id}")
+    data = response.json()
+    assert response.status_code == 200
+    assert data["title"] == "The Lion King"
+    assert len(data["copies"]) == 3
+
+    response = client.get("/movies/1000")
+    assert response.status_code == 404
+    assert response.json()["detail"] == "Movie not found"
+
+
+def test_movie_stock_counters(client: TestClient, session: Session):
+    """
+    Test that the stock counters of a movie follow its copies and rents.
+    Steps:
+    1. Create a movie with 3 copies: 3 copies in total, all available.
+    2. Rent the last 2 of them: 1 available.
+    3. Close the rent: 3 available.
+    4. Reduce the stock to 2: 2 copies in total, all available.
+    5. Verify that no movie has wrong counters.
+    Args:
+        client (TestClient): The test client used to simulate HTTP requests.
+        session (Session): The database session of the test.
+    """
+
+    payload = {
+        "title": "The Lion King",
+        "director": "Rob Minkoff · Roger Allers",
+        "year": 2024,
+        "description": "The Lion King movie",
+        "genre_id": 1,
+        "stock": 3,
+    }
+    movie = client.post("/movies/with_stock", json=payload).json()
+    assert (movie["total_copies"], movie["available_copies"]) == (3, 3)
+
+    copies = [{"movie_copy_id": copy["id"]} for copy in movie["copies"][1:]]
+    rent = client.post("/movie_rents", json={"client_id": 1, "details": copies}).json()
+    movie = client.get(f"/movies/{movie['id']}").json()
+    assert (movie["total_copies"], movie["available_copies"]) == (3, 1)
+
+    client.put(f"/movie_rents/{rent['id']}/close")
+    movie = client.get(f"/movies/{movie['id']}").json()
+    assert (movie["total_copies"], movie["available_copies"]) == (3, 3)
+
+    movie = client.put(
+        f"/movies/{movie['id']}/with_stock", json={**payload, "stock": 2}
+    ).json()
+    assert (movie["total_copies"], movie["available_copies"]) == (2, 2)
+
+    assert verify_stock_counters(session) == []
+
+
+def test_list_movies_query_spec(client: TestClient):
+    """
+    Test the filters, sort keys and projection of the movie list.
+    Steps:
+    1. Filter the movies of a genre, sorted by descending id, projecting two fields.
+    2. Check only the requested fields are returned, in order.
+    3. Check filtering on a non-indexed field and unknown fields are rejected.
+    Args:
+        client (TestClient): The test client used to simulate API requests.
+    """
+
+    response = client.get(
+        "/movies",
+        params={"genre_id": 1, "id__gte": 1, "sort": "-id", "fields": "id,title"},
+    )
+    data = response.json()
+    assert response.status_code == 200
+    assert data and all(set(movie) == {"id", "title"} for movie in data)
+    ids = [movie["id"] for movie in data]
+    assert ids == sorted(ids, reverse=True)
+
+    response = client.get("/movies", params={"id__in": f"{ids[0]},{ids[-1]}"})
+    assert {movie["id"] for movie in response.json()} == {ids[0], ids[-1]}
+
+    assert client.get("/movies", params={"year": 1999}).status_code == 400
+    assert client.get("/movies", params={"fields": "secret"}).status_code == 400
+    assert client.get("/movies", params={"genre_id": "x"}).status_code == 400
+
+
+def test_list_movies_page_without_filters(client: TestClient):
+    """
+    Test that an offset or a limit alone still pages the movie list, instead of
+    returning every movie.
+    Args:
+        client (TestClient): The test client used to simulate API requests.
+    """
+
+    ids = [movie["id"] for movie in client.get("/movies").json()]
+    assert len(ids) > 3
+
+    response = client.get("/movies", params={"offset": 3})
+    assert response.status_code == 200
+    assert [movie["id"] for movie in response.json()] == ids[3:]
+    assert client.get("/movies", params={"limit": 0}).json() == []
+
+
+def test_list_movies_by_ids(client: TestClient):
+    """
+    Test the batch lookup of movies: the requested order is kept, missing ids
+    are skipped and the copies are included.
+    Args:
+        client (TestClient): The test client used to simulate API requests.
+    """
+
+    response = client.get("/movies", params={"ids": "3,1,999999,2,1"})
+    data = response.json()
+    assert response.status_code == 200
+    assert [movie["id"] for movie in data] == [3, 1, 2]
+    assert all("copies" in movie for movie in data)
+
+    response = client.get("/clients/", params={"ids": "2,1"})
+    assert [item["id"] for item in response.json()] == [2, 1]
+
+    assert client.get("/movies", params={"ids": "1,a"}).status_code == 400
@@ -1,39 +1,110 @@
-from typing import Optional
+import json
+from typing import Annotated, Optional
 
-from fastapi import APIRouter, HTTPException
+from fastapi import APIRouter, Depends, Header, HTTPException, Query, Response
+from fastapi.concurrency import run_in_threadpool
+from fastapi.encoders import jsonable_encoder
+from pydantic import TypeAdapter
 from sqlalchemy.orm.exc import UnmappedInstanceError
-
-from base.db_connection import SessionDep
-from movies.models import Movie, Genre, MovieCreate, MovieUpdate, MoviePublic
+from sqlmodel import Session, col, select
+
+from base.db_connection import ReadSessionDep, SessionDep, batch_session
+from base import settings
+from base.idempotency import idempotency_store
+from base.repository import (
+    FieldFilter,
+    InvalidQuery,
+    QuerySpec,
+    parse_ids,
+    query_response,
+    query_spec,
+)
+from base.single_flight import SingleFlightTimeout, get_single_flight
+from base.write_pipeline import run_write
+from movies.models import (
+    AlsoRentedMovie,
+    Movie,
+    Genre,
+    MovieCreate,
+    MovieUpdate,
+    MoviePublic,
+    MovieCopyScan,
+    MovieDetailPublic,
+    MovieSuggestion,
+)
 from movies.repositories import GenreRepository, MovieRepository
+from recommendations.engine import co_rentals
+from search.index import movie_search
 
 router = APIRouter()
 
+GenreQueryDep = Annotated[QuerySpec, Depends(query_spec())]
+MovieQueryDep = Annotated[QuerySpec, Depends(query_spec("title", "ids"))]
+
+movie_reads = get_single_flight("movies")
+movie_adapter: TypeAdapter[MovieDetailPublic] = TypeAdapter(MovieDetailPublic)
+movie_list_adapter: TypeAdapter[list[MoviePublic]] = TypeAdapter(list[MoviePublic])
+
+
+async def _coalesced_read(session: Session, key, fetch) -> Response:
+    """
+    Run a movie read through the single-flight group, so identical concurrent
+    reads share one query and one serialized JSON body. `fetch` receives its own
+    session on the bind of the request session, except within a batch, where it
+    reads through the shared session to see the writes of the previous calls.
+    Either way `fetch` runs in the threadpool, off the event loop.
+    Raises:
+        HTTPException: 404 if `fetch` returns None, 504 on timeout.
+    """
+
+    if batch_session.get() is not None:
+        content = await run_in_threadpool(fetch, session)
+    else:
+
+        def run():
+            with Session(session.get_bind()) as flight_session:
+                return fetch(flight_session)
+
+        try:
+            content = await movie_reads.do(
+                key, run, settings.SINGLE_FLIGHT_TIMEOUT_SECONDS
+            )
+        except SingleFlightTimeout:
+            raise HTTPException(status_code=504, detail="Movie lookup timed out")
+    if content is None:
+        raise HTTPException(status_code=404, detail="Movie not found")
+    return Response(content, media_type="application/json")
+
 
 @router.get("/genres", tags=["genres"])
-async def list_genres(session: SessionDep):
+def list_genres(session: ReadSessionDep, spec: GenreQueryDep):
     """
     Retrieve a list of all movie genres.
-    This asynchronous function interacts with the GenreRepository to fetch
+    This function interacts with the GenreRepository to fetch
     all available genres from the database.
     Args:
-        session (SessionDep): The database session dependency used to interact
+        session (ReadSessionDep): The read-only database session dependency used to interact
                               with the database.
+        spec (QuerySpec): Filters, sort keys, projection and page parsed from the
+                          query string, e.g. `?name=Drama&fields=id`.
     Returns:
-        List[Genre]: A list of all genres retrieved from the database.
+        List[Genre]: A list of all genres retrieved from the database, or only the
+                     requested fields of the matching genres.
     """
 
     repo = GenreRepository(session)
+    if spec:
+        return query_response(lambda: repo.query(spec))
     return repo.get_all()
 
 
 @router.get("/genres/{id}", tags=["genres"])
-async def retrieve_genre(id: int, session: SessionDep):
+def retrieve_genre(id: int, session: ReadSessionDep):
     """
     Retrieve a genre by its ID.
     Args:
         id (int): The unique identifier of the genre to retrieve.
-        session (SessionDep): The database session dependency.
+        session (ReadSessionDep): The read-only database session dependency.
     Returns:
         Genre: The genre instance corresponding to the given ID.
     Raises:
@@ -63,8 +134,7 @@ async def delete_genre(id: int, session: SessionDep):
     """
 
     try:
-        repo = GenreRepository(session)
-        return repo.delete(id)
+        return await run_write(session, lambda s: GenreRepository(s).delete(id))
     except UnmappedInstanceError:
         raise HTTPException(status_code=404, detail="Genre not found")
 
@@ -82,8 +152,7 @@ async def add_genre(genre: Genre, session: SessionDep):
         Exception: If there is an issue during the database operation.
     """
 
-    repo = GenreRepository(session)
-    return repo.add(genre)
+    return await run_write(session, lambda s: GenreRepository(s).add(genre))
 
 
 @router.post("/genres/{id}", tags=["genres"])
@@ -102,46 +171,130 @@ async def update_genre(id: int, genre: Genre, session: SessionDep):
     """
 
     try:
-        repo = GenreRepository(session)
-        return repo.update(id, genre)
+        return await run_write(session, lambda s: GenreRepository(s).update(id, genre))
     except UnmappedInstanceError:
         raise HTTPException(status_code=404, detail="Genre not found")
 
 
 @router.get("/movies", tags=["movies"], response_model=list[MoviePublic])
-async def list_movies(session: SessionDep, title: Optional[str] = None):
+async def list_movies(
+    session: ReadSessionDep,
+    spec: MovieQueryDep,
+    title: Optional[str] = None,
+    ids: Optional[str] = None,
+):
     """
     Retrieve a list of movies, optionally filtered by title.
     Args:
-        session (SessionDep): The database session dependency used to interact with the database.
+        session (ReadSessionDep): The read-only database session dependency used to interact with the database.
+        spec (QuerySpec): Filters, sort keys, projection and page parsed from the
+                          query string, e.g. `?genre_id=3&sort=-id&fields=id,title`.
         title (Optional[str]): An optional string to filter movies by title. If None, all movies are retrieved.
+        ids (Optional[str]): Comma separated ids: only return these movies, in this
+                             order, with one query. Missing ids are skipped.
     Returns:
         List[Movie]: A list of movies matching the filter criteria, or all movies if no filter is provided.
+                     With a query spec, only the requested fields of the movies, without their copies.
+    Raises:
+        HTTPException: 400 if the query spec uses an unknown or non-indexed field,
+                       or the ids are invalid.
+    Concurrent identical requests share one query and one serialized response.
     """
 
-    repo = MovieRepository(session)
-    return repo.get_all(title=title)
+    movie_ids = parse_ids(ids) if ids is not None else None
+    if movie_ids is not None and spec:
+        spec.filters.append(FieldFilter("id", "in", movie_ids))
+    if spec:
+
+        def fetch_query(flight_session: Session):
+            rows = MovieRepository(flight_session).query(spec, title)
+            return json.dumps(jsonable_encoder(rows)).encode()
+
+        try:
+            return await _coalesced_read(
+                session, ("query", title, repr(spec)), fetch_query
+            )
+        except InvalidQuery as exc:
+            raise HTTPException(status_code=400, detail=str(exc))
+
+    def fetch(flight_session: Session):
+        repository = MovieRepository(flight_session)
+        if movie_ids is not None:
+            movies = repository.get_many(movie_ids)
+        else:
+            movies = repository.get_all(title=title)
+        return movie_list_adapter.dump_json(
+            movie_list_adapter.validate_python(movies, from_attributes=True)
+        )
+
+    if movie_ids is not None:
+        return await _coalesced_read(session, ("ids", tuple(movie_ids)), fetch)
+    return await _coalesced_read(session, ("list", title), fetch)
+
+
+@router.get("/movies/suggest", tags=["movies"], response_model=list[MovieSuggestion])
+def suggest_movies(
+    session: ReadSessionDep,
+    q: Annotated[str, Query(min_length=1, max_length=200)],
+    limit: Annotated[int, Query(ge=1, le=50)] = 10,
+):
+    """
+    Suggest movies whose title or director match a partial or misspelled text.
+    Matches come from the in-memory trigram index (see search/index.py), built
+    at startup and updated on every committed movie write, so no table scan is
+    involved.
+    Args:
+        session (ReadSessionDep): The read-only database session, only used to
+                                  build the index if it is not ready yet.
+        q (str): The text typed by the user, e.g. `godfahter` or `copola`.
+        limit (int): The maximum number of suggestions.
+    Returns:
+        list[MovieSuggestion]: The best matching movies first, with the field
+                               that matched and its score between 0 and 1.
+    """
+
+    movie_search.ensure_ready(session)
+    return movie_search.search(q, limit)
 
 
-@router.get("/movies/{id}", tags=["movies"], response_model=MoviePublic)
-async def retrieve_movie(id: int, session: SessionDep):
+@router.get("/movies/{id}", tags=["movies"], response_model=MovieDetailPublic)
+async def retrieve_movie(id: int, session: ReadSessionDep):
     """
     Retrieve a movie by its ID.
     Args:
         id (int): The unique identifier of the movie to retrieve.
-        session (SessionDep): The database session dependency.
+        session (ReadSessionDep): The read-only database session dependency.
     Returns:
-        Movie: The movie instance if found.
+        MovieDetailPublic: The movie instance if found, with the movies most often
+                           rented by the clients who rented it (`also_rented`).
     Raises:
         HTTPException: If the movie with the given ID is not found,
                        raises a 404 HTTP exception with the message "Movie not found".
+    Concurrent requests for the same movie share one query and one serialized response.
     """
 
-    repo = MovieRepository(session)
-    instance = repo.get(id)
-    if not instance:
-        raise HTTPException(status_code=404, detail="Movie not found")
-    return instance
+    def fetch(flight_session: Session):
+        instance = MovieRepository(flight_session).get(id)
+        if not instance:
+            return None
+        movie = movie_adapter.validate_python(instance, from_attributes=True)
+        also_rented = co_rentals.also_rented(id)
+        if also_rented:
+            titles = dict(
+                flight_session.exec(
+                    select(Movie.id, Movie.title).where(
+                        col(Movie.id).in_([movie_id for movie_id, _ in also_rented])
+                    )
+                ).all()
+            )
+            movie.also_rented = [
+                AlsoRentedMovie(id=movie_id, title=titles[movie_id], clients=clients)
+                for movie_id, clients in also_rented
+                if movie_id in titles
+            ]
+        return movie_adapter.dump_json(movie)
+
+    return await _coalesced_read(session, ("retrieve", id), fetch)
 
 
 @router.delete("/movies/{id}", tags=["movies"])
@@ -158,8 +311,7 @@ async def delete_movie(id: int, session: SessionDep):
     """
 
     try:
-        repo = MovieRepository(session)
-        return repo.delete(id)
+        return await run_write(session, lambda s: MovieRepository(s).delete(id))
     except UnmappedInstanceError:
         raise HTTPException(status_code=404, detail="Movie not found")
 
@@ -177,22 +329,28 @@ async def add_movie(movie: Movie, session: SessionDep):
         Exception: If there is an error during the database operation.
     """
 
-    repo = MovieRepository(session)
-    return repo.add(movie)
+    return await run_write(session, lambda s: MovieRepository(s).add(movie))
 
 
 @router.post("/movies/with_stock", tags=["movies"], response_model=MoviePublic)
-async def add_movie_with_stock(movie: MovieCreate, session: SessionDep):
+async def add_movie_with_stock(
+    movie: MovieCreate,
+    session: SessionDep,
+    idempotency_key: Annotated[Optional[str], Header()] = None,
+):
     """
     Adds a new movie along with its stock information.
     This asynchronous function allows the creation of a new movie entry in the database
     and associates it with stock details. It utilizes the `MovieRepository` to handle
-    the database operations.
+    the database operations. Retries sent with the same Idempotency-Key header get
+    the stored response of the first request instead of adding the stock again.
     Args:
         movie (MovieCreate): The movie data to be added, including title, description,
             release year, and other relevant details.
         session (SessionDep): The database session dependency used to interact with
             the database.
+        idempotency_key (Optional[str]): The Idempotency-Key header, a unique value
+            chosen by the client for each movie.
     Returns:
         dict: A dictionary containing the details of the newly created movie along
             with its stock information.
@@ -233,8 +391,14 @@ async def add_movie_with_stock(movie: MovieCreate, session: SessionDep):
                 description: Internal server error.
     """
 
-    repo = MovieRepository(session)
-    return repo.add_with_stock(movie)
+    return await idempotency_store.run(
+        session,
+        idempotency_key,
+        "POST /movies/with_stock",
+        movie,
+        lambda s: MovieRepository(s).add_with_stock(movie),
+        MoviePublic,
+    )
 
 
 @router.put("/movies/{id}", tags=["movies"])
@@ -253,8 +417,7 @@ async def update_movie(id: int, movie: Movie, session: SessionDep):
     """
 
     try:
-        repo = MovieRepository(session)
-        return repo.update(id, movie)
+        return await run_write(session, lambda s: MovieRepository(s).update(id, movie))
     except UnmappedInstanceError:
         raise HTTPException(status_code=404, detail="Movie not found")
 
@@ -300,7 +463,29 @@ async def update_movie_with_stock(id: int, movie: MovieUpdate, session: SessionD
     """
 
     try:
-        repo = MovieRepository(session)
-        return repo.update_with_stock(id, movie)
+        return await run_write(
+            session,
+            lambda s: MovieRepository(s).update_with_stock(id, movie),
+            MoviePublic,
+        )
     except UnmappedInstanceError:
         raise HTTPException(status_code=404, detail="Movie not found")
+
+
+@router.get("/copies/by_code/{code}", tags=["movies"], response_model=MovieCopyScan)
+def retrieve_copy_by_code(code: str, session: ReadSessionDep):
+    """
+    Retrieve a copy by its scanned barcode, with one indexed lookup.
+    Args:
+        code (str): The code printed on the copy.
+        session (ReadSessionDep): The read-only database session dependency.
+    Returns:
+        MovieCopyScan: The copy with its movie and whether it can be rented.
+    Raises:
+        HTTPException: 404 if no copy has this code.
+    """
+
+    movie_copy = MovieRepository(session).get_copy_by_code(code)
+    if movie_copy is None:
+        raise HTTPException(status_code=404, detail="Copy not found")
+    return movie_copy
@@ -0,0 +1,339 @@
+import logging
+import threading
+from types import SimpleNamespace
+from typing import Iterable, Optional
+
+import numpy as np
+from sqlalchemy import Engine, event, union
+from sqlmodel import Session, col, select
+
+from base import settings
+from base.pending import add_pending, discard_pending, pop_pending
+from movie_rents.models import (
+    MovieRent,
+    MovieRentArchive,
+    MovieRentDetail,
+    MovieRentDetailArchive,
+)
+from movies.models import Movie, MovieCopy
+
+logger = logging.getLogger(__name__)
+
+# session.info key of the co-rentals recorded by the rent operations, applied to
+# the index once their transaction is committed
+PENDING_CO_RENTALS = "pending_co_rentals"
+
+
+class CoRentalIndex:
+    """
+    In-memory "clients who rented this also rented" index.
+    The score of a pair of movies is the number of distinct clients who rented
+    both. `rebuild` loads the distinct (client, movie) pairs of the rents, builds
+    the client x movie matrix X with SciPy and the co-occurrence matrix X^T X, and
+    keeps for every movie its `top_k` neighbours in two dense arrays, so a lookup
+    is a binary search and a row slice.
+    `record` applies a new rent incrementally: the scores of the new pairs are
+    kept in a small delta on top of the co-occurrence matrix and only the rows of
+    the movies involved are updated. Scores only grow between rebuilds, so the
+    new top-k of a row is always found among its previous top-k and the updated
+    neighbours. Deleted and edited rents are only reflected by the next rebuild.
+    """
+
+    def __init__(self, top_k: int = 10):
+        self.top_k = top_k
+        self.ready = False
+        self.builds = 0
+        self.failed_builds = 0
+        self.last_error: Optional[str] = None
+        self._lock = threading.Lock()
+        self._replay: Optional[list] = None
+        self._reset(*self._empty())
+
+    def _empty(self):
+        movie_ids = np.zeros(0, dtype=np.int64)
+        client_ids = np.zeros(0, dtype=np.int64)
+        return movie_ids, client_ids, _empty_csr(), _empty_csr()
+
+    def _reset(self, movie_ids, client_ids, rents, co_rentals):
+        self._movie_ids = movie_ids
+        self._client_ids = client_ids
+        self._rents = rents
+        self._co_rentals = co_rentals
+        self._top_movies, self._top_scores = _top_k(co_rentals, movie_ids, self.top_k)
+        # movies and clients added since the rebuild, and the new pair scores
+        self._extra_top: dict[int, list[tuple[int, int]]] = {}
+        self._client_delta: dict[int, set[int]] = {}
+        self._score_delta: dict[tuple[int, int], int] = {}
+
+    def rebuild(self, session: Session):
+        """
+        Rebuild the index from the rents, then replay the rents recorded while
+        it was being built. A failed rebuild keeps the current index and is
+        counted in the stats.
+        Args:
+            session (Session): The session used to read the rents.
+        """
+
+        with self._lock:
+            self._replay = []
+        try:
+            arrays = self._build(session)
+        except BaseException as exc:
+            with self._lock:
+                self._replay = None
+                self.failed_builds += 1
+                self.last_error = repr(exc)
+            raise
+        with self._lock:
+            replay, self._replay = self._replay, None
+            self._reset(*arrays)
+            for client_id, movie_ids in replay:
+                self._record(client_id, movie_ids)
+            self.ready = True
+            self.builds += 1
+            self.last_error = None
+
+    def _build(self, session: Session):
+        # SciPy takes a while to import, only pay for it when building
+        from scipy import sparse
+
+        movie_ids = np.fromiter(
+            session.exec(select(Movie.id).order_by(col(Movie.id))), dtype=np.int64
+        )
+        # archived rents are part of the history too
+        rented = union(
+            *(
+                select(rent_model.client_id, MovieCopy.movie_id)
+                .join(detail_model, col(detail_model.movie_rent_id) == rent_model.id)
+                .join(MovieCopy, col(MovieCopy.id) == detail_model.movie_copy_id)
+                for rent_model, detail_model in (
+                    (MovieRent, MovieRentDetail),
+                    (MovieRentArchive, MovieRentDetailArchive),
+                )
+            )
+        )
+        rows = session.exec(rented).all()  # type: ignore[call-overload]
+        pairs = np.array(rows, dtype=np.int64).reshape(-1, 2)
+        client_ids, client_rows = np.unique(pairs[:, 0], return_inverse=True)
+        movie_columns = np.searchsorted(movie_ids, pairs[:, 1])
+        rents = sparse.csr_matrix(
+            (np.ones(len(pairs), dtype=np.int32), (client_rows, movie_columns)),
+            shape=(len(client_ids), len(movie_ids)),
+        )
+        co_rentals = (rents.T @ rents).tocsr()
+        co_rentals.setdiag(0)
+        co_rentals.eliminate_zeros()
+        co_rentals.sort_indices()
+        return movie_ids, client_ids, rents, co_rentals
+
+    def record(self, client_id: int, movie_ids: Iterable[int]):
+        """
+        Add the movies rented by a client to the index.
+        Recording movies the client had already rented changes nothing.
+        Args:
+            client_id (int): The client of the rent.
+            movie_ids (Iterable[int]): The movies of the rented copies.
+        """
+
+        movie_ids = set(movie_ids)
+        with self._lock:
+            if self._replay is not None:
+                self._replay.append((client_id, movie_ids))
+            self._record(client_id, movie_ids)
+
+    def _record(self, client_id: int, movie_ids: set[int]):
+        rented = self._client_movies(client_id)
+        for movie_id in sorted(movie_ids - rented):
+            for other_id in rented:
+                self._bump(movie_id, other_id)
+                self._bump(other_id, movie_id)
+            rented.add(movie_id)
+            self._client_delta.setdefault(client_id, set()).add(movie_id)
+
+    def _client_movies(self, client_id: int) -> set[int]:
+        movies = set(self._client_delta.get(client_id, ()))
+        row = _position(self._client_ids, client_id)
+        if row is not None:
+            start, end = self._rents.indptr[row], self._rents.indptr[row + 1]
+            movies.update(self._movie_ids[self._rents.indices[start:end]].tolist())
+        return movies
+
+    def _score(self, movie_id: int, other_id: int) -> int:
+        score = self._score_delta.get((movie_id, other_id), 0)
+        row = _position(self._movie_ids, movie_id)
+        column = _position(self._movie_ids, other_id)
+        if row is not None and column is not None:
+            start, end = self._co_rentals.indptr[row], self._co_rentals.indptr[row + 1]
+            indices = self._co_rentals.indices[start:end]
+            position = np.searchsorted(indices, column)
+            if position < len(indices) and indices[position] == column:
+                score += int(self._co_rentals.data[start + position])
+        return score
+
+    def _bump(self, movie_id: int, other_id: int):
+        key = (movie_id, other_id)
+        self._score_delta[key] = self._score_delta.get(key, 0) + 1
+        neighbours = dict(self._neighbours(movie_id))
+        neighbours[other_id] = self._score(movie_id, other_id)
+        top = sorted(neighbours.items(), key=lambda item: (-item[1], item[0]))
+        top = top[: self.top_k]
+
+        row = _position(self._movie_ids, movie_id)
+        if row is None:
+            self._extra_top[movie_id] = top
+            return
+        self._top_movies[row] = -1
+        self._top_scores[row] = 0
+        for slot, (neighbour_id, score) in enumerate(top):
+            self._top_movies[row, slot] = neighbour_id
+            self._top_scores[row, slot] = score
+
+    def _neighbours(self, movie_id: int) -> list[tuple[int, int]]:
+        row = _position(self._movie_ids, movie_id)
+        if row is None:
+            return list(self._extra_top.get(movie_id, ()))
+        movies, scores = self._top_movies[row], self._top_scores[row]
+        found = movies >= 0
+        return list(zip(movies[found].tolist(), scores[found].tolist()))
+
+    def also_rented(self, movie_id: int, limit: Optional[int] = None) -> list:
+        """
+        Retrieve the movies most often rented by the clients who rented a movie.
+        Args:
+            movie_id (int): The movie to look up.
+            limit (Optional[int]): At most this many movies, `top_k` by default.
+        Returns:
+            list[tuple[int, int]]: (movie id, number of clients) pairs, the
+                                   most co-rented first.
+        """
+
+        with self._lock:
+            return self._neighbours(movie_id)[: limit or self.top_k]
+
+    def stats(self) -> dict:
+        with self._lock:
+            return {
+                "ready": self.ready,
+                "builds": self.builds,
+                "failed_builds": self.failed_builds,
+                "last_error": self.last_error,
+                "movies": len(self._movie_ids),
+                "clients": len(self._client_ids),
+                "pairs": int(self._co_rentals.nnz),
+                "pending_pairs": len(self._score_delta),
+                "memory_bytes": int(
+                    self._co_rentals.data.nbytes
+                    + self._co_rentals.indices.nbytes
+                    + self._co_rentals.indptr.nbytes
+                    + self._rents.indices.nbytes
+                    + self._rents.indptr.nbytes
+                    + self._top_movies.nbytes
+                    + self._top_scores.nbytes
+                ),
+            }
+
+
+def _empty_csr() -> SimpleNamespace:
+    # the arrays of an empty CSR matrix, without importing SciPy
+    return SimpleNamespace(
+        indptr=np.zeros(1, dtype=np.int32),
+        indices=np.zeros(0, dtype=np.int32),
+        data=np.zeros(0, dtype=np.int32),
+        nnz=0,
+    )
+
+
+def _position(ids: np.ndarray, id: int) -> Optional[int]:
+    position = int(np.searchsorted(ids, id))
+    if position < len(ids) and ids[position] == id:
+        return position
+    return None
+
+
+def _top_k(co_rentals, movie_ids: np.ndarray, k: int):
+    # sort the entries of every row by score, then keep the first k of each row
+    top_movies = np.full((len(movie_ids), k), -1, dtype=np.int64)
+    top_scores = np.zeros((len(movie_ids), k), dtype=np.int32)
+    rows = np.repeat(np.arange(len(movie_ids)), np.diff(co_rentals.indptr))
+    order = np.lexsort((co_rentals.indices, -co_rentals.data, rows))
+    rank = np.arange(len(order)) - co_rentals.indptr[rows]
+    keep = rank < k
+    top_movies[rows[keep], rank[keep]] = movie_ids[co_rentals.indices[order[keep]]]
+    top_scores[rows[keep], rank[keep]] = co_rentals.data[order[keep]]
+    return top_movies, top_scores
+
+
+co_rentals = CoRentalIndex(settings.RECOMMENDATIONS_TOP_K)
+
+
+def queue_co_rentals(session: Session, client_id: int, movie_ids: Iterable[int]):
+    """
+    Record the movies of a rent in the index once the transaction of the session
+    is committed, so rolled back rents never reach it.
+    """
+
+    add_pending(session, PENDING_CO_RENTALS, [(client_id, set(movie_ids))])
+
+
+@event.listens_for(Session, "after_commit")
+def _apply_co_rentals(session):
+    # savepoint releases are skipped, see base/pending.py
+    for client_id, movie_ids in pop_pending(session, PENDING_CO_RENTALS):
+        co_rentals.record(client_id, movie_ids)
+
+
+@event.listens_for(Session, "after_rollback")
+def _discard_co_rentals(session):
+    discard_pending(session, PENDING_CO_RENTALS)
+
+
+class CoRentalRebuilder:
+    """
+    Background thread that builds the index at startup and then rebuilds it
+    every `interval` seconds, folding the incremental updates and the deleted
+    rents in. A failed rebuild is logged and retried at the next interval.
+    """
+
+    def __init__(self, index: CoRentalIndex, engine: Engine, interval: float):
+        self.index = index
+        self.engine = engine
+        self.interval = interval
+        self._stop = threading.Event()
+        self._thread: Optional[threading.Thread] = None
+
+    def start(self):
+        self._thread = threading.Thread(
+            target=self._run, name="co-rental-rebuilder", daemon=True
+        )
+        self._thread.start()
+
+    def stop(self):
+        if self._thread is not None:
+            self._stop.set()
+            self._thread.join()
+            self._thread = None
+
+    def _run(self):
+        while not self._stop.is_set():
+            try:
+                with Session(self.engine) as session:
+                    self.index.rebuild(session)
+            except Exception:
+                logger.exception("Rebuilding the co-rental index failed")
+            self._stop.wait(self.interval)
+
+
+co_rental_rebuilder: Optional[CoRentalRebuilder] = None
+
+
+def start_co_rental_rebuilder(engine: Engine, interval: float):
+    global co_rental_rebuilder
+    co_rental_rebuilder = CoRentalRebuilder(co_rentals, engine, interval)
+    co_rental_rebuilder.start()
+
+
+def stop_co_rental_rebuilder():
+    global co_rental_rebuilder
+    if co_rental_rebuilder is not None:
+        co_rental_rebuilder.stop()
+        co_rental_rebuilder = None
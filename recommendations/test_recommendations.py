@@ -0,0 +1,141 @@
+import sqlite3
+import time
+from types import SimpleNamespace
+
+from fastapi.testclient import TestClient
+from sqlalchemy.exc import OperationalError
+from sqlmodel import Session, SQLModel, create_engine
+
+from base.write_pipeline import GroupCommitWriter, create_writer_engine
+from recommendations import engine as recommendations
+from recommendations.engine import (
+    CoRentalIndex,
+    CoRentalRebuilder,
+    co_rentals,
+    queue_co_rentals,
+)
+
+
+def test_co_rental_index_incremental_matches_rebuild(session: Session):
+    """
+    Test that recording rents incrementally gives the same neighbours as
+    rebuilding the index from the rents.
+    Args:
+        session (Session): The database session with the initial data.
+    """
+
+    index = CoRentalIndex(top_k=5)
+    index.rebuild(session)
+    index.record(1, {1, 2, 3})
+    index.record(2, {2, 3})
+    index.record(1, {3})
+
+    rebuilt = CoRentalIndex(top_k=5)
+    rebuilt.rebuild(session)
+    rebuilt.record(1, {1, 2, 3})
+    rebuilt.record(2, {2, 3})
+    for movie_id in (1, 2, 3):
+        assert index.also_rented(movie_id) == rebuilt.also_rented(movie_id)
+    assert all(movie_id != 2 for movie_id, _ in index.also_rented(2))
+
+
+def test_retrieve_movie_also_rented(client: TestClient, session: Session):
+    """
+    Test that a rent with copies of two movies makes each of them appear in the
+    `also_rented` movies of the other.
+    Args:
+        client (TestClient): The test client used to simulate API requests.
+        session (Session): The database session shared with the client.
+    """
+
+    co_rentals.rebuild(session)
+    movies = [movie for movie in client.get("/movies").json() if movie["copies"]]
+    copies = {movie["id"]: movie["copies"][-1]["id"] for movie in movies[:2]}
+    first, second = copies
+
+    response = client.post(
+        "/movie_rents",
+        json={
+            "client_id": 1,
+            "details": [{"movie_copy_id": copy_id} for copy_id in copies.values()],
+        },
+    )
+    assert response.status_code == 200
+
+    response = client.get(f"/movies/{first}")
+    assert response.status_code == 200
+    also_rented = {movie["id"]: movie for movie in response.json()["also_rented"]}
+    assert second in also_rented or len(also_rented) == co_rentals.top_k
+    assert first not in also_rented
+
+
+def test_co_rentals_wait_for_the_group_commit(tmp_path, monkeypatch):
+    """
+    Test that, through the group commit writer, co-rentals are recorded once the
+    whole group is committed, that a failing operation only discards its own,
+    and that a group run again after a lock error records them once.
+    """
+
+    recorded = []
+    monkeypatch.setattr(
+        recommendations,
+        "co_rentals",
+        SimpleNamespace(record=lambda client_id, movie_ids: recorded.append(client_id)),
+    )
+    engine = create_writer_engine(f"sqlite:///{tmp_path}/database.db")
+    SQLModel.metadata.create_all(engine)
+    writer = GroupCommitWriter(engine, window=0.2)
+    writer.start()
+    attempts = []
+
+    def fail(session):
+        queue_co_rentals(session, 2, [3])
+        raise ValueError("failed")
+
+    def lock_once(session):
+        queue_co_rentals(session, 3, [4])
+        attempts.append(list(recorded))
+        if len(attempts) == 1:
+            raise OperationalError(
+                "INSERT", {}, sqlite3.OperationalError("database is locked")
+            )
+
+    futures = [
+        writer.submit(lambda session: queue_co_rentals(session, 1, [1, 2])),
+        writer.submit(fail),
+        writer.submit(lock_once),
+    ]
+    for future in futures:
+        future.exception(timeout=5)
+    writer.stop()
+    engine.dispose()
+
+    assert attempts == [[], []]
+    assert recorded == [1, 3]
+
+
+def test_rebuilder_survives_failed_rebuilds(tmp_path):
+    """
+    Test that a failed rebuild, here on a database without its tables yet, is
+    reported in the stats and does not stop the rebuilder, which builds the
+    index once the tables exist.
+    """
+
+    engine = create_engine(f"sqlite:///{tmp_path}/database.db")
+    index = CoRentalIndex()
+    rebuilder = CoRentalRebuilder(index, engine, interval=0.01)
+    rebuilder.start()
+    try:
+        deadline = time.monotonic() + 5
+        while not index.failed_builds and time.monotonic() < deadline:
+            time.sleep(0.01)
+        assert "no such table" in index.stats()["last_error"]
+
+        SQLModel.metadata.create_all(engine)
+        while not index.ready and time.monotonic() < deadline:
+            time.sleep(0.01)
+        assert index.ready
+        assert index.stats()["last_error"] is None
+    finally:
+        rebuilder.stop()
+        engine.dispose()
@@ -0,0 +1,441 @@
+import json
+import logging
+import re
+import threading
+import unicodedata
+from typing import Iterable, Optional, cast
+
+import numpy as np
+from sqlalchemy import Engine, event, func
+from sqlmodel import Session, col, select
+
+from base import settings
+from base.pending import add_pending, discard_pending, pop_pending
+from changes.models import ChangeLog
+from movies.models import Movie
+
+logger = logging.getLogger(__name__)
+
+# session.info key of the movie titles and directors written in the session,
+# applied to the index once their transaction is committed
+PENDING_MOVIE_TEXTS = "pending_movie_texts"
+
+# the indexed fields of a movie, in the order of their documents
+FIELDS = ("title", "director")
+
+_NON_WORD = re.compile(r"[^0-9a-z]+")
+
+
+def normalize(text: str) -> list[str]:
+    """
+    Split a text in lowercase ASCII words, dropping accents and punctuation.
+    """
+
+    text = unicodedata.normalize("NFKD", text or "")
+    text = text.encode("ascii", "ignore").decode().lower()
+    return _NON_WORD.sub(" ", text).split()
+
+
+def trigrams(text: str) -> set[str]:
+    """
+    Retrieve the trigrams of a text, like PostgreSQL's pg_trgm: every word is
+    padded with two spaces in front and one behind, so short words and word
+    starts get trigrams of their own.
+    """
+
+    grams: set[str] = set()
+    for word in normalize(text):
+        padded = f"  {word} "
+        grams.update(padded[i : i + 3] for i in range(len(padded) - 2))
+    return grams
+
+
+class TrigramIndex:
+    """
+    In-memory trigram index over the title and director of the movies.
+    Every field of a movie is a document. `rebuild` packs the posting lists
+    (the documents holding each trigram) into one int32 array, with the slice
+    of every trigram in a dict, and keeps the movie, field and trigram count of
+    every document in parallel arrays. A search concatenates the posting lists
+    of the trigrams of the query and counts the documents with NumPy, so it
+    never looks at documents sharing no trigram with the query.
+    Writes are applied incrementally: the documents of an edited or deleted
+    movie are marked dead, new documents go to small Python postings on top of
+    the arrays, and the arrays are repacked from the live documents once the
+    appended documents reach `compact_ratio` of them.
+    Commits of the process are applied as they happen; `refresh` applies the
+    movies written by the other workers from the change feed.
+    """
+
+    def __init__(self, min_score: float = 0.3, compact_ratio: float = 0.1):
+        self.min_score = min_score
+        self.compact_ratio = compact_ratio
+        self.ready = False
+        self.builds = 0
+        self.failed_refreshes = 0
+        self.last_error: Optional[str] = None
+        self._lock = threading.Lock()
+        self._build_lock = threading.Lock()
+        self._replay: Optional[list] = None
+        # the last change of the change feed folded into the index
+        self.seq = 0
+        self._pack({})
+
+    def _pack(self, movies: dict[int, tuple[str, str]]):
+        # movies: id -> (title, director); documents are numbered in id order
+        postings: dict[str, list[int]] = {}
+        doc_movies: list[int] = []
+        doc_fields: list[int] = []
+        doc_sizes: list[int] = []
+        for movie_id in sorted(movies):
+            for field, text in enumerate(movies[movie_id]):
+                doc = len(doc_movies)
+                grams = trigrams(text)
+                for gram in grams:
+                    postings.setdefault(gram, []).append(doc)
+                doc_movies.append(movie_id)
+                doc_fields.append(field)
+                doc_sizes.append(len(grams))
+
+        offsets, start = {}, 0
+        for gram, docs in postings.items():
+            offsets[gram] = (start, start + len(docs))
+            start += len(docs)
+        self._postings = np.fromiter(
+            (doc for docs in postings.values() for doc in docs),
+            dtype=np.int32,
+            count=start,
+        )
+        self._offsets = offsets
+        self._doc_movies = np.array(doc_movies, dtype=np.int64)
+        self._doc_fields = np.array(doc_fields, dtype=np.int8)
+        self._doc_sizes = np.array(doc_sizes, dtype=np.int32)
+        self._live = np.ones(len(doc_movies), dtype=bool)
+        self._movies = dict(movies)
+        self._movie_docs = {
+            movie_id: [2 * row, 2 * row + 1]
+            for row, movie_id in enumerate(sorted(movies))
+        }
+        # documents appended since the last pack, numbered after the packed ones
+        self._extra_postings: dict[str, list[int]] = {}
+        self._extra_docs: list[tuple[int, int, int]] = []
+
+    def rebuild(self, session: Session):
+        """
+        Rebuild the index from the movies, then replay the writes recorded while
+        it was being built.
+        Args:
+            session (Session): The session used to read the movies.
+        """
+
+        with self._build_lock:
+            self._rebuild(session)
+
+    def ensure_ready(self, session: Session):
+        """
+        Build the index if it was not built yet, e.g. when a search comes in
+        before the startup build finished.
+        """
+
+        if not self.ready:
+            with self._build_lock:
+                if not self.ready:
+                    self._rebuild(session)
+
+    def _rebuild(self, session: Session):
+        with self._lock:
+            self._replay = []
+        try:
+            # read before the movies: changes logged in between are applied
+            # again by the next refresh, which is harmless
+            seq = session.exec(select(func.max(ChangeLog.seq))).one() or 0
+            rows = session.exec(
+                select(Movie.id, Movie.title, Movie.director).order_by(col(Movie.id))
+            )
+            movies = {id: (title, director) for id, title, director in rows}
+        except BaseException:
+            with self._lock:
+                self._replay = None
+            raise
+        with self._lock:
+            replay, self._replay = self._replay, None
+            for movie_id, texts in replay:
+                if texts is None:
+                    movies.pop(movie_id, None)
+                else:
+                    movies[movie_id] = texts
+            self._pack(movies)
+            self.seq = seq
+            self.ready = True
+            self.builds += 1
+
+    def refresh(self, session: Session, batch_size: int = 1000):
+        """
+        Apply the movies logged in the change feed since the last build or
+        refresh, including the ones written by other workers. The index is
+        rebuilt when the changes it misses were pruned from the feed. A failed
+        refresh is counted in the stats and leaves `seq` at the last change
+        applied, so the next refresh takes over from there.
+        Args:
+            session (Session): The session used to read the change feed.
+            batch_size (int): The number of changes read per query.
+        """
+
+        with self._build_lock:
+            if not self.ready:
+                return
+            try:
+                self._refresh(session, batch_size)
+            except Exception as exc:
+                with self._lock:
+                    self.failed_refreshes += 1
+                    self.last_error = repr(exc)
+                raise
+            with self._lock:
+                self.last_error = None
+
+    def _refresh(self, session: Session, batch_size: int):
+        first_seq = session.exec(select(func.min(ChangeLog.seq))).one()
+        if first_seq is not None and first_seq > self.seq + 1:
+            self._rebuild(session)
+            return
+        while True:
+            rows = session.exec(
+                select(ChangeLog.seq, ChangeLog.entity_id, ChangeLog.data)
+                .where(
+                    col(ChangeLog.seq) > self.seq,
+                    ChangeLog.entity == Movie.__tablename__,
+                )
+                .order_by(col(ChangeLog.seq))
+                .limit(batch_size)
+            ).all()
+            if not rows:
+                return
+            changes = []
+            for _, movie_id, data in rows:
+                row = json.loads(data) if data is not None else None
+                changes.append(
+                    (movie_id, (row["title"], row["director"]) if row else None)
+                )
+            self.apply(changes)
+            # logged changes always have a sequence number
+            self.seq = cast(int, rows[-1][0])
+
+    def apply(self, changes: Iterable[tuple[int, Optional[tuple[str, str]]]]):
+        """
+        Apply written movies to the index.
+        Args:
+            changes (Iterable[tuple[int, Optional[tuple[str, str]]]]): (movie id,
+                (title, director)) pairs, with None instead of the texts for
+                deleted movies.
+        """
+
+        with self._lock:
+            for movie_id, texts in changes:
+                if self._replay is not None:
+                    self._replay.append((movie_id, texts))
+                self._apply(movie_id, texts)
+            if len(self._extra_docs) > self.compact_ratio * max(len(self._live), 100):
+                self._pack(self._movies)
+
+    def _apply(self, movie_id: int, texts: Optional[tuple[str, str]]):
+        if texts is not None and self._movies.get(movie_id) == texts:
+            return
+        packed = len(self._live)
+        for doc in self._movie_docs.pop(movie_id, ()):
+            if doc < packed:
+                self._live[doc] = False
+            else:
+                movie, field, size = self._extra_docs[doc - packed]
+                self._extra_docs[doc - packed] = (-1, field, size)
+        if texts is None:
+            self._movies.pop(movie_id, None)
+            return
+
+        self._movies[movie_id] = texts
+        docs = []
+        for field, text in enumerate(texts):
+            doc = packed + len(self._extra_docs)
+            grams = trigrams(text)
+            for gram in grams:
+                self._extra_postings.setdefault(gram, []).append(doc)
+            self._extra_docs.append((movie_id, field, len(grams)))
+            docs.append(doc)
+        self._movie_docs[movie_id] = docs
+
+    def search(self, query: str, limit: int = 10) -> list[dict]:
+        """
+        Retrieve the movies whose title or director best match a query.
+        The score of a field is the share of the query trigrams it contains, so
+        a prefix scores high as the user types, with the similarity of the
+        whole field (shared trigrams over the trigrams of both) breaking ties,
+        which ranks the closest titles first. A movie gets the score of its
+        best field.
+        Args:
+            query (str): The partial or misspelled text typed by the user.
+            limit (int): The maximum number of movies returned.
+        Returns:
+            list[dict]: The movies scoring at least `min_score`, best first, with
+                        their id, title, director, matched field and score.
+        """
+
+        grams = trigrams(query)
+        if not grams:
+            return []
+        with self._lock:
+            packed = len(self._live)
+            parts = [
+                self._postings[slice(*self._offsets[g])]
+                for g in grams
+                if g in self._offsets
+            ]
+            extra = [doc for g in grams for doc in self._extra_postings.get(g, ())]
+            if extra:
+                parts.append(np.array(extra, dtype=np.int32))
+            if not parts:
+                return []
+            docs, hits = np.unique(np.concatenate(parts), return_counts=True)
+
+            doc_movies = np.empty(len(docs), dtype=np.int64)
+            doc_fields = np.empty(len(docs), dtype=np.int8)
+            doc_sizes = np.empty(len(docs), dtype=np.int32)
+            in_packed = docs < packed
+            packed_docs = docs[in_packed]
+            doc_movies[in_packed] = np.where(
+                self._live[packed_docs], self._doc_movies[packed_docs], -1
+            )
+            doc_fields[in_packed] = self._doc_fields[packed_docs]
+            doc_sizes[in_packed] = self._doc_sizes[packed_docs]
+            for position in np.flatnonzero(~in_packed):
+                doc_movies[position], doc_fields[position], doc_sizes[position] = (
+                    self._extra_docs[docs[position] - packed]
+                )
+
+            coverage = hits / len(grams)
+            similarity = hits / (len(grams) + doc_sizes - hits)
+            keep = (doc_movies >= 0) & (coverage >= self.min_score)
+            if not keep.any():
+                return []
+            doc_movies, doc_fields = doc_movies[keep], doc_fields[keep]
+            coverage, similarity = coverage[keep], similarity[keep]
+
+            # best document first, then the first document of every movie
+            order = np.lexsort((doc_movies, -similarity, -coverage))
+            _, first = np.unique(doc_movies[order], return_index=True)
+            best = order[np.sort(first)][:limit]
+            return [
+                {
+                    "id": int(doc_movies[doc]),
+                    "title": self._movies[int(doc_movies[doc])][0],
+                    "director": self._movies[int(doc_movies[doc])][1],
+                    "field": FIELDS[doc_fields[doc]],
+                    "score": round(float(coverage[doc]), 3),
+                }
+                for doc in best
+            ]
+
+    def stats(self) -> dict:
+        with self._lock:
+            return {
+                "ready": self.ready,
+                "builds": self.builds,
+                "seq": self.seq,
+                "failed_refreshes": self.failed_refreshes,
+                "last_error": self.last_error,
+                "movies": len(self._movies),
+                "trigrams": len(self._offsets),
+                "documents": int(self._live.sum())
+                + sum(1 for movie, _, _ in self._extra_docs if movie >= 0),
+                "pending_documents": len(self._extra_docs),
+                "memory_bytes": int(
+                    self._postings.nbytes
+                    + self._doc_movies.nbytes
+                    + self._doc_fields.nbytes
+                    + self._doc_sizes.nbytes
+                    + self._live.nbytes
+                ),
+            }
+
+
+movie_search = TrigramIndex(settings.SEARCH_MIN_SCORE)
+
+
+@event.listens_for(Session, "after_flush")
+def _queue_movie_texts(session, flush_context):
+    pending = []
+    for instance in session.new:
+        if isinstance(instance, Movie):
+            pending.append((instance.id, (instance.title, instance.director)))
+    for instance in session.dirty:
+        if isinstance(instance, Movie) and session.is_modified(instance):
+            pending.append((instance.id, (instance.title, instance.director)))
+    for instance in session.deleted:
+        if isinstance(instance, Movie):
+            pending.append((instance.id, None))
+    if pending:
+        add_pending(session, PENDING_MOVIE_TEXTS, pending)
+
+
+@event.listens_for(Session, "after_commit")
+def _apply_movie_texts(session):
+    # savepoint releases are skipped, see base/pending.py
+    pending = pop_pending(session, PENDING_MOVIE_TEXTS)
+    if pending:
+        movie_search.apply(pending)
+
+
+@event.listens_for(Session, "after_rollback")
+def _discard_movie_texts(session):
+    discard_pending(session, PENDING_MOVIE_TEXTS)
+
+
+class SearchRefresher:
+    """
+    Background thread refreshing the index from the change feed every
+    `interval` seconds, so the suggestions of a worker include the movies
+    written through the other workers. A failed refresh is logged and tried
+    again at the next interval.
+    """
+
+    def __init__(self, index: TrigramIndex, engine: Engine, interval: float):
+        self.index = index
+        self.engine = engine
+        self.interval = interval
+        self._stop = threading.Event()
+        self._thread: Optional[threading.Thread] = None
+
+    def start(self):
+        self._thread = threading.Thread(
+            target=self._run, name="search-refresher", daemon=True
+        )
+        self._thread.start()
+
+    def stop(self):
+        if self._thread is not None:
+            self._stop.set()
+            self._thread.join()
+            self._thread = None
+
+    def _run(self):
+        while not self._stop.wait(self.interval):
+            try:
+                with Session(self.engine) as session:
+                    self.index.refresh(session)
+            except Exception:
+                logger.exception("Refreshing the search index failed")
+
+
+search_refresher: Optional[SearchRefresher] = None
+
+
+def start_search_refresher(engine: Engine, interval: float):
+    global search_refresher
+    search_refresher = SearchRefresher(movie_search, engine, interval)
+    search_refresher.start()
+
+
+def stop_search_refresher():
+    global search_refresher
+    if search_refresher is not None:
+        search_refresher.stop()
+        search_refresher = None
@@ -0,0 +1,196 @@
+import time
+
+from fastapi.testclient import TestClient
+from sqlalchemy import func
+from sqlmodel import Session, SQLModel, col, create_engine, delete, select
+
+from changes.models import ChangeLog
+
+from base.repository import model_table
+from base.write_pipeline import create_writer_engine
+from movies.models import Genre, Movie
+from search import index as search_index
+from search.index import SearchRefresher, TrigramIndex, movie_search
+
+
+def test_trigram_index_incremental_matches_rebuild(session: Session):
+    """
+    Test that writes applied incrementally give the same suggestions as
+    rebuilding the index, including after a repack.
+    Args:
+        session (Session): The database session with the initial data.
+    """
+
+    index = TrigramIndex(compact_ratio=0.01)
+    index.rebuild(session)
+    index.apply([(1000, ("The Godfather", "Francis Ford Coppola"))])
+    index.apply([(1001, ("Apocalypse Now", "Francis Coppola"))])
+    index.apply([(1000, ("The Godfather Part II", "Francis Ford Coppola"))])
+    index.apply([(1001, None)])
+
+    assert index.search("godfahter")[0]["id"] == 1000
+    assert index.search("godfahter")[0]["title"] == "The Godfather Part II"
+    assert all(match["id"] != 1001 for match in index.search("apocalypse"))
+    assert index.search("copola")[0] == {
+        "id": 1000,
+        "title": "The Godfather Part II",
+        "director": "Francis Ford Coppola",
+        "field": "director",
+        "score": index.search("copola")[0]["score"],
+    }
+    assert index.search("!!") == []
+
+
+def test_suggest_movies(client: TestClient, session: Session):
+    """
+    Test that misspelled and partial titles and directors are suggested, and that
+    movies created or edited through the API are found right away.
+    Args:
+        client (TestClient): The test client used to simulate API requests.
+        session (Session): The database session shared with the client.
+    """
+
+    movie_search.rebuild(session)
+    response = client.get("/movies/suggest", params={"q": "slamdunk"})
+    assert response.status_code == 200
+    assert response.json()[0]["title"] == "The Slam Dunk"
+
+    response = client.get("/movies/suggest", params={"q": "kishimto", "limit": 3})
+    assert len(response.json()) == 3
+    assert all(match["field"] == "director" for match in response.json())
+
+    created = client.post(
+        "/movies/with_stock",
+        json={
+            "title": "Spirited Away",
+            "director": "Hayao Miyazaki",
+            "year": 2001,
+            "description": "A girl in the spirit world",
+            "genre_id": 1,
+            "stock": 1,
+        },
+    ).json()
+    matches = client.get("/movies/suggest", params={"q": "spirted awy"}).json()
+    assert matches[0]["id"] == created["id"]
+
+    assert client.get("/movies/suggest").status_code == 422
+    assert client.get("/movies/suggest", params={"q": "zzzzqqq"}).json() == []
+
+
+def test_savepoints_reach_the_index_on_commit(tmp_path, monkeypatch):
+    """
+    Test that movies written in a released SAVEPOINT, as the group commit writer
+    does, are only indexed once the transaction commits, and never when it is
+    rolled back.
+    """
+
+    index = TrigramIndex()
+    monkeypatch.setattr(search_index, "movie_search", index)
+    engine = create_writer_engine(f"sqlite:///{tmp_path}/database.db")
+    SQLModel.metadata.create_all(engine)
+
+    def write_movie(session: Session):
+        session.add(Genre(id=1, name="Animation", description=""))
+        with session.begin_nested():
+            session.add(
+                Movie(
+                    id=1,
+                    title="Spirited Away",
+                    description="",
+                    year=2001,
+                    director="Hayao Miyazaki",
+                    genre_id=1,
+                )
+            )
+        assert index.search("spirited away") == []
+
+    with Session(engine) as session:
+        write_movie(session)
+        session.rollback()
+    assert index.search("spirited away") == []
+
+    with Session(engine) as session:
+        write_movie(session)
+        session.commit()
+    assert index.search("spirited away")[0]["id"] == 1
+    engine.dispose()
+
+
+def test_refresh_from_the_change_feed(session: Session):
+    """
+    Test that an index catches up with the movies written by another worker
+    from the change feed, and is rebuilt when those changes were pruned.
+    Args:
+        session (Session): The database session with the initial data.
+    """
+
+    index = TrigramIndex()
+    index.rebuild(session)
+    movie = Movie(
+        title="Spirited Away",
+        description="",
+        year=2001,
+        director="Hayao Miyazaki",
+        genre_id=1,
+    )
+    session.add(movie)
+    session.commit()
+    assert index.search("spirited away") == []
+
+    index.refresh(session)
+    assert index.search("spirited away")[0]["id"] == movie.id
+
+    movie.title = "Howl's Moving Castle"
+    session.add(movie)
+    session.commit()
+    session.delete(session.get(Movie, 1))
+    session.commit()
+    index.refresh(session, batch_size=1)
+    assert index.search("spirited away") == []
+    assert index.search("howls moving castle")[0]["id"] == movie.id
+    assert all(match["id"] != 1 for match in index.search("slam dunk"))
+
+    # prune_changes keeps the latest change only
+    builds = index.builds
+    for title in ("Ponyo", "Porco Rosso"):
+        session.add(
+            Movie(title=title, description="", year=1992, director="", genre_id=1)
+        )
+        session.commit()
+    latest_seq = session.exec(select(func.max(ChangeLog.seq))).one()
+    session.exec(delete(ChangeLog).where(col(ChangeLog.seq) < latest_seq))  # type: ignore
+    session.commit()
+    index.refresh(session)
+    assert index.builds == builds + 1
+    assert index.seq == latest_seq
+    assert index.search("ponyo")[0]["title"] == "Ponyo"
+
+
+def test_refresher_survives_failed_refreshes(tmp_path):
+    """
+    Test that a failed refresh, here on a database without its change feed, is
+    reported in the stats and does not stop the refresher, which catches up
+    once the change feed is back.
+    """
+
+    engine = create_engine(f"sqlite:///{tmp_path}/database.db")
+    SQLModel.metadata.create_all(engine)
+    index = TrigramIndex()
+    with Session(engine) as session:
+        index.rebuild(session)
+    model_table(ChangeLog).drop(engine)
+    refresher = SearchRefresher(index, engine, interval=0.01)
+    refresher.start()
+    try:
+        deadline = time.monotonic() + 5
+        while not index.failed_refreshes and time.monotonic() < deadline:
+            time.sleep(0.01)
+        assert "no such table" in index.stats()["last_error"]
+
+        SQLModel.metadata.create_all(engine)
+        while index.stats()["last_error"] and time.monotonic() < deadline:
+            time.sleep(0.01)
+        assert index.stats()["last_error"] is None
+    finally:
+        refresher.stop()
+        engine.dispose()
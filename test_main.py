@@ -4,7 +4,7 @@ from sqlmodel import Session, SQLModel, create_engine
 from sqlmodel.pool import StaticPool
 
 from main import app
-from base.db_connection import get_session
+from base.db_connection import get_read_session, get_session
 from loader import load_initial_data
 
 
@@ -25,6 +25,7 @@ def client_fixture(session: Session):
         return session
 
     app.dependency_overrides[get_session] = get_session_override
+    app.dependency_overrides[get_read_session] = get_session_override
     client = TestClient(app)
     yield client
     app.dependency_overrides.clear()